@@ -0,0 +1,252 @@
+import json
+import os
+import shutil
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from repast4py.core import Agent
+from repast4py.space import DiscretePoint as dpt
+
+from MAS_Microbiota import Simulation
+from MAS_Microbiota.Environments import AgentRecords
+from MAS_Microbiota.Environments.Microbiota.Microbiota import Microbiota
+from MAS_Microbiota.Environments.Microbiota.Agents import SubstrateType
+
+
+class Checkpoint:
+    """
+    Checkpoint of the whole model at the end of a tick, from which a run can be restarted with the same results.
+
+    A checkpoint is a directory holding a compressed NumPy archive for each rank and a JSON manifest with the tick,
+    the number of ranks and the parameters of the run, written by the first rank once all the archives are complete,
+    so that only checkpoints with a manifest are complete.
+    The archive of a rank holds the binary records of the local agents of every context, see AgentRecords, together
+    with their order in the context and in their grid cell, which the iterations of the agents depend on, the
+    pending bacteria, the resource stores and concentration fields, the state of the random number generators and
+    the counters and barrier values of the model and of its environments. Ghosts are not saved, as they are
+    received again from the other ranks when the contexts are synchronized after restoring.
+    """
+
+    MANIFEST = 'manifest.json'
+    VERSION = 2
+
+    # Attributes of the model saved as they are
+    MODEL_ATTRIBUTES = ('added_agents_id', 'epithelial_barrier_impermeability', 'pro_cytokine', 'anti_cytokine',
+                        'dead_neuron', 'microbiota_good_bacteria_count', 'microbiota_pathogenic_bacteria_count')
+
+    def __init__(self, directory: str):
+        """
+        :param directory: The directory of a complete checkpoint
+        """
+        self.directory = directory
+        with open(os.path.join(directory, self.MANIFEST)) as f:
+            self.manifest = json.load(f)
+        if self.manifest['version'] != self.VERSION:
+            raise ValueError(f"Unsupported checkpoint version {self.manifest['version']} in {directory}")
+        self.tick = self.manifest['tick']
+
+    @classmethod
+    def find(cls, path: str) -> 'Checkpoint':
+        """
+        Returns the checkpoint in the given directory or, if it holds several checkpoints, the latest complete one.
+        """
+        if os.path.exists(os.path.join(path, cls.MANIFEST)):
+            return cls(path)
+        complete = sorted(name for name in os.listdir(path) if os.path.exists(os.path.join(path, name, cls.MANIFEST)))
+        if not complete:
+            raise FileNotFoundError(f"No complete checkpoint in {path}")
+        return cls(os.path.join(path, complete[-1]))
+
+    def params(self, overrides: str = '') -> Dict:
+        """
+        Returns the parameters of the checkpointed run, updated with the given JSON string of parameters,
+        like a later stop.at.
+        """
+        params = dict(self.manifest['params'])
+        if overrides:
+            params.update(json.loads(overrides))
+        return params
+
+    @classmethod
+    def write(cls, model, root: str, keep: int):
+        """
+        Writes a checkpoint of the given model at its current tick in a new directory of the given root directory,
+        removing the oldest checkpoints beyond the given number. It must be called by all the ranks.
+        """
+        tick = int(model.runner.schedule.tick)
+        directory = os.path.join(root, f'tick_{tick:08d}')
+        if model.rank == 0:
+            os.makedirs(directory, exist_ok=True)
+        model.comm.Barrier()
+
+        arrays = {}
+        for env_name, env in model.envs.items():
+            agents = list(env.context.agents())
+            locations, cells = cls._placements(env.grid, agents)
+            cls._pack(arrays, env_name + '/agents', agents, locations, cells)
+            if env.store is not None:
+                for name, array in env.store.state().items():
+                    arrays[f'{env_name}/store/{name}'] = array
+        microbiota = model.envs[Microbiota.NAME]
+        cls._pack(arrays, Microbiota.NAME + '/pending', microbiota.bacteria_to_add)
+        if microbiota.fields is not None:
+            for agent_type, field in microbiota.fields.items():
+                for name, array in field.state().items():
+                    arrays[f'{Microbiota.NAME}/fields/{agent_type}/{name}'] = array
+        draws = {}
+        for purpose in model.draws.PURPOSES:
+            draws[purpose], arrays[f'draws/{purpose}/floats'], arrays[f'draws/{purpose}/ints'] = \
+                getattr(model.draws, purpose).get_state()
+        state = {
+            'model': {name: getattr(model, name) for name in cls.MODEL_ATTRIBUTES},
+            'substrates_to_add': {subtype.name: count for subtype, count in microbiota.substrates_to_add.items()},
+            'good_bacteria_count': microbiota.good_bacteria_count,
+            'pathogenic_bacteria_count': microbiota.pathogenic_bacteria_count,
+            'bbb_impermeability': model.gutBrainInterface.bbb_impermeability,
+            'rng': model.rng.bit_generator.state,
+            'placement': model.draws.placement.bit_generator.state,
+            'draws': draws
+        }
+        arrays['state'] = np.array(json.dumps(state, default=lambda value: value.item()))
+
+        path = os.path.join(directory, f'rank_{model.rank}.npz')
+        with open(path + '.tmp', 'wb') as f:
+            np.savez_compressed(f, **arrays)
+        os.replace(path + '.tmp', path)
+        model.comm.Barrier()
+
+        if model.rank == 0:
+            # The log file is the one actually written, as the data set does not overwrite existing files
+            params = {key: value for key, value in Simulation.params.items() if key != 'restart'}
+            params['log_file'] = str(model.data_set.fpath)
+            manifest = {'version': cls.VERSION, 'tick': tick, 'world_size': model.world_size,
+                        'files': [f'rank_{rank}.npz' for rank in range(model.world_size)], 'params': params}
+            with open(os.path.join(directory, cls.MANIFEST + '.tmp'), 'w') as f:
+                json.dump(manifest, f, indent=2)
+            os.replace(os.path.join(directory, cls.MANIFEST + '.tmp'), os.path.join(directory, cls.MANIFEST))
+            previous = sorted(name for name in os.listdir(root) if name.startswith('tick_'))
+            for name in previous[:max(len(previous) - keep, 0)]:
+                shutil.rmtree(os.path.join(root, name))
+
+    def restore(self, model):
+        """
+        Restores the state of the checkpoint in the given model, freshly initialized with the parameters of the
+        checkpoint and without agents.
+        """
+        if self.manifest['world_size'] != model.world_size:
+            raise ValueError(f"The checkpoint in {self.directory} was written by {self.manifest['world_size']} "
+                             f"ranks, not {model.world_size}")
+        with np.load(os.path.join(self.directory, f'rank_{model.rank}.npz'), allow_pickle=False) as data:
+            state = json.loads(str(data['state']))
+            for name, value in state['model'].items():
+                setattr(model, name, value)
+
+            for env_name, env in model.envs.items():
+                restored = self._unpack(data, env_name + '/agents')
+                for _, agent, _, _ in restored:
+                    env.context.add(agent)
+                # Agents are placed cell by cell in their order, as the iteration of the agents of a cell follows it
+                for _, agent, (x, y), cell in sorted(restored, key=lambda entry: (entry[3], entry[0])):
+                    if cell >= 0:
+                        env.move(agent, dpt(x, y))
+                if env.store is not None:
+                    env.store.load_state({name: data[f'{env_name}/store/{name}'] for name in env.store.ARRAYS})
+
+            microbiota = model.envs[Microbiota.NAME]
+            microbiota.bacteria_to_add = [agent for _, agent, _, _ in self._unpack(data, Microbiota.NAME + '/pending')]
+            microbiota.substrates_to_add = {SubstrateType[name]: count
+                                            for name, count in state['substrates_to_add'].items()}
+            microbiota.good_bacteria_count = state['good_bacteria_count']
+            microbiota.pathogenic_bacteria_count = state['pathogenic_bacteria_count']
+            if microbiota.fields is not None:
+                for agent_type, field in microbiota.fields.items():
+                    field.load_state({name: data[f'{Microbiota.NAME}/fields/{agent_type}/{name}']
+                                      for name in field.state()})
+            model.gutBrainInterface.bbb_impermeability = state['bbb_impermeability']
+
+            model.rng.bit_generator.state = state['rng']
+            model.draws.placement.bit_generator.state = state['placement']
+            for purpose in model.draws.PURPOSES:
+                getattr(model.draws, purpose).set_state(state['draws'][purpose], data[f'draws/{purpose}/floats'],
+                                                        data[f'draws/{purpose}/ints'])
+
+    def log_rows(self) -> List[str]:
+        """
+        Returns the rows of the log file of the checkpointed run up to the tick of the checkpoint, without the header,
+        which a restarted run writes again after the header of its new log file. The file may not exist anymore.
+        """
+        path = self.manifest['params']['log_file']
+        if not os.path.exists(path):
+            return []
+        with open(path) as f:
+            rows = f.readlines()[1:]
+        return [row for row in rows if row.strip() and float(row.split(',', 1)[0]) <= self.tick]
+
+    @staticmethod
+    def _placements(grid, agents: Sequence[Agent]) -> Tuple[List[Tuple[int, int]], List[int]]:
+        """
+        Returns the grid location of each of the given local agents and its position among the local agents of
+        its cell, or (-1, -1) and -1 for the agents added to the context but not placed on the grid yet.
+        """
+        local = {agent.uid for agent in agents}
+        positions = {}
+        locations, cells = [], []
+        for agent in agents:
+            location = grid.get_location(agent)
+            if location is None:
+                locations.append((-1, -1))
+                cells.append(-1)
+                continue
+            key = (location.x, location.y)
+            if key not in positions:
+                cell_agents = [a.uid for a in grid.get_agents(location) if a.uid in local]
+                positions[key] = {uid: i for i, uid in enumerate(cell_agents)}
+            locations.append(key)
+            cells.append(positions[key][agent.uid])
+        return locations, cells
+
+    @staticmethod
+    def _pack(arrays: Dict[str, np.ndarray], prefix: str, agents: Sequence[Agent],
+              locations: Sequence[Tuple[int, int]] = None, cells: Sequence[int] = None):
+        """
+        Adds to the given arrays the records of the given agents, in a group of arrays per class under the given
+        prefix, with the position of each agent in the sequence and, if given, its location and cell position.
+        """
+        groups = {}
+        for position, agent in enumerate(agents):
+            groups.setdefault(agent._record_layout, []).append(position)
+        for layout, positions in groups.items():
+            key = f'{prefix}/{layout.cls.TYPE}.{layout.index}'
+            arrays[key + '/records'] = np.frombuffer(b''.join(layout.pack(agents[i]) for i in positions),
+                                                     dtype=layout.dtype)
+            arrays[key + '/uids'] = np.array([agents[i].uid for i in positions], dtype=np.int64)
+            arrays[key + '/order'] = np.array(positions, dtype=np.int64)
+            if locations is not None:
+                arrays[key + '/locations'] = np.array([locations[i] for i in positions], dtype=np.int32)
+                arrays[key + '/cells'] = np.array([cells[i] for i in positions], dtype=np.int64)
+
+    @staticmethod
+    def _unpack(data, prefix: str) -> List[Tuple[int, Agent, Tuple[int, int], int]]:
+        """
+        Restores the agents packed under the given prefix, without running the constructors of their classes.
+        :return: A list of (position, agent, location, cell position) tuples sorted by position, where the
+        location and the cell position are None for agents packed without them
+        """
+        restored = []
+        for key in data.files:
+            if not (key.startswith(prefix + '/') and key.endswith('/records')):
+                continue
+            group = key[:-len('/records')]
+            agent_type = int(group.rsplit('/', 1)[1].split('.')[0])
+            layout, rows = AgentRecords.unpack(agent_type, data[key])
+            uids = data[group + '/uids'].tolist()
+            orders = data[group + '/order'].tolist()
+            placed = group + '/locations' in data.files
+            locations = data[group + '/locations'].tolist() if placed else [None] * len(rows)
+            cells = data[group + '/cells'].tolist() if placed else [None] * len(rows)
+            for uid, row, order, location, cell in zip(uids, rows, orders, locations, cells):
+                agent = layout.new_agent(tuple(uid))
+                layout.restore(agent, row)
+                restored.append((order, agent, location, cell))
+        restored.sort(key=lambda entry: entry[0])
+        return restored
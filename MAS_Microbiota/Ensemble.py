@@ -0,0 +1,178 @@
+import os
+from typing import List
+
+import numpy as np
+from mpi4py import MPI
+from repast4py import logging
+
+from MAS_Microbiota.Utils import Simulation
+from MAS_Microbiota.Model import Model
+
+
+class ReplicateDataSet:
+    """
+    Data set of a single replicate of an ensemble.
+    It logs the same counts as the repast4py ReducingDataSet, reduced over the ranks of the replicate, but keeps
+    them in memory on the root rank of the replicate instead of writing them to a file.
+    """
+
+    def __init__(self, data_loggers: List[logging.ReducingDataLogger], comm: MPI.Intracomm, buffer_size: int = 1000):
+        self._data_loggers = data_loggers
+        self._comm = comm
+        self._rank = comm.Get_rank()
+        self._buffer_size = buffer_size
+        self._blocks = []
+        self.names = [logger.name for logger in data_loggers]
+        self.ticks = []
+
+    def log(self, tick: float):
+        """
+        Logs the counts of the given tick.
+        :param tick: The tick at which the counts are logged
+        """
+        self.ticks.append(tick)
+        for logger in self._data_loggers:
+            logger.log()
+        if self._data_loggers[0].size >= self._buffer_size:
+            self.write()
+
+    def write(self):
+        """
+        Reduces the counts logged so far over the ranks of the replicate and stores them on its root rank.
+        """
+        values = [logger.reduce(self._comm) for logger in self._data_loggers]
+        if self._rank == 0:
+            self._blocks.append(np.column_stack(values).astype(np.float64))
+
+    def close(self):
+        self.write()
+
+    def values(self) -> np.ndarray:
+        """
+        Returns the logged counts of the replicate, available on its root rank only.
+        :return: An array with a row for each logged tick and a column for each count
+        """
+        return np.concatenate(self._blocks) if self._blocks else np.empty((0, len(self.names)))
+
+
+class ReplicateModel(Model):
+    """
+    Model running a single replicate of an ensemble, whose counts are kept in memory to be combined
+    with the ones of the other replicates.
+    """
+
+    def create_data_set(self, loggers: List[logging.ReducingDataLogger]):
+        return ReplicateDataSet(loggers, self.comm)
+
+
+class RunningStatistics:
+    """
+    Running mean and variance of a series of equally shaped arrays, updated one array at a time with
+    Welford's algorithm, so that the arrays never need to be stored together.
+    """
+
+    def __init__(self):
+        self.n = 0
+        self.mean = None
+        self._m2 = None
+
+    def add(self, values: np.ndarray):
+        """
+        Updates the statistics with a new array of values.
+        :param values: The array of values to add
+        """
+        if self.n == 0:
+            self.mean = np.zeros_like(values, dtype=np.float64)
+            self._m2 = np.zeros_like(values, dtype=np.float64)
+        self.n += 1
+        delta = values - self.mean
+        self.mean += delta / self.n
+        self._m2 += delta * (values - self.mean)
+
+    def variance(self) -> np.ndarray:
+        """
+        Returns the sample variance of the values added so far, which is zero when a single array was added.
+        """
+        return self._m2 / (self.n - 1) if self.n > 1 else np.zeros_like(self._m2)
+
+
+class Ensemble:
+    """
+    Ensemble of replicates of the simulation run in a single MPI launch.
+    The ranks of the given communicator are split in contiguous groups, one for each replicate, and each group
+    runs its own model over its own sub-communicator with the seed parameter increased by the replicate index.
+    At the end, the root rank of each replicate sends its counts to the first rank, which combines them one
+    replicate at a time into the running mean and variance of each count at each tick, and writes them to the
+    ensemble file.
+    """
+
+    COUNTS_TAG = 1
+
+    def __init__(self, comm: MPI.Intracomm, replicates: int):
+        if not 0 < replicates <= comm.Get_size():
+            raise ValueError(f"Cannot run {replicates} replicates on {comm.Get_size()} ranks")
+        if Simulation.params.get('restart'):
+            raise ValueError("Ensembles cannot be restarted from a checkpoint")
+        self.comm = comm
+        self.replicates = replicates
+        self.replicate = comm.Get_rank() * replicates // comm.Get_size()
+        self.replicate_comm = comm.Split(self.replicate, comm.Get_rank())
+        is_replicate_root = self.replicate_comm.Get_rank() == 0
+        self.roots_comm = comm.Split(0 if is_replicate_root else MPI.UNDEFINED, comm.Get_rank())
+
+    def start(self):
+        """
+        Runs the replicate of this rank and combines the counts of all the replicates.
+        """
+        Simulation.params = dict(Simulation.params, seed=Simulation.params['seed'] + self.replicate, headless=True)
+        Simulation.params['capture.dir'] = os.path.join(Simulation.params.get('capture.dir', 'output/frames'),
+                                                        f'replicate_{self.replicate}')
+        model = ReplicateModel(self.replicate_comm)
+        Simulation.set_model(model)
+        model.start()
+
+        if self.roots_comm != MPI.COMM_NULL:
+            self._combine(model.data_set)
+
+    def _combine(self, data_set: ReplicateDataSet):
+        """
+        Sends the counts of the replicate to the first rank or, on the first rank, receives the counts of
+        every replicate as they arrive and folds them into the running statistics.
+        """
+        values = data_set.values()
+        if self.roots_comm.Get_rank() != 0:
+            self.roots_comm.Send(values, dest=0, tag=self.COUNTS_TAG)
+            return
+
+        statistics = RunningStatistics()
+        statistics.add(values)
+        buffer = np.empty_like(values)
+        for _ in range(self.roots_comm.Get_size() - 1):
+            self.roots_comm.Recv(buffer, source=MPI.ANY_SOURCE, tag=self.COUNTS_TAG)
+            statistics.add(buffer)
+        self._write(data_set.ticks, data_set.names, statistics)
+
+    def _write(self, ticks: List[float], names: List[str], statistics: RunningStatistics):
+        """
+        Writes the mean and the sample variance of each count at each tick to the ensemble file.
+        """
+        path = Simulation.params['ensemble_file']
+        if os.path.dirname(path):
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+        variance = statistics.variance()
+        with open(path, 'w', newline='') as f_out:
+            f_out.write(','.join(['tick', 'replicates'] + [f'{name}_{stat}' for name in names
+                                                           for stat in ('mean', 'var')]) + '\n')
+            for i, tick in enumerate(ticks):
+                row = [str(tick), str(statistics.n)]
+                for j in range(len(names)):
+                    row += [str(float(statistics.mean[i, j])), str(float(variance[i, j]))]
+                f_out.write(','.join(row) + '\n')
+
+    @staticmethod
+    def run(comm: MPI.Intracomm = MPI.COMM_WORLD):
+        """
+        Runs an ensemble with the number of replicates given by the 'ensemble.replicates' parameter.
+        :param comm: MPI communicator of all the processes running the ensemble
+        """
+        Ensemble(comm, Simulation.params['ensemble.replicates']).start()
@@ -0,0 +1,117 @@
+import re
+import struct
+from enum import Enum
+from typing import Dict, List, Sequence, Tuple
+
+import numpy as np
+from repast4py.core import Agent
+from repast4py.space import DiscretePoint as dpt
+
+
+CONTEXTS = ('microbiota', 'gut', 'brain')  # Names of the environments, encoded in the records by their index
+
+# Fields at the start of every record: the index of the class among the ones sharing its TYPE, the position of the
+# agent and its environment
+HEADER = (('cls', 'B'), ('x', 'i'), ('y', 'i'), ('context', 'B'))
+
+
+class RecordLayout:
+    """
+    Binary layout of the state of the agents of a class, as declared by the RECORD_FIELDS of the class.
+    A record is packed with a little-endian struct without padding, so that a sequence of records is also the buffer
+    of a NumPy structured array with the dtype of the layout, and the records of many agents are exchanged as a
+    single buffer and decoded column by column.
+    """
+
+    def __init__(self, cls: type, index: int):
+        self.cls = cls
+        self.index = index
+        self.fields = cls.RECORD_FIELDS
+        formats = [fmt for _, fmt in HEADER] + [fmt for _, fmt, _ in self.fields]
+        self.struct = struct.Struct('<' + ''.join(formats))
+        self.dtype = np.dtype([(name, '<' + fmt) for name, fmt in HEADER] +
+                              [(attribute, '<' + fmt) for attribute, fmt, _ in self.fields])
+        self._counts = [int(re.match(r'\d*', fmt).group() or 1) for _, fmt, _ in self.fields]
+
+    def pack(self, agent: Agent) -> bytes:
+        """
+        Returns the record of the given agent.
+        """
+        values = [self.index, agent.pt.x, agent.pt.y, CONTEXTS.index(agent.context)]
+        for (attribute, _, _), count in zip(self.fields, self._counts):
+            value = getattr(agent, attribute)
+            if count > 1:
+                values.extend(value)
+            else:
+                values.append(value.value if isinstance(value, Enum) else value)
+        return self.struct.pack(*values)
+
+    def new_agent(self, uid: Tuple) -> Agent:
+        """
+        Returns an agent of the class of the layout with the given uid, without running the constructor of the class,
+        so that its side effects, like updating the counts of the model, do not happen. Its state must be restored
+        by restore.
+        """
+        agent = self.cls.__new__(self.cls)
+        Agent.__init__(agent, id=uid[0], type=uid[1], rank=uid[2])
+        return agent
+
+    def restore(self, agent: Agent, row: Sequence):
+        """
+        Sets the state of the given agent from a row of the structured array of the records, as a sequence of
+        Python values.
+        """
+        agent.pt = dpt(row[1], row[2], 0)
+        agent.context = CONTEXTS[row[3]]
+        for (attribute, _, decode), value in zip(self.fields, row[len(HEADER):]):
+            setattr(agent, attribute, decode(value) if decode is not None else value)
+
+
+_layouts: Dict[int, List[RecordLayout]] = {}
+
+
+def register(cls: type):
+    """
+    Registers the layout of an agent class, as the next one of its TYPE.
+    The classes are registered as they are defined, in the same order on all the ranks.
+    """
+    layouts = _layouts.setdefault(cls.TYPE, [])
+    layouts.append(RecordLayout(cls, len(layouts)))
+    cls._record_layout = layouts[-1]
+
+
+def layout(agent_type: int, index: int) -> RecordLayout:
+    """
+    Returns the layout of the class with the given index among the ones of the given TYPE.
+    """
+    return _layouts[agent_type][index]
+
+
+def unpack(agent_type: int, records: np.ndarray) -> Tuple[RecordLayout, list]:
+    """
+    Decodes a structured array of records of agents of the same class.
+    :param agent_type: The TYPE of the agents
+    :param records: The records, with the dtype of the layout of their class
+    :return: The layout of the records and the list of the rows, each a tuple of Python values
+    """
+    return layout(agent_type, int(records['cls'][0])), records.tolist()
+
+
+def pack_agents(agents: Sequence[Agent], locations: Sequence[Tuple[int, int]]) -> list:
+    """
+    Packs the given agents, located at the given grid coordinates, in batches of agents of the same class.
+    :return: A list of (uids, records, locations) batches, where uids is an integer array with a row for the uid
+    of each agent, records a structured array with the record of each agent and locations an integer array with
+    a row for the grid coordinates of each agent
+    """
+    groups: Dict[RecordLayout, Tuple[list, list]] = {}
+    for agent, location in zip(agents, locations):
+        group = groups.setdefault(agent._record_layout, ([], []))
+        group[0].append(agent)
+        group[1].append(location)
+    batches = []
+    for record_layout, (group, group_locations) in groups.items():
+        records = np.frombuffer(b''.join(record_layout.pack(agent) for agent in group), dtype=record_layout.dtype)
+        uids = np.array([agent.uid for agent in group], dtype=np.int64)
+        batches.append((uids, records, np.array(group_locations, dtype=np.int32)))
+    return batches
@@ -1,9 +1,9 @@
 from enum import IntEnum
 from typing import Tuple, Dict, Optional
 from repast4py.space import DiscretePoint as dpt
-import numpy as np
 
 from MAS_Microbiota import Simulation
+from MAS_Microbiota.Utils import counted_attribute
 from MAS_Microbiota.Environments import GridAgent
 from .Precursor import Precursor
 from .Neurotransmitter import NeurotransmitterType
@@ -15,18 +15,19 @@ class NeuronState(IntEnum):
 
 class Neuron(GridAgent):
     TYPE = 7
+    __slots__ = ('_state', 'neurotrans_availability', 'neurotrans_rate')
+    state = counted_attribute('state')
+    RECORD_FIELDS = (('state', 'B', NeuronState), ('toRemove', '?', None),
+                     ('neurotrans_availability', f'{len(NeurotransmitterType)}d', None),
+                     ('neurotrans_rate', f'{len(NeurotransmitterType)}d', None))
 
     def __init__(self, local_id: int, rank: int, initial_state: NeuronState, pt: dpt, context: str):
         super().__init__(local_id=local_id, type=Neuron.TYPE, rank=rank, pt=pt, context=context)
         self.state = initial_state
         self.toRemove = False
-        # Neurtransmitters the neuron is able to produce given its state
-        self.neurotrans_availability = {neuro_type: Simulation.params["neurotrans_initial_availability"]
-                                        for neuro_type in NeurotransmitterType}
-        self.neurotrans_rate = {neuro_type: 1 for neuro_type in NeurotransmitterType}
-
-    def save(self) -> Tuple:
-        return (self.uid, int(self.state), self.pt.coordinates, self.neurotrans_availability, self.toRemove, self.context)
+        # Neurtransmitters the neuron is able to produce given its state, indexed by NeurotransmitterType.index
+        self.neurotrans_availability = [Simulation.params["neurotrans_initial_availability"]] * len(NeurotransmitterType)
+        self.neurotrans_rate = [1] * len(NeurotransmitterType)
 
     # Neuron step function
     def step(self):
@@ -50,7 +51,7 @@ class Neuron(GridAgent):
         if difference_pro_anti_cytokine > 0:
             level_of_inflammation = (difference_pro_anti_cytokine * 100) / (
                     Simulation.model.pro_cytokine + Simulation.model.anti_cytokine)
-            if np.random.randint(0, 100) < level_of_inflammation:
+            if Simulation.model.draws.inflammation.integers(0, 100) < level_of_inflammation:
                 self.change_state()
 
 
@@ -60,7 +61,7 @@ class Neuron(GridAgent):
         :return: Dict with neurotransmitter type as key and the amount of neurotransmitter as value
         """
         return {neurotransmitter:
-                    min(self.neurotrans_availability[neurotransmitter], self.neurotrans_rate[neurotransmitter])
+                    min(self.neurotrans_availability[neurotransmitter.index], self.neurotrans_rate[neurotransmitter.index])
                     for neurotransmitter in NeurotransmitterType}
 
 
@@ -72,24 +73,24 @@ class Neuron(GridAgent):
         The rate at which the neuron produces neurotransmitters is also changed towards the minimum, which is 1
         per neurotransmitter.
         """
-        for neurotransmitter in self.neurotrans_availability:
+        for i in range(len(self.neurotrans_availability)):
             if self.state == NeuronState.DEAD:
-                self.neurotrans_availability[neurotransmitter] = 0
+                self.neurotrans_availability[i] = 0
             else:
-                self.neurotrans_availability[neurotransmitter] = (max(0,
-                    self.neurotrans_availability[neurotransmitter] -
-                    Simulation.params["neurotrans_decrease"][self.state.name] * self.neurotrans_rate[neurotransmitter]))
+                self.neurotrans_availability[i] = (max(0,
+                    self.neurotrans_availability[i] -
+                    Simulation.params["neurotrans_decrease"][self.state.name] * self.neurotrans_rate[i]))
 
         # Uses a nearby precursor to make more neurotransmitters available
         precursor = self.percept_precursor()
         if precursor is not None:
-            neurotrans = np.random.choice(precursor.precursor_type.associated_neurotransmitters())
-            self.neurotrans_availability[neurotrans] += Simulation.params["precursor_boost"]
+            neurotrans = Simulation.model.draws.metabolism.choice(precursor.precursor_type.associated_neurotransmitters())
+            self.neurotrans_availability[neurotrans.index] += Simulation.params["precursor_boost"]
             precursor.toRemove = True
 
         # Decreases the rate at which the neuron produces neurotransmitters
-        for neurotransmitter in self.neurotrans_rate:
-            self.neurotrans_rate[neurotransmitter] = max(1, self.neurotrans_rate[neurotransmitter] - 1)
+        for i in range(len(self.neurotrans_rate)):
+            self.neurotrans_rate[i] = max(1, self.neurotrans_rate[i] - 1)
 
 
 
@@ -98,8 +99,13 @@ class Neuron(GridAgent):
         Returns the precursor agent in the neighborhood of the agent, if any.
         :return: Precursor agent in the neighborhood of the agent
         """
-        for ngh_coords in Simulation.model.ngh_finder.find(self.pt.x, self.pt.y):
-            nghs_array = Simulation.model.envs['brain'].grid.get_agents(dpt(ngh_coords[0], ngh_coords[1]))
+        brain = Simulation.model.envs['brain']
+        if not brain.holds_as_agents(Precursor):
+            precursors = brain.find_resources(self.pt, {Precursor.TYPE: None})
+            return precursors[0] if len(precursors) > 0 else None
+        nghs_coords = Simulation.model.ngh_finder.find(self.pt.x, self.pt.y)
+        for ngh_coords in brain.occupancy.occupied((Precursor.TYPE,), nghs_coords):
+            nghs_array = brain.grid.get_agents(dpt(ngh_coords[0], ngh_coords[1]))
             for ngh in nghs_array:
                 if isinstance(ngh, Precursor):
                     return ngh
@@ -1,5 +1,4 @@
 from enum import Enum
-from typing import Tuple
 
 from repast4py.space import DiscretePoint as dpt
 
@@ -12,9 +11,19 @@ class NeurotransmitterType(Enum):
     SEROTONIN = 2
     NOREPINEPHRINE = 3
 
+    @property
+    def index(self) -> int:
+        """
+        Position of the neurotransmitter type in the per-type lists of the neurons.
+        """
+        return self.value - 1
+
 class Neurotransmitter(ResourceAgent):
 
     TYPE = 13
+    SUBTYPE_ATTRIBUTE = 'neurotrans_type'
+    __slots__ = ('neurotrans_type', 'age')
+    RECORD_FIELDS = (('neurotrans_type', 'B', NeurotransmitterType), ('age', 'q', None)) + ResourceAgent.RECORD_FIELDS
 
     def __init__(self, local_id: int, rank: int, neurotrans_type: NeurotransmitterType, pt: dpt, context):
         super().__init__(local_id=local_id, type=Neurotransmitter.TYPE, rank=rank, pt=pt, context=context)
@@ -22,16 +31,13 @@ class Neurotransmitter(ResourceAgent):
         self.toMove = False
         self.age = 0
 
-    def save(self) -> Tuple:
-        return (self.uid, self.neurotrans_type, self.pt.coordinates, self.context, self.toMove, self.toRemove)
-
     def step(self):
         self.random_movement()
         self.age += 1
 
         # Check if the neurotransmitter should be removed or moved according to its age
         if self.age == Simulation.params["neurotrans_max_age"] and self.context == 'microbiota' and \
-            Simulation.model.rng.integers(0, 100) < Simulation.params["neurotrans_reuptake_percentage"]:
+            Simulation.model.draws.movement.integers(0, 100) < Simulation.params["neurotrans_reuptake_percentage"]:
                 self.toMove = True
         elif self.age > Simulation.params["neurotrans_max_age"]:
             self.toRemove = True
@@ -1,6 +1,7 @@
 from enum import Enum, IntEnum
 
 from MAS_Microbiota.Environments import ResourceAgent
+from MAS_Microbiota.Environments.GridAgent import flag_attribute
 from .Neurotransmitter import NeurotransmitterType
 
 class PrecursorType(IntEnum):
@@ -17,6 +18,10 @@ class PrecursorType(IntEnum):
 class Precursor(ResourceAgent):
 
     TYPE = 14
+    SUBTYPE_ATTRIBUTE = 'precursor_type'
+    __slots__ = ('precursor_type',)
+    toRemove = flag_attribute('toRemove', counted=True)  # Precursors marked for removal are not counted
+    RECORD_FIELDS = (('precursor_type', 'B', PrecursorType),) + ResourceAgent.RECORD_FIELDS
 
     TRYPTOPHAN_TYPE = 1
     TYROSINE_TYPE = 2
@@ -25,9 +30,6 @@ class Precursor(ResourceAgent):
         super().__init__(local_id=local_id, type=Precursor.TYPE, rank=rank, pt=pt, context=context)
         self.precursor_type = precursor_type
 
-    def save(self):
-        return (self.uid, int(self.precursor_type), self.pt.coordinates, self.context)
-
     def step(self):
         self.random_movement()
         self.check_if_to_move(permeability_check=False)
\ No newline at end of file
@@ -5,6 +5,7 @@ from MAS_Microbiota.Environments.Gut.Agents import *
 from MAS_Microbiota.AgentRestorer import restore_agent
 from MAS_Microbiota import Simulation
 from .. import GridEnvironment
+from .NeuronEngine import NeuronEngine
 
 
 class Brain(GridEnvironment):
@@ -12,6 +13,8 @@ class Brain(GridEnvironment):
 
     def __init__(self, context, grid):
         super().__init__(context, grid)
+        # Optional array engine of the neurons, replacing their step methods
+        self.neuron_engine = NeuronEngine(self) if Simulation.params.get('neuron_engine', False) else None
 
     @staticmethod
     def initial_agents():
@@ -35,9 +38,10 @@ class Brain(GridEnvironment):
     # Brain steps
     def step(self):
         removed_ids = set()
-        self.context.synchronize(restore_agent)
+        self.mark_changed()  # By the other environments and the model since the last step
+        self.synchronize(restore_agent)
         self.remove_agents(removed_ids)
-        self.context.synchronize(restore_agent)
+        self.synchronize(restore_agent)
         self.make_agents_steps()
 
         # Collect data and perform operations based on agent states
@@ -63,27 +67,32 @@ class Brain(GridEnvironment):
         self.add_cytokines(active_microglias)
         self.brain_add_cleaved_protein(damaged_neurons)
         self.remove_oligomers(removed_ids, oligomer_to_remove)
-        self.context.synchronize(restore_agent)
+        self.mark_changed()
+        self.synchronize(restore_agent)
         self.aggreagate_cleaved_proteins(removed_ids, all_true_cleaved_aggregates)
-        self.context.synchronize(restore_agent)
+        self.synchronize(restore_agent)
         self.remove_agents(removed_ids)
 
-    def produce_neurotransmitters(self, neurons):
-        produced_neurotrans = {n_type: 0 for n_type in list(NeurotransmitterType)}
+    def step_agents(self):
+        if self.neuron_engine is None:
+            super().step_agents()
+            return
+        for agent in self.context.agents():
+            if agent.TYPE != Neuron.TYPE:
+                agent.step()
+        self.neuron_engine.step()
 
-        for neuron in neurons:
-            for n_type in NeurotransmitterType:
-                if neuron.neurotrans_availability[n_type] > 0:
-                    produced_neurotrans[n_type] += neuron.neurotrans_rate[n_type]
+    def produce_neurotransmitters(self, neurons):
+        if self.neuron_engine is not None:
+            produced_neurotrans = self.neuron_engine.production()
+        else:
+            produced_neurotrans = {n_type: 0 for n_type in list(NeurotransmitterType)}
+            for neuron in neurons:
+                for n_type in NeurotransmitterType:
+                    if neuron.neurotrans_availability[n_type.index] > 0:
+                        produced_neurotrans[n_type] += neuron.neurotrans_rate[n_type.index]
 
-        for n_type in produced_neurotrans:
-            self.context.add(Neurotransmitter(
-                Simulation.model.new_id(),
-                Simulation.model.rank,
-                n_type,
-                self.grid.get_random_local_pt(Simulation.model.rng),
-                self.NAME
-            ))
+        self.spawn_many(Neurotransmitter, len(produced_neurotrans), list(produced_neurotrans), placed=False)
 
 
     def add_cytokines(self, active_microglias: int):
@@ -91,11 +100,7 @@ class Brain(GridEnvironment):
         Adds a cytokine agent to the brain context for each active microglia.
         :param active_microglias: Number of active microglias.
         """
-        for _ in range(active_microglias):
-            pt = self.grid.get_random_local_pt(Simulation.model.rng)
-            cytokine = Cytokine(Simulation.model.new_id(), Simulation.model.rank, pt, 'brain')
-            self.context.add(cytokine)
-            Simulation.model.move(cytokine, cytokine.pt, 'brain')
+        self.spawn_many(Cytokine, active_microglias)
 
 
     # Function to add a cleaved protein agent to the brain context for each damaged neuron
@@ -104,13 +109,9 @@ class Brain(GridEnvironment):
         Adds a cleaved protein agent to the brain context for each damaged neuron.
         :param damaged_neurons: Number of damaged neurons.
         """
-        for _ in range(damaged_neurons):
-            cleaved_protein_name = Simulation.model.rng.choice(list(ProteinName))
-            pt = self.grid.get_random_local_pt(Simulation.model.rng)
-            cleaved_protein = CleavedProtein(Simulation.model.new_id(), Simulation.model.rank,
-                                             cleaved_protein_name, pt, 'brain')
-            self.context.add(cleaved_protein)
-            Simulation.model.move(cleaved_protein, cleaved_protein.pt, cleaved_protein.context)
+        cleaved_protein_names = [Simulation.model.draws.inflammation.choice(list(ProteinName))
+                                 for _ in range(damaged_neurons)]
+        self.spawn_many(CleavedProtein, damaged_neurons, cleaved_protein_names)
 
 
     def remove_oligomers(self, removed_ids, oligomer_to_remove):
@@ -137,6 +138,7 @@ class Brain(GridEnvironment):
                         else:
                             x.alreadyAggregate = False
                             x.toAggregate = False
+                            self.mark_changed()
                             cont += 1
                 Simulation.model.add_oligomer_protein(agent.name, agent.context)
                 Simulation.model.remove_agent(agent)
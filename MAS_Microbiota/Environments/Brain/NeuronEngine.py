@@ -0,0 +1,117 @@
+from typing import Dict
+
+import numpy as np
+
+from MAS_Microbiota import Simulation
+from MAS_Microbiota.Environments.Brain.Agents.Neuron import Neuron, NeuronState
+from MAS_Microbiota.Environments.Brain.Agents.Neurotransmitter import NeurotransmitterType
+from MAS_Microbiota.Environments.Brain.Agents.Precursor import Precursor
+
+
+class NeuronEngine:
+    """
+    Array engine of the neurons of the brain, used in place of their step methods.
+
+    The state of the local neurons and the availability and production rate of each of their neurotransmitters are
+    held in integer arrays with a row per neuron, in the order of the context. The availability and the rate of each
+    neuron are views of its rows, so that the agents, their records and the gut-brain interface always read and write
+    the values of the engine. At each step the inflammation draws, the decrease of the availability and the
+    relaxation of the rate are single vectorized operations over all the neurons, and only the neurons with a
+    precursor in their neighbourhood, found from the occupancy layers, perceive it one at a time.
+
+    Unlike the agents, the neurons step after the other agents of the brain.
+    """
+
+    def __init__(self, env):
+        """
+        :param env: The brain environment of the neurons
+        """
+        self.env = env
+        self.neurons = ()
+        self.coords = np.zeros((0, 2), dtype=np.int64)
+        self.states = np.zeros(0, dtype=np.int64)
+        self.availability = np.zeros((0, len(NeurotransmitterType)), dtype=np.int64)
+        self.rates = np.zeros((0, len(NeurotransmitterType)), dtype=np.int64)
+
+    def sync(self) -> tuple:
+        """
+        Rebuilds the arrays from the local neurons if they changed since the last call, binding the availability and
+        the rate of each neuron to its rows.
+        :return: The local neurons, in the order of the rows
+        """
+        neurons = self.env.agents_of_type(Neuron.TYPE)
+        if neurons is self.neurons:
+            return neurons
+        self.neurons = neurons
+        shape = (len(neurons), len(NeurotransmitterType))
+        self.coords = np.array([(neuron.pt.x, neuron.pt.y) for neuron in neurons], dtype=np.int64).reshape(-1, 2)
+        self.states = np.array([int(neuron.state) for neuron in neurons], dtype=np.int64)
+        self.availability = np.array([neuron.neurotrans_availability for neuron in neurons],
+                                     dtype=np.int64).reshape(shape)
+        self.rates = np.array([neuron.neurotrans_rate for neuron in neurons], dtype=np.int64).reshape(shape)
+        for neuron, availability, rate in zip(neurons, self.availability, self.rates):
+            neuron.neurotrans_availability, neuron.neurotrans_rate = availability, rate
+        return neurons
+
+    def step(self):
+        """
+        Performs the step of all the local neurons: the inflammation changes their state, the availability of their
+        neurotransmitters decreases, and increases with a precursor in their neighbourhood, and their production
+        rates relax towards the minimum.
+        """
+        neurons = self.sync()
+        if len(neurons) == 0:
+            return
+        model = Simulation.model
+        difference_pro_anti_cytokine = model.pro_cytokine - model.anti_cytokine
+        if difference_pro_anti_cytokine > 0:
+            level_of_inflammation = (difference_pro_anti_cytokine * 100) / (model.pro_cytokine + model.anti_cytokine)
+            inflamed = model.draws.inflammation.integers_array(0, 100, len(neurons)) < level_of_inflammation
+            for i in np.flatnonzero(inflamed).tolist():
+                neurons[i].change_state()
+                self.states[i] = int(neurons[i].state)
+
+        decrease = np.zeros(len(NeuronState) + 1, dtype=np.int64)  # Indexed by the value of the state
+        for state, amount in Simulation.params["neurotrans_decrease"].items():
+            decrease[int(NeuronState[state])] = amount
+        self.availability -= decrease[self.states][:, None] * self.rates
+        np.maximum(self.availability, 0, out=self.availability)
+        self.availability[self.states == int(NeuronState.DEAD)] = 0
+
+        self._boost_availability()
+        np.maximum(self.rates - 1, 1, out=self.rates)
+
+    def _boost_availability(self):
+        """
+        Uses a precursor in the neighbourhood of each neuron, if any, to make more neurotransmitters available.
+        """
+        if self.env.holds_as_agents(Precursor):
+            counts = self.env.occupancy.neighbourhood_counts((Precursor.TYPE,), self.coords)
+            candidates = np.flatnonzero(counts > 0).tolist()
+        else:
+            candidates = range(len(self.neurons))
+        for i in candidates:
+            precursor = self.neurons[i].percept_precursor()
+            if precursor is not None:
+                neurotrans = Simulation.model.draws.metabolism.choice(
+                    precursor.precursor_type.associated_neurotransmitters())
+                self.availability[i, neurotrans.index] += Simulation.params["precursor_boost"]
+                precursor.toRemove = True
+
+    def stimulate(self, index: int, neurotrans_type: NeurotransmitterType, amount: int):
+        """
+        Increases the production rate of a neurotransmitter of a neuron.
+        :param index: The position of the neuron among the local neurons, in the order of the context
+        :param neurotrans_type: The type of the neurotransmitter
+        :param amount: The increase of the rate
+        """
+        self.sync()
+        self.rates[index, neurotrans_type.index] += amount
+
+    def production(self) -> Dict[NeurotransmitterType, int]:
+        """
+        Returns the total production rate of each neurotransmitter over the local neurons with some availability.
+        """
+        self.sync()
+        produced = (self.rates * (self.availability > 0)).sum(axis=0)
+        return {n_type: int(produced[n_type.index]) for n_type in NeurotransmitterType}
@@ -0,0 +1,116 @@
+from collections import defaultdict
+from itertools import count
+from typing import Dict, Hashable, List, Tuple
+
+from repast4py import context as ctx
+from repast4py.core import Agent
+
+from MAS_Microbiota.Utils import Counters
+
+
+class EnvironmentContext(ctx.SharedContext):
+    """
+    Shared context of an environment, which also keeps live indexes of its local agents and the population
+    counters of the model up to date, including when agents are received from and sent to other ranks while
+    synchronizing.
+
+    Besides the index by TYPE of the SharedContext, the agents are indexed by their exact class, with O(1) additions
+    and removals, so that the agents of a class, or of a TYPE, are found in time proportional to their number
+    instead of filtering all the agents of the context. The agents of a TYPE keep the order of insertion, while
+    the agents of a class and of its subclasses are grouped by class.
+    Queries return tuples, which are cached until an agent of the queried kind is added or removed, so that
+    repeatedly sampling the same kind of agents does not copy them each time.
+
+    The context also holds, for each flag like toRemove, the queue of the agents that set it since it was last
+    taken, filled by the flag attributes of the agents, so that the flagged agents are found without scanning
+    the context.
+    """
+
+    def __init__(self, comm, env_name: str, counters: Counters):
+        super().__init__(comm)
+        self.env_name = env_name
+        self.counters = counters
+        self._agents_by_class: Dict[type, Dict[Tuple, Agent]] = {}
+        self._snapshots: Dict[Hashable, tuple] = {}
+        self._order: Dict[Tuple, int] = {}  # Rank of each local agent in the order of insertion
+        self._counter = count()
+        self.flagged: Dict[str, Dict[Tuple, Agent]] = defaultdict(dict)
+
+    def _invalidate(self, agent: Agent):
+        """
+        Drops the cached queries including the given agent, namely the ones of its TYPE, of its class and of the
+        superclasses of its class.
+        """
+        for key in [key for key in self._snapshots
+                    if key == agent.uid[1] or (isinstance(key, type) and isinstance(agent, key))]:
+            del self._snapshots[key]
+
+    def add(self, agent: Agent):
+        super().add(agent)
+        self._agents_by_class.setdefault(type(agent), {})[agent.uid] = agent
+        self._order[agent.uid] = next(self._counter)
+        self._invalidate(agent)
+        self.counters.add(agent, self.env_name)
+
+    def remove(self, agent: Agent):
+        super().remove(agent)
+        self._forget(agent)
+
+    def _forget(self, agent: Agent):
+        self._agents_by_class[type(agent)].pop(agent.uid, None)
+        self._order.pop(agent.uid, None)
+        for queue in self.flagged.values():
+            queue.pop(agent.uid, None)
+        self._invalidate(agent)
+        self.counters.remove(agent, self.env_name)
+
+    def _gather_oob_data(self, oob_agents: List):
+        # Agents moving to other ranks leave the context here, without passing through remove
+        send_data = super()._gather_oob_data(oob_agents)
+        for agent, _ in oob_agents:
+            self._forget(agent)
+        return send_data
+
+    def order(self, agent: Agent) -> int:
+        """
+        Returns the rank of the given local agent in the order of insertion, which is the order of its step.
+        """
+        return self._order[agent.uid]
+
+    def agents_of_type(self, agent_type: int) -> tuple:
+        """
+        Returns the local agents of the given TYPE, in order of insertion.
+        """
+        snapshot = self._snapshots.get(agent_type)
+        if snapshot is None:
+            agents = self._agents_by_type.get(agent_type)
+            snapshot = self._snapshots[agent_type] = tuple(agents.values()) if agents is not None else ()
+        return snapshot
+
+    def agents_by_class(self, base: type) -> Dict[type, tuple]:
+        """
+        Returns the local agents of the given class and of its subclasses, grouped by class.
+        :param base: The class of the agents
+        :return: A dictionary from each class with at least one agent to the tuple of its agents
+        """
+        return {cls: tuple(agents.values()) for cls, agents in self._agents_by_class.items()
+                if len(agents) > 0 and issubclass(cls, base)}
+
+    def agents_of_class(self, base: type) -> tuple:
+        """
+        Returns the local agents of the given class and of its subclasses, grouped by class.
+        """
+        snapshot = self._snapshots.get(base)
+        if snapshot is None:
+            snapshot = self._snapshots[base] = tuple(agent for agents in self.agents_by_class(base).values()
+                                                     for agent in agents)
+        return snapshot
+
+    def take_flagged(self, name: str) -> list:
+        """
+        Returns the local agents that set the given flag since the last call and still have it set, in order of
+        insertion, and empties the queue of the flag. Ghosts restored with the flag set are left out.
+        """
+        queue = self.flagged.pop(name, {})
+        return sorted((agent for uid, agent in queue.items() if self.agent(uid) is agent and getattr(agent, name)),
+                      key=lambda agent: self._order[agent.uid])
@@ -1,31 +1,70 @@
 from abc import ABC, abstractmethod
-from typing import Tuple
+from operator import attrgetter
+from typing import Callable, Optional, Tuple
 
 from repast4py.space import DiscretePoint as dpt
 from repast4py.core import Agent
 
+from MAS_Microbiota import Simulation
+from MAS_Microbiota.Environments import AgentRecords
+
+
+def flag_attribute(name: str, counted: bool = False) -> property:
+    """
+    Returns a property for a flag of an agent class, like toRemove, which queues the agent in the context of the
+    environment named by its context attribute whenever the flag is set, so that the environment finds the flagged
+    agents without scanning its context. The value is kept in the attribute with the same name prefixed by an underscore.
+    :param name: The name of the flag
+    :param counted: Whether the agents are also classified by the flag in the population counters
+    """
+    private_name = '_' + name
+
+    def set_value(agent, value):
+        setattr(agent, private_name, value)
+        if counted:
+            Simulation.model.counters.update(agent)
+        if value:
+            env = Simulation.model.envs.get(agent.context)
+            if env is not None:
+                env.context.flagged[name][agent.uid] = agent
+
+    return property(attrgetter(private_name), set_value)
+
+
 class GridAgent(Agent, ABC):
     """
     Abstract class for the agents that can be located in discrete positions of a
     certain grid environment.
+    All the agent classes declare their instance attributes in __slots__, so that agents carry no per-instance
+    dictionary. The attributes set through properties, like toRemove, are kept in slots prefixed by an underscore.
+    The state exchanged with the other ranks is declared in RECORD_FIELDS, as (attribute, struct format, decoding
+    function) triples, and packed in binary records, see AgentRecords.
     """
 
+    __slots__ = ('pt', 'context', '_toRemove', 'counted_as')
+
     TYPE: int
+    SUBTYPE_ATTRIBUTE: str = None  # Name of the attribute with the immutable subtype of the agent, if any
+    toRemove = flag_attribute('toRemove')  # Only set by the agents that can be removed
+    RECORD_FIELDS: Tuple[Tuple[str, str, Optional[Callable]], ...] = ()
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        if isinstance(getattr(cls, 'TYPE', None), int):
+            AgentRecords.register(cls)
 
     def __init__(self, local_id: int, type: int, rank: int, pt: dpt, context: str):
         super().__init__(id=local_id, type=type, rank=rank)
         self.pt = pt
         self.context = context
 
-    @abstractmethod
-    def save(self) -> Tuple[int, dpt, str]:
+    def save(self) -> Tuple[Tuple, bytes]:
         """
-        Returns the agent's state in a tuple. The tuple should contain the environment-unique id
-        as first element, followed by other information like the agent's state, it's position and
-        its current environment name.
+        Returns the agent's state in a tuple, made of the agent's uid and of the binary record of its position,
+        its current environment name and the attributes in RECORD_FIELDS.
         :return: The agent's state in a tuple.
         """
-        return self.id, self.pt, self.context
+        return self.uid, self._record_layout.pack(self)
 
     @abstractmethod
     def step(self):
@@ -1,9 +1,13 @@
 from abc import ABC, abstractmethod
-from typing import Tuple, Any, Set
+from typing import Tuple, Any, Set, List, Sequence
+import numpy as np
 from repast4py import context as ctx
 from repast4py.core import Agent
+from repast4py.space import DiscretePoint as dpt
 
 from MAS_Microbiota import Simulation
+from MAS_Microbiota.Environments.Occupancy import Occupancy
+from MAS_Microbiota.Environments.Synchronizer import Synchronizer
 
 
 class GridEnvironment(ABC):
@@ -16,6 +20,11 @@ class GridEnvironment(ABC):
     def __init__(self, context: ctx, grid):
         self.context = context
         self.grid = grid
+        self.store = None  # Optional ResourceStore holding the passive resources in place of agents
+        self.occupancy = Occupancy(grid)  # Counts of the agents of each type placed in each cell of the grid
+        self.synchronizer = Synchronizer(grid, self.occupancy, Simulation.model.comm)  # Skips needless synchronizations
+        # Agents whose random step is deferred to the batched walk of the current step, if walks are batched
+        self.walkers = [] if Simulation.params.get('batched_walks', False) else None
 
     @staticmethod
     @abstractmethod
@@ -53,28 +62,250 @@ class GridEnvironment(ABC):
         the ids of the removed agents.
         :param removed_ids: A set with the ids of already removed agents.
         """
-        remove_agents = [agent for agent in self.context.agents()
-                         if isinstance(agent, self.agents_to_remove()) and getattr(agent, "toRemove", False)]
+        remove_agents = [agent for agent in self.context.take_flagged('toRemove')
+                         if isinstance(agent, self.agents_to_remove())]
         for agent in remove_agents:
             if agent.uid not in removed_ids and self.context.agent(agent.uid) is not None:
                 self.remove(agent)
                 removed_ids.add(agent.uid)
+        if self.store is not None:
+            self.store.remove_flagged(self.agents_to_remove())
 
     def make_agents_steps(self):
         """
         Let each agent in the environment perform its step.
         """
+        self.step_agents()
+        self.walk()
+        self.mark_changed()
+        if self.store is not None:
+            self.store.step()
+
+    def step_agents(self):
+        """
+        Calls the step method of each agent in the environment, in the order of the context.
+        """
         for agent in self.context.agents():
             agent.step()
 
+    def mark_changed(self):
+        """
+        Marks the agents of the environment as possibly changed since the last synchronization, so that their ghosts
+        are updated by the next one. Moves and removals through the environment are tracked without it.
+        """
+        self.synchronizer.changed()
+
     def synchronize(self, restore_agent):
         """
         Synchronize the agents in the environment.
+        The synchronization is skipped if no rank moved, removed or changed agents shared with the other ranks
+        since the last one, and always with a single rank.
+        Otherwise the occupancy layers are recomputed, as agents may have left for other ranks
+        and ghosts may have been placed in the buffer of the grid.
         """
+        if not self.synchronizer.needed():
+            return
         self.context.synchronize(restore_agent)
+        self.synchronizer.synchronized()
+        # Ghosts are not exposed by the context, so they are read from its agent manager
+        ghosts = [ghost.agent for ghost in self.context._agent_manager._ghost_agents.values()]
+        Simulation.model.ghost_cache.retain({uid for env in Simulation.model.envs.values()
+                                             for uid in env.context._agent_manager._ghost_agents})
+        self.occupancy.rebuild(self.grid, list(self.context.agents()) + ghosts)
+
+    def move(self, agent, pt):
+        """
+        Moves, or places, the given agent on the grid at the given point, updating the occupancy layers.
+        """
+        location = self.grid.get_location(agent)
+        if location is not None:
+            # Counted out before moving, as the grid updates the point of the location in place
+            self.occupancy.remove(agent, location)
+            self.synchronizer.touch(location)
+        location = self.grid.move(agent, pt)
+        if location is not None:
+            self.occupancy.add(agent, location)
+            self.synchronizer.touch(location)
+
+    def random_step(self, agent, nghs_coords: np.ndarray = None):
+        """
+        Moves, or places, the given agent on a random cell of the Moore neighbourhood of its point, itself included,
+        within the borders of the grid. With batched walks the move is deferred to the next walk of the environment.
+        :param agent: The agent, whose point is not None
+        :param nghs_coords: The coordinates of the neighbourhood of the agent, if already found
+        """
+        if self.walkers is not None:
+            self.walkers.append(agent)
+            return
+        if nghs_coords is None:
+            nghs_coords = Simulation.model.ngh_finder.find(agent.pt.x, agent.pt.y)
+        rand_pos = Simulation.model.draws.movement.choice(nghs_coords)
+        Simulation.model.move(agent, dpt(rand_pos[0], rand_pos[1]), self.NAME)
+
+    def walk(self):
+        """
+        Performs the random steps deferred since the last walk. The destinations of all the agents are drawn at once
+        from the neighbourhood table, and the occupancy layers and the synchronizer are updated in bulk, so that
+        only the moves on the grid are left to each agent.
+        """
+        if not self.walkers:
+            return
+        walkers, self.walkers = self.walkers, []
+        table, draws = Simulation.model.ngh_finder, Simulation.model.draws.movement
+        origins = np.array([(agent.pt.x, agent.pt.y) for agent in walkers], dtype=np.int64)
+        x, y = origins[:, 0], origins[:, 1]
+        in_table = (x >= table.x0) & (x <= table.x1) & (y >= table.y0) & (y <= table.y1)
+        cells = np.where(in_table, (x - table.x0) * table.height + (y - table.y0), 0)
+        starts, sizes = table.offsets[cells], table.offsets[cells + 1] - table.offsets[cells]
+        rows = starts + np.minimum((draws.random_array(len(walkers)) * sizes).astype(np.int64), sizes - 1)
+        destinations = table.table[rows, :2].tolist()
+        for i in np.flatnonzero(~in_table).tolist():
+            destinations[i] = draws.choice(table.find(x[i], y[i]))[:2].tolist()
+        self.move_all(walkers, [dpt(x, y) for x, y in destinations])
+
+    def move_all(self, agents: Sequence, points: Sequence[dpt]):
+        """
+        Moves, or places, the given agents on the grid at the given points and sets their points, as the move of the
+        model does for each of them, updating the occupancy layers and the synchronizer once for all the agents.
+        """
+        get_location, move = self.grid.get_location, self.grid.move
+        moved, old, placed, new = [], [], [], []
+        for agent, pt in zip(agents, points):
+            location = get_location(agent)
+            if location is not None:
+                # Read before moving, as the grid updates the point of the location in place
+                moved.append(agent)
+                old.append((location.x, location.y))
+            location = move(agent, pt)
+            agent.pt = pt
+            if location is not None:
+                placed.append(agent)
+                new.append((location.x, location.y))
+        old, new = np.array(old, dtype=np.int64).reshape(-1, 2), np.array(new, dtype=np.int64).reshape(-1, 2)
+        self.occupancy.remove_all(moved, old)
+        self.occupancy.add_all(placed, new)
+        self.synchronizer.touch_all(np.concatenate((old, new)))
+
+    def random_local_pts(self, count: int) -> np.ndarray:
+        """
+        Returns uniformly random points within the local bounds of the grid, drawn at once from the placement
+        generator of the rank, with the same draws of as many calls of get_random_local_pt of the grid with it.
+        :param count: The number of points
+        :return: An array with the coordinates of the points, one row per point
+        """
+        bounds = self.grid.get_local_bounds()
+        return Simulation.model.draws.placement.integers((bounds.xmin, bounds.ymin),
+                                                         (bounds.xmin + bounds.xextent, bounds.ymin + bounds.yextent),
+                                                         size=(count, 2))
+
+    def spawn_many(self, agent_class: type, count: int, subtype=None, positions: np.ndarray = None,
+                   placed: bool = True) -> List:
+        """
+        Adds new agents of the given class to the environment, with a block of new ids, as many calls of the
+        constructor, of context.add and of the move of the model would do one agent at a time. Resources kept in a
+        resource store, or in other forms than agents, are added there.
+        :param agent_class: The class of the new agents
+        :param count: The number of new agents
+        :param subtype: The subtype, or state, passed to the constructor of every agent, or a list with the one of each
+        agent, or None for the classes whose constructor takes none, like (local_id, rank, pt, context)
+        :param positions: The position of each agent, one row per agent, or None for random local points
+        :param placed: Whether the agents are also placed on the grid, or only added to the context
+        :return: The new agents, or an empty list if they are not kept as agents
+        """
+        if count <= 0:
+            return []
+        if positions is None:
+            positions = self.random_local_pts(count)
+        ids = Simulation.model.new_ids(count)
+        subtypes = subtype if isinstance(subtype, list) else [subtype] * count
+        if not self.holds_as_agents(agent_class):
+            self.add_resources(agent_class, ids, subtypes, positions, placed)
+            return []
+
+        points = [dpt(x, y) for x, y in positions.tolist()]
+        pools, rank = Simulation.model.pools, Simulation.model.rank
+        agents = [pools.create(agent_class, local_id, rank, pt, self.NAME) if agent_subtype is None else
+                  pools.create(agent_class, local_id, rank, agent_subtype, pt, self.NAME)
+                  for local_id, agent_subtype, pt in zip(ids, subtypes, points)]
+        for agent in agents:
+            self.context.add(agent)
+        if placed:
+            self.move_all(agents, points)
+        return agents
 
     def agents(self):
         return self.context.agents()
 
+    def agents_of_type(self, agent_type: int) -> tuple:
+        """
+        Returns the local agents of the given TYPE, in order of insertion, from the index of the context.
+        """
+        return self.context.agents_of_type(agent_type)
+
+    def agents_of_class(self, agent_class: type) -> tuple:
+        """
+        Returns the local agents of the given class and of its subclasses, from the index of the context.
+        """
+        return self.context.agents_of_class(agent_class)
+
+    def add_resource(self, agent_class: type, local_id: int, subtype, pt, placed: bool = False):
+        """
+        Adds a resource to the environment, either as a new agent of the given class or, when the environment
+        has a resource store for that class, as a new row of the store.
+        All resource classes share the constructor signature (local_id, rank, subtype, pt, context).
+        :param agent_class: The class of the resource agent
+        :param local_id: The local id of the resource
+        :param subtype: The subtype of the resource, like the SubstrateType of a substrate
+        :param pt: The position of the resource
+        :param placed: Whether the resource is also placed on the grid, or only added to the context
+        """
+        if self.store is not None and self.store.stores(agent_class):
+            self.store.add(local_id, agent_class.TYPE, subtype, pt, placed)
+            return
+        agent = Simulation.model.pools.create(agent_class, local_id, Simulation.model.rank, subtype, pt, self.NAME)
+        self.context.add(agent)
+        if placed:
+            Simulation.model.move(agent, pt, self.NAME)
+
+    def add_resources(self, agent_class: type, local_ids: Sequence[int], subtypes: Sequence, positions: np.ndarray,
+                      placed: bool = False):
+        """
+        Adds resources of a class that the environment does not represent as agents, as add_resource does for each
+        of them.
+        :param agent_class: The class of the resource agents
+        :param local_ids: The local id of each resource
+        :param subtypes: The subtype of each resource
+        :param positions: The position of each resource, one row per resource
+        :param placed: Whether the resources are immediately visible to the neighbourhood queries
+        """
+        self.store.add_many(local_ids, agent_class.TYPE, subtypes, positions, placed)
+
+    def find_resources(self, pt, wanted: dict) -> list:
+        """
+        Finds the resources in the Moore neighbourhood of the given point that are not represented as agents on the
+        grid, like the ones in the resource store, which are not marked for removal and are of the wanted types.
+        :param pt: The center of the neighbourhood
+        :param wanted: A dictionary from the wanted resource types to the collection of their wanted subtypes,
+        or to None if any subtype is wanted
+        :return: A list of handles to the found resources
+        """
+        return self.store.near(pt, wanted) if self.store is not None else []
+
+    def holds_as_agents(self, agent_class: type) -> bool:
+        """
+        Returns True if the resources of the given class are represented as agents on the grid of the environment.
+        """
+        return self.store is None or not self.store.stores(agent_class)
+
     def remove(self, agent):
-        self.context.remove(agent)
\ No newline at end of file
+        if self.store is not None and self.store.holds(agent):
+            self.store.remove(agent.index)
+        else:
+            location = self.grid.get_location(agent)
+            if location is not None:
+                self.occupancy.remove(agent, location)
+                self.synchronizer.touch(location)
+            self.context.remove(agent)
+            if agent.context == self.NAME:
+                # Not transferred to another environment, so it leaves the simulation
+                Simulation.model.pools.retire(agent)
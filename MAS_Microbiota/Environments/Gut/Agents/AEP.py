@@ -1,10 +1,9 @@
 from enum import IntEnum
-from typing import Tuple
 from repast4py.space import DiscretePoint as dpt
-import numpy as np
 from .Protein import Protein
 
 from MAS_Microbiota import Simulation
+from MAS_Microbiota.Utils import counted_attribute
 from ... import GridAgent
 
 class AEPState(IntEnum):
@@ -13,14 +12,14 @@ class AEPState(IntEnum):
 
 class AEP(GridAgent):
     TYPE = 0
+    __slots__ = ('_state',)
+    state = counted_attribute('state')
+    RECORD_FIELDS = (('state', 'B', AEPState),)
 
     def __init__(self, local_id: int, rank: int, pt: dpt, context):
         super().__init__(local_id=local_id, type=AEP.TYPE, rank=rank, pt=pt, context=context)
         self.state = AEPState.ACTIVE
 
-    def save(self) -> Tuple:
-        return (self.uid, int(self.state), self.pt.coordinates, self.context)
-
     # returns True if the agent is hyperactive, False otherwise
     def is_hyperactive(self):
         return self.state == AEPState.HYPERACTIVE
@@ -35,13 +34,13 @@ class AEP(GridAgent):
             if (self.is_hyperactive() == True):
                 self.cleave(protein)
         else:
-            random_index = np.random.randint(0, len(nghs_coords))
-            Simulation.model.move(self, dpt(nghs_coords[random_index][0], nghs_coords[random_index][1]), self.context)
+            Simulation.model.envs[self.context].random_step(self, nghs_coords)
 
     # returns the protein agent in the neighborhood of the agent
     def percepts(self, nghs_coords):
-        for ngh_coords in nghs_coords:
-            nghs_array = Simulation.model.envs['gut'].grid.get_agents(dpt(ngh_coords[0], ngh_coords[1]))
+        gut = Simulation.model.envs['gut']
+        for ngh_coords in gut.occupancy.occupied((Protein.TYPE,), nghs_coords):
+            nghs_array = gut.grid.get_agents(dpt(ngh_coords[0], ngh_coords[1]))
             for ngh in nghs_array:
                 if type(ngh) == Protein:
                     return ngh
@@ -1,6 +1,4 @@
-from typing import Tuple
 from repast4py.space import DiscretePoint as dpt
-import numpy as np
 
 from MAS_Microbiota import Simulation
 from MAS_Microbiota.Environments import GridAgent
@@ -9,6 +7,9 @@ from MAS_Microbiota.Environments.Gut.Agents import ProteinName
 
 class CleavedProtein(GridAgent):
     TYPE = 2
+    __slots__ = ('name', 'toAggregate', 'alreadyAggregate')
+    RECORD_FIELDS = (('name', 'B', ProteinName), ('toAggregate', '?', None), ('alreadyAggregate', '?', None),
+                     ('toRemove', '?', None))
 
     def __init__(self, local_id: int, rank: int, cleaved_protein_name: ProteinName, pt: dpt, context):
         super().__init__(local_id=local_id, type=CleavedProtein.TYPE, rank=rank, pt=pt, context=context)
@@ -17,18 +18,13 @@ class CleavedProtein(GridAgent):
         self.alreadyAggregate = False
         self.toRemove = False
 
-    def save(self) -> Tuple:
-        return (
-        self.uid, int(self.name), self.pt.coordinates, self.toAggregate, self.alreadyAggregate, self.toRemove, self.context)
-
     def step(self):
         if self.alreadyAggregate or self.toAggregate or self.pt is None:
             pass
         else:
             cleaved_nghs_number, _, nghs_coords = self.check_and_get_nghs()
             if cleaved_nghs_number == 0:
-                random_index = np.random.randint(0, len(nghs_coords))
-                Simulation.model.move(self, dpt(nghs_coords[random_index][0], nghs_coords[random_index][1]), self.context)
+                Simulation.model.envs[self.context].random_step(self, nghs_coords)
             elif cleaved_nghs_number >= 4:
                 self.change_state()
             else:
@@ -42,7 +38,7 @@ class CleavedProtein(GridAgent):
             else:
                 nghs_array = Simulation.model.envs['gut'].grid.get_agents(dpt(ngh_coords[0], ngh_coords[1]))
             for ngh in nghs_array:
-                if ngh is not None:
+                if isinstance(ngh, CleavedProtein):  # Other agents do not aggregate
                     ngh.alreadyAggregate = False
 
     def is_valid(self):
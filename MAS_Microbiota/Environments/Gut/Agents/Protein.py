@@ -1,5 +1,4 @@
 from enum import IntEnum
-from typing import Tuple
 from repast4py.space import DiscretePoint as dpt
 
 from MAS_Microbiota.Environments.ResourceAgent import ResourceAgent
@@ -11,15 +10,14 @@ class ProteinName(IntEnum):
 
 class Protein(ResourceAgent):
     TYPE = 1
+    __slots__ = ('name', 'toCleave')
+    RECORD_FIELDS = (('name', 'B', ProteinName), ('toCleave', '?', None)) + ResourceAgent.RECORD_FIELDS
 
     def __init__(self, local_id: int, rank: int, protein_name: ProteinName, pt: dpt, context):
         super().__init__(local_id=local_id, type=Protein.TYPE, rank=rank, pt=pt, context=context)
         self.name = protein_name
         self.toCleave = False
 
-    def save(self) -> Tuple:
-        return (self.uid, int(self.name), self.pt.coordinates, self.toCleave, self.toRemove, self.context)
-
     def step(self):
         self.random_movement()
 
@@ -1,5 +1,3 @@
-import numpy as np
-
 from .Agents import *
 from MAS_Microbiota import Simulation
 from MAS_Microbiota.AgentRestorer import restore_agent
@@ -27,7 +25,7 @@ class Gut(GridEnvironment):
         if (Simulation.model.microbiota_good_bacteria_count - Simulation.model.microbiota_pathogenic_bacteria_count
                 <= Simulation.params["microbiota_diversity_threshold"]):
             value_decreased = int((Simulation.params["epithelial_barrier"]["initial_impermeability"] *
-                                   np.random.randint(0, 6)) / 100)
+                                   Simulation.model.draws.inflammation.integers(0, 6)) / 100)
             if Simulation.model.epithelial_barrier_impermeability - value_decreased <= 0:
                 Simulation.model.epithelial_barrier_impermeability = 0
             else:
@@ -42,7 +40,7 @@ class Gut(GridEnvironment):
                     break
         else:
             if Simulation.model.epithelial_barrier_impermeability < Simulation.params["epithelial_barrier"]["initial_impermeability"]:
-                value_increased = int((Simulation.params["epithelial_barrier"]["initial_impermeability"] * np.random.randint(0, 4)) / 100)
+                value_increased = int((Simulation.params["epithelial_barrier"]["initial_impermeability"] * Simulation.model.draws.inflammation.integers(0, 4)) / 100)
                 if (Simulation.model.epithelial_barrier_impermeability + value_increased) <= Simulation.params["epithelial_barrier"]["initial_impermeability"]:
                     Simulation.model.epithelial_barrier_impermeability = Simulation.model.epithelial_barrier_impermeability + value_increased
 
@@ -53,9 +51,10 @@ class Gut(GridEnvironment):
 
     def step(self):
         removed_ids = set()
-        self.context.synchronize(restore_agent)
+        self.mark_changed()  # By the other environments and the model since the last step
+        self.synchronize(restore_agent)
         self.remove_agents(removed_ids)
-        self.context.synchronize(restore_agent)
+        self.synchronize(restore_agent)
         self.make_agents_steps()
 
         # Collect data and perform operations based on agent states
@@ -76,9 +75,10 @@ class Gut(GridEnvironment):
 
         self.move_oligomers_to_brain(oligomers_to_move)
         self.remove_proteins_and_add_cleaved_proteins(removed_ids, proteins_to_remove)
-        self.context.synchronize(restore_agent)
+        self.mark_changed()
+        self.synchronize(restore_agent)
         self.aggreagate_cleaved_proteins(removed_ids, all_true_cleaved_aggregates)
-        self.context.synchronize(restore_agent)
+        self.synchronize(restore_agent)
         self.remove_agents(removed_ids)
 
 
@@ -89,14 +89,14 @@ class Gut(GridEnvironment):
 
 
     def remove_proteins_and_add_cleaved_proteins(self, removed_ids, protein_to_remove):
+        cleaved_protein_names = []
         for agent in protein_to_remove:
             if agent.uid in removed_ids:
                 continue
-            protein_name = agent.name
+            cleaved_protein_names += [agent.name, agent.name]  # Each protein is cleaved in two
             Simulation.model.remove_agent(agent)
             removed_ids.add(agent.uid)
-            Simulation.model.gut_add_cleaved_protein(protein_name)
-            Simulation.model.gut_add_cleaved_protein(protein_name)
+        self.spawn_many(CleavedProtein, len(cleaved_protein_names), cleaved_protein_names)
 
 
     def aggreagate_cleaved_proteins(self, removed_ids, all_true_cleaved_aggregates):
@@ -116,6 +116,7 @@ class Gut(GridEnvironment):
                         else:
                             x.alreadyAggregate = False
                             x.toAggregate = False
+                            self.mark_changed()
                             cont += 1
                 Simulation.model.add_oligomer_protein(agent.name, 'gut')
                 Simulation.model.remove_agent(agent)
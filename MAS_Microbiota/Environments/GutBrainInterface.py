@@ -1,10 +1,13 @@
+from typing import Dict
+
+import numpy as np
 from repast4py import random
 from MAS_Microbiota import Simulation
 from MAS_Microbiota.Environments import GridAgent
 from MAS_Microbiota.Environments.Brain.Agents import Precursor, Neurotransmitter, Neuron
 from MAS_Microbiota.Environments.Brain.Brain import Brain
 from MAS_Microbiota.Environments.Gut.Agents import Oligomer
-from MAS_Microbiota.Environments.Microbiota.Agents import SCFA
+from MAS_Microbiota.Environments.Microbiota.Agents import SCFA, SCFAType
 
 
 class GutBrainInterface:
@@ -42,11 +45,11 @@ class GutBrainInterface:
         None
         
         """
-        if isinstance(agent, Oligomer):
+        if agent.TYPE == Oligomer.TYPE:
             self._transfer_to_brain(agent)
-        elif isinstance(agent, SCFA):
+        elif agent.TYPE == SCFA.TYPE:
             self._update_bbb_impermeability(agent)
-        elif isinstance(agent, Precursor):
+        elif agent.TYPE == Precursor.TYPE:
             if self._passes_through_bbb():
                 self._transfer_to_brain(agent)
 
@@ -59,11 +62,18 @@ class GutBrainInterface:
 
         :param neurotrans: The neurotransmitter agent to be transferred to the enteric nervous system.
         """
-        neurons = [n for n in Simulation.model.envs[Brain.NAME].context.agents() if isinstance(n, Neuron)]
+        brain = Simulation.model.envs[Brain.NAME]
+        neurons = brain.agents_of_type(Neuron.TYPE)
         if len(neurons) > 0:
             original_env_name = neurotrans.context
-            neuron = Simulation.model.rng.choice(neurons)
-            neuron.neurotrans_rate[neurotrans.neurotrans_type] += Simulation.params['neurotrans_rate_increase']
+            increase = Simulation.params['neurotrans_rate_increase']
+            if brain.neuron_engine is not None:
+                # The same draw of choice, as the rows of the engine follow the order of the neurons
+                brain.neuron_engine.stimulate(Simulation.model.draws.inputs.integers(0, len(neurons)),
+                                              neurotrans.neurotrans_type, increase)
+            else:
+                neuron = Simulation.model.draws.inputs.choice(neurons)
+                neuron.neurotrans_rate[neurotrans.neurotrans_type.index] += increase
             neurotrans.toRemove = False
             neurotrans.toMove = False
             self.envs[original_env_name].remove(neurotrans)
@@ -78,8 +88,13 @@ class GutBrainInterface:
         :param agent: The agent to be transferred to the brain.
         """
         original_env_name = agent.context
+        pt = self.envs[Brain.NAME].grid.get_random_local_pt(Simulation.model.draws.placement)
+        if self.envs[original_env_name].store is not None and self.envs[original_env_name].store.holds(agent):
+            # Stored resources are copied to the store of the brain, as they cannot change environment
+            self.envs[Brain.NAME].add_resource(agent.agent_class, agent.uid[0], agent.subtype, pt, placed=True)
+            self.envs[original_env_name].remove(agent)
+            return
         self.envs[Brain.NAME].context.add(agent)
-        pt = self.envs[Brain.NAME].grid.get_random_local_pt(Simulation.model.rng)
         Simulation.model.move(agent, pt, Brain.NAME)
         agent.context = Brain.NAME
         agent.toRemove = False
@@ -96,19 +111,41 @@ class GutBrainInterface:
 
         :param scfa: The SCFA agent that will be used to update the impermeability.
         """
-        self.bbb_impermeability += (scfa.BBB_impermeability_coefficient() *
+        self._change_bbb_impermeability(scfa.BBB_impermeability_coefficient())
+        scfa.toRemove = False
+        scfa.toMove = False
+        self.envs[scfa.context].remove(scfa)
+
+    def absorb_scfa(self, amounts: Dict[SCFAType, int]):
+        """
+        Updates the impermeability of the blood-brain barrier as if the given numbers of SCFA agents of each type
+        passed through the bloodstream. It is used when SCFAs are represented as concentration fields.
+        As with the agents, the units change the impermeability one at a time, in a random order of their types, and
+        the impermeability is limited after each of them.
+
+        :param amounts: The number of absorbed units of each SCFA type.
+        """
+        coefficients = np.repeat([scfa_type.bbb_impermeability_coefficient() for scfa_type in amounts],
+                                 list(amounts.values()))
+        order = Simulation.model.draws.inflammation.random_array(len(coefficients)).argsort()
+        for coefficient in coefficients[order].tolist():
+            self._change_bbb_impermeability(coefficient)
+
+    def _change_bbb_impermeability(self, coefficient: float):
+        """
+        Changes the impermeability of the blood-brain barrier by the given coefficient times the influence of SCFA
+        permeability on the BBB, limited to the minimum and maximum impermeability defined in the parameters.
+        """
+        self.bbb_impermeability += (coefficient *
                                     Simulation.params['blood_brain_barrier']['scfa_permeability_influence'])
         self.bbb_impermeability = max(Simulation.params['blood_brain_barrier']['minimum_impermeability'],
                                       min(Simulation.params['blood_brain_barrier']['maximum_impermeability'],
                                           self.bbb_impermeability)
                                       )
-        scfa.toRemove = False
-        scfa.toMove = False
-        self.envs[scfa.context].remove(scfa)
 
     def _passes_through_bbb(self) -> bool:
         """
         Check to determine if a Precursor agent can pass through the Blood-Brain Barrier.
         This is determined by the current impermeability of the BBB and a random check.
         """
-        return Simulation.model.rng.integers(0, 100) > self.bbb_impermeability
\ No newline at end of file
+        return Simulation.model.draws.movement.integers(0, 100) > self.bbb_impermeability
\ No newline at end of file
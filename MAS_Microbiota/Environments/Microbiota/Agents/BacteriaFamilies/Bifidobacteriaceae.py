@@ -8,6 +8,7 @@ from MAS_Microbiota.Environments.Microbiota.Agents.Substrate import SubstrateTyp
 
 
 class Bifidobacteriaceae(Bacterium):
+    __slots__ = ()
 
     def __init__(self, local_id: int, rank: int, pt: dpt, context: str):
         super().__init__(local_id=local_id, rank=rank, pt=pt, context=context)
@@ -7,6 +7,7 @@ from repast4py.space import DiscretePoint as dpt
 from MAS_Microbiota.Environments.Microbiota.Agents.Substrate import SubstrateType
 
 class Prevotellaceae(Bacterium):
+    __slots__ = ()
 
     def __init__(self, local_id: int, rank: int, pt: dpt, context: str):
         super().__init__(local_id=local_id, rank=rank, pt=pt, context=context)
@@ -1,5 +1,5 @@
 from abc import abstractmethod
-from typing import List, Type, Dict
+from typing import List, Type, Tuple
 from repast4py.space import DiscretePoint as dpt
 from MAS_Microbiota import Simulation
 import numpy as np
@@ -33,11 +33,16 @@ class Bacterium(GridAgent):
     """
     # if type is a parameter variable or an initialized constant still needs to be decided.
     TYPE: int = 99
+    FERMENTABLE: Tuple[Type[ResourceAgent], ...] = (Substrate, Precursor)  # One bit each in ferment_flags
+
+    __slots__ = ('rank', 'energy_level', 'toFission', 'ferment_flags', 'fermentedPrecursor')
+    RECORD_FIELDS = (('rank', 'i', None), ('energy_level', 'B', EnergyLevel), ('toFission', '?', None),
+                     ('ferment_flags', 'B', None), ('fermentedPrecursor', 'q', None), ('toRemove', '?', None))
 
     pt: dpt
     energy_level: EnergyLevel
     toFission: bool
-    toFerment: Dict[Type[ResourceAgent], bool]
+    ferment_flags: int
 
     def __init__(self, local_id: int, rank: int, pt: dpt, context: str):
         super().__init__(local_id=local_id, type=Bacterium.TYPE, rank=rank, pt=pt, context=context)
@@ -46,15 +51,14 @@ class Bacterium(GridAgent):
         self.energy_level = EnergyLevel[Simulation.params["bacteria_initial_state"]]
         self.toRemove: bool = False
         self.toFission: bool = False
-        self.toFerment: Dict[Type[ResourceAgent], bool] = {
-            Substrate: False,
-            Precursor: False
-        }
+        self.ferment_flags: int = 0  # Bits of the FERMENTABLE resource types the bacterium has fermented
         self.fermentedPrecursor: int = 0
 
-    def save(self):
-        return (self.uid, type(self), self.pt.coordinates, self.context, self.toFission, self.toFerment[Substrate],
-                self.toFerment[Precursor], self.fermentedPrecursor, self.toRemove, int(self.energy_level))
+    def to_ferment(self, fermentable_type: Type[ResourceAgent]) -> bool:
+        """
+        Returns True if the bacterium has fermented resources of the given type, so that their products are made.
+        """
+        return bool(self.ferment_flags & (1 << self.FERMENTABLE.index(fermentable_type)))
 
     def step(self) -> None:
         """
@@ -85,8 +89,9 @@ class Bacterium(GridAgent):
         :returns: A list of neighbouring Bacteria agents not marked for removal.
         """
         result = []
-        for ngh_coord in nghs_coords:
-            ngh_array = Simulation.model.envs['microbiota'].grid.get_agents(dpt(ngh_coord[0], ngh_coord[1]))
+        microbiota = Simulation.model.envs['microbiota']
+        for ngh_coord in microbiota.occupancy.occupied((Bacterium.TYPE,), nghs_coords):
+            ngh_array = microbiota.grid.get_agents(dpt(ngh_coord[0], ngh_coord[1]))
             for ngh in ngh_array:
                 if isinstance(ngh, Bacterium) and not ngh.toRemove:
                     result.append(ngh)
@@ -101,11 +106,21 @@ class Bacterium(GridAgent):
         :param nghs_coords: list of coordinates around this agent.
         :returns: A list of neighbouring Resource agents not marked for removal.
         """
-        result = []
-        for ngh_coord in nghs_coords:
-            ngh_array = Simulation.model.envs['microbiota'].grid.get_agents(dpt(ngh_coord[0], ngh_coord[1]))
+        microbiota = Simulation.model.envs['microbiota']
+        result = microbiota.find_resources(self.pt, {SCFA.TYPE: self.consumable_scfa(),
+                                                     Substrate.TYPE: self.fermentable_substrates(),
+                                                     Precursor.TYPE: self.fermentable_precursors()})
+        agent_classes = tuple(cls for cls in (SCFA, Substrate, Precursor) if microbiota.holds_as_agents(cls))
+        if len(agent_classes) == 0:
+            return result
+
+        wanted_keys = tuple([(SCFA.TYPE, scfa_type) for scfa_type in self.consumable_scfa()] +
+                            [(Substrate.TYPE, sub_type) for sub_type in self.fermentable_substrates()] +
+                            [(Precursor.TYPE, precursor_type) for precursor_type in self.fermentable_precursors()])
+        for ngh_coord in microbiota.occupancy.occupied(wanted_keys, nghs_coords):
+            ngh_array = microbiota.grid.get_agents(dpt(ngh_coord[0], ngh_coord[1]))
             for ngh in ngh_array:
-                if isinstance(ngh, (SCFA, Substrate, Precursor)) and not ngh.toRemove:
+                if isinstance(ngh, agent_classes) and not ngh.toRemove:
                     toAdd = False
                     if isinstance(ngh, SCFA):
                         toAdd = ngh.scfa_type in self.consumable_scfa()
@@ -141,16 +156,16 @@ class Bacterium(GridAgent):
 
         elif (self.can_ferment_substrates() and
               (EnergyLevel.NONE < self.energy_level < EnergyLevel.MAXIMUM) and
-              any(isinstance(item, Substrate) for item in percieved_resources)):
+              any(item.TYPE == Substrate.TYPE for item in percieved_resources)):
             self.ferment(Substrate, percieved_resources)
 
         elif (self.can_ferment_precursors() and
                 (EnergyLevel.NONE < self.energy_level < EnergyLevel.MAXIMUM) and
-                any(isinstance(item, Precursor) for item in percieved_resources)):
+                any(item.TYPE == Precursor.TYPE for item in percieved_resources)):
             self.ferment(Precursor, percieved_resources)
 
-        elif self.energy_level < EnergyLevel.MAXIMUM and any(isinstance(item, SCFA) for item in percieved_resources):
-            self.consume([ag for ag in percieved_resources if isinstance(ag, SCFA)])
+        elif self.energy_level < EnergyLevel.MAXIMUM and any(item.TYPE == SCFA.TYPE for item in percieved_resources):
+            self.consume([ag for ag in percieved_resources if ag.TYPE == SCFA.TYPE])
 
         elif (self.can_move() and self.energy_level > EnergyLevel.NONE and len(percieved_resources) == 0
                 and len(Simulation.model.envs['microbiota'].find_bact_free_nghs(self.pt)) != 0):
@@ -176,12 +191,12 @@ class Bacterium(GridAgent):
         :param fermentable_type: The type of fermentable resource agent.
         :param resources: The list of ResourceAgent agents in the vicinity of the Bacterium.
         """
-        fermentable_resources = [resource for resource in resources if isinstance(resource, fermentable_type)]
+        fermentable_resources = [resource for resource in resources if resource.TYPE == fermentable_type.TYPE]
         if len(fermentable_resources) > 0:
-            nutrient = Simulation.model.rng.choice(fermentable_resources)
+            nutrient = Simulation.model.draws.metabolism.choice(fermentable_resources)
             nutrient.toRemove = True
             self.update_energy(Simulation.params["bacteria_energy_deltas"]["ferment"])
-            self.toFerment[fermentable_type] = True
+            self.ferment_flags |= 1 << self.FERMENTABLE.index(fermentable_type)
             if fermentable_type == Precursor:
                 self.fermentedPrecursor = int(nutrient.precursor_type)
 
@@ -191,7 +206,7 @@ class Bacterium(GridAgent):
         :param scfas: The list of SCFA agents in the vicinity of the Bacterium.
         """
         if len(scfas) > 0:
-            resource = Simulation.model.rng.choice(scfas)
+            resource = Simulation.model.draws.metabolism.choice(scfas)
             resource.toRemove = True
             self.update_energy(Simulation.params["bacteria_energy_deltas"]["consume"])
 
@@ -213,7 +228,7 @@ class Bacterium(GridAgent):
         """
         free_nghs = Simulation.model.envs['microbiota'].find_bact_free_nghs(self.pt)
         if len(free_nghs) > 0:
-            rand_pos = Simulation.model.rng.choice(free_nghs)
+            rand_pos = Simulation.model.draws.movement.choice(free_nghs)
             chosen_dpt = dpt(rand_pos[0], rand_pos[1])
             Simulation.model.move(self, chosen_dpt, 'microbiota')
             self.update_energy(Simulation.params["bacteria_energy_deltas"]["move"])
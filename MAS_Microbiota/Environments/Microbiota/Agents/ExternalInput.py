@@ -1,5 +1,4 @@
 from enum import IntEnum
-from typing import Tuple
 from repast4py.space import DiscretePoint as dpt
 
 from MAS_Microbiota import Simulation
@@ -15,14 +14,13 @@ class ExternalInputType(IntEnum):
 class ExternalInput(GridAgent):
 
     TYPE = 4
+    __slots__ = ('input_type',)
+    RECORD_FIELDS = (('input_type', 'B', ExternalInputType),)
 
     def __init__(self, local_id: int, rank: int, input_type: ExternalInputType, pt: dpt, context):
         super().__init__(local_id=local_id, type=ExternalInput.TYPE, rank=rank, pt=pt, context=context)
         self.input_type = input_type
 
-    def save(self) -> Tuple:
-        return (self.uid, int(self.input_type), self.pt.coordinates, self.context)
-
     # External input step function
     def step(self):
         if (Simulation.model.epithelial_barrier_impermeability >=
@@ -52,9 +50,9 @@ class ExternalInput(GridAgent):
         to_remove = (
             int(((Simulation.model.microbiota_good_bacteria_count +
                   Simulation.model.microbiota_pathogenic_bacteria_count) *
-                         Simulation.model.rng.uniform(0, bacteria_factor)) / 100))
-        bacteria = [b for b in Simulation.model.envs['microbiota'].context.agents() if isinstance(b, Bacterium)]
-        for b in Simulation.model.rng.choice(bacteria, size=min(len(bacteria), to_remove), replace=False):
+                         Simulation.model.draws.inputs.uniform(0, bacteria_factor)) / 100))
+        bacteria = Simulation.model.envs['microbiota'].agents_of_type(Bacterium.TYPE)
+        for b in Simulation.model.draws.inputs.sample(bacteria, min(len(bacteria), to_remove)):
             b.toRemove = True
 
     def _boost_pathogenic_bacteria(self, bacteria_factor):
@@ -64,10 +62,9 @@ class ExternalInput(GridAgent):
         :param bacteria_factor: percentage of pathogenic bacteria to boost
         """
         to_boost = int((Simulation.model.microbiota_pathogenic_bacteria_count *
-                      Simulation.model.rng.uniform(0, bacteria_factor)) / 100)
-        pathogenic_bacteria = [b for b in Simulation.model.envs['microbiota'].context.agents() if
-                               isinstance(b, Bacterium) and b.causes_inflammation()]
+                      Simulation.model.draws.inputs.uniform(0, bacteria_factor)) / 100)
+        pathogenic_bacteria = Simulation.model.envs['microbiota'].pathogenic_bacteria()
         if len(pathogenic_bacteria) > 0:
             for _ in range(to_boost):
-                b = Simulation.model.rng.choice(pathogenic_bacteria)
-                b.enegy_level = EnergyLevel.MAXIMUM
\ No newline at end of file
+                b = Simulation.model.draws.inputs.choice(pathogenic_bacteria)
+                b.energy_level = EnergyLevel.MAXIMUM
\ No newline at end of file
@@ -1,6 +1,6 @@
 from enum import Enum, IntEnum
-from typing import Tuple
 from repast4py.space import DiscretePoint as dpt
+from MAS_Microbiota.Environments.GridAgent import flag_attribute
 from MAS_Microbiota.Environments.ResourceAgent import ResourceAgent
 
 class SCFAType(IntEnum):
@@ -8,18 +8,21 @@ class SCFAType(IntEnum):
     BUTYRATE = 2
     PROPIONATE = 3
 
+    def bbb_impermeability_coefficient(self):
+        return -1 if self == SCFAType.BUTYRATE else 1
+
 class SCFA(ResourceAgent):
     TYPE = 10
+    SUBTYPE_ATTRIBUTE = 'scfa_type'
+    __slots__ = ('scfa_type',)
+    toRemove = flag_attribute('toRemove', counted=True)  # SCFAs marked for removal are not counted
+    RECORD_FIELDS = (('scfa_type', 'B', SCFAType),) + ResourceAgent.RECORD_FIELDS
 
     def __init__(self, local_id: int, rank: int, scfa_type: SCFAType, pt: dpt, context):
         super().__init__(local_id=local_id, type=self.TYPE, rank=rank, pt=pt, context=context)
         self.scfa_type = scfa_type
 
 
-    def save(self) -> Tuple:
-        return (self.uid, int(self.scfa_type), self.pt.coordinates, self.context, self.toRemove)
-
-
     def step(self):
         self.random_movement()
         self.check_if_to_move(permeability_check=False)
@@ -29,7 +32,7 @@ class SCFA(ResourceAgent):
         Provides a positive or negative coefficient representing the effect of the SCFA on the Blood-Brain Barrier.
         :return: 1 if the SCFA improves BBB impermeability, -1 otherwise
         """
-        return -1 if self.scfa_type == SCFAType.BUTYRATE else 1
+        return self.scfa_type.bbb_impermeability_coefficient()
 
     def neuroinflammation_coefficient(self):
         """
@@ -1,4 +1,3 @@
-from typing import Tuple
 from repast4py.space import DiscretePoint as dpt
 from enum import IntEnum
 
@@ -12,6 +11,9 @@ class SubstrateType(IntEnum):
 
 class Substrate(ResourceAgent):
     TYPE = 9
+    SUBTYPE_ATTRIBUTE = 'sub_type'
+    __slots__ = ('sub_type', 'age')
+    RECORD_FIELDS = (('sub_type', 'B', SubstrateType), ('age', 'q', None)) + ResourceAgent.RECORD_FIELDS
 
     def __init__(self, local_id: int, rank: int, sub_type: SubstrateType, pt: dpt, context):
         super().__init__(local_id=local_id, type=self.TYPE, rank=rank, pt=pt, context=context)
@@ -19,10 +21,6 @@ class Substrate(ResourceAgent):
         self.age = 0
 
 
-    def save(self) -> Tuple:
-        return (self.uid, int(self.sub_type), self.pt.coordinates, self.context, self.toRemove)
-
-
     def step(self):
         self.random_movement()
         self.age += 1
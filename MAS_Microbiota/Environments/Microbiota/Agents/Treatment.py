@@ -1,5 +1,4 @@
 from enum import IntEnum
-from typing import Tuple
 from repast4py.space import DiscretePoint as dpt
 import numpy as np
 
@@ -15,6 +14,8 @@ class TreatmentType(IntEnum):
 class Treatment(GridAgent):
 
     TYPE = 5
+    __slots__ = ('treatment_type',)
+    RECORD_FIELDS = (('treatment_type', 'B', TreatmentType),)
 
     PROBIOTICS_BACTERIA = [Bifidobacteriaceae, Lachnospiraceae]
 
@@ -22,9 +23,6 @@ class Treatment(GridAgent):
         super().__init__(local_id=local_id, type=Treatment.TYPE, rank=rank, pt=pt, context=context)
         self.treatment_type = treatment_type
 
-    def save(self) -> Tuple:
-        return (self.uid, int(self.treatment_type), self.pt.coordinates, self.context)
-
     # Treatment step function
     def step(self):
         if Simulation.model.epithelial_barrier_impermeability < Simulation.model.epithelial_barrier_permeability_threshold_start:
@@ -49,9 +47,10 @@ class Treatment(GridAgent):
         :param probiotics_factor: percentage of good bacteria to introduce
         """
         to_add = int((Simulation.model.microbiota_good_bacteria_count *
-                      Simulation.model.rng.uniform(0, probiotics_factor)) / 100)
-        for _ in range(to_add):
-            bacteria_class = Simulation.model.rng.choice(self.PROBIOTICS_BACTERIA)
-            random_pt = Simulation.model.envs['microbiota'].grid.get_random_local_pt(Simulation.model.rng)
-            bacterium_to_add = bacteria_class(Simulation.model.new_id(), Simulation.model.rank, random_pt, self.context)
-            Simulation.model.envs['microbiota'].bacteria_to_add.append(bacterium_to_add)
\ No newline at end of file
+                      Simulation.model.draws.inputs.uniform(0, probiotics_factor)) / 100)
+        microbiota = Simulation.model.envs['microbiota']
+        bacteria_classes = [Simulation.model.draws.inputs.choice(self.PROBIOTICS_BACTERIA) for _ in range(to_add)]
+        random_pts = microbiota.random_local_pts(to_add).tolist()
+        for bacteria_class, local_id, (x, y) in zip(bacteria_classes, Simulation.model.new_ids(to_add), random_pts):
+            bacterium_to_add = bacteria_class(local_id, Simulation.model.rank, dpt(x, y), self.context)
+            microbiota.bacteria_to_add.append(bacterium_to_add)
\ No newline at end of file
@@ -0,0 +1,455 @@
+from itertools import islice
+from typing import Dict, List
+
+import numba
+import numpy as np
+from repast4py.space import DiscretePoint as dpt
+
+from MAS_Microbiota import Simulation
+from MAS_Microbiota.Environments.Brain.Agents.Precursor import Precursor, PrecursorType
+from MAS_Microbiota.Environments.Microbiota.Agents import *
+from MAS_Microbiota.Environments.Microbiota.ConcentrationField import FieldUnit
+
+# Energy levels and actions of the decision kernel
+_MAXIMUM, _HIGH = int(EnergyLevel.MAXIMUM), int(EnergyLevel.HIGH)
+FISSION, FERMENT_SUBSTRATE, FERMENT_PRECURSOR, CONSUME, MOVE, BACTERIOCINS, IDLE = range(7)
+
+# Sources of the resource units of the kernel
+_AGENT, _STORE, _FIELD = 0, 1, 2
+_NEVER = np.iinfo(np.int64).max
+_ALWAYS = (-1, _NEVER)  # Range of the orders of the bacteria finding a unit
+
+
+@numba.jit(nopython=True)
+def _units_near(table, start, end, xmin, ymin, width, height, unit_starts, unit_kinds, unit_counts, unit_ranges,
+                order, mask):
+    total = 0
+    for r in range(start, end):
+        x, y = table[r, 0] - xmin, table[r, 1] - ymin
+        if x < 0 or x >= width or y < 0 or y >= height:
+            continue
+        cell = x * height + y
+        for u in range(unit_starts[cell], unit_starts[cell + 1]):
+            if (1 << unit_kinds[u]) & mask and unit_ranges[u, 0] < order < unit_ranges[u, 1]:
+                total += unit_counts[u]
+    return total
+
+
+@numba.jit(nopython=True)
+def _take_unit(table, start, end, xmin, ymin, width, height, unit_starts, unit_kinds, unit_counts, unit_ranges,
+               unit_twins, order, mask, total, u):
+    target = min(int(u * total), total - 1)
+    for r in range(start, end):
+        x, y = table[r, 0] - xmin, table[r, 1] - ymin
+        if x < 0 or x >= width or y < 0 or y >= height:
+            continue
+        cell = x * height + y
+        for unit in range(unit_starts[cell], unit_starts[cell + 1]):
+            if (1 << unit_kinds[unit]) & mask and unit_ranges[unit, 0] < order < unit_ranges[unit, 1]:
+                if target < unit_counts[unit]:
+                    unit_counts[unit] -= 1
+                    if unit_twins[unit] >= 0:
+                        unit_counts[unit_twins[unit]] -= 1
+                    return unit
+                target -= unit_counts[unit]
+    return -1
+
+
+@numba.jit(nopython=True)
+def _decide(table, offsets, x0, y0, table_height, xmin, ymin, width, height,
+            xs, ys, cells, removed_at, heads, nexts, counts,
+            orders, families, energies, fissions, flags, fermented, actions, taken,
+            unit_starts, unit_kinds, unit_counts, unit_ranges, unit_twins, kind_subtypes,
+            substrate_masks, precursor_masks, scfa_masks, movers, releasers,
+            deltas, threshold, metabolism_draws, movement_draws):
+    """
+    Decides and performs the action of each local bacterium in turn, like its perform_action method.
+    The bacteria are the rows of xs, ys, cells and removed_at, local ones first, and the cells of the occupancy
+    region hold linked lists of the placed bacteria (heads and nexts) and their number (counts). A bacterium is
+    marked for removal for the bacteria whose order is after its removed_at. The resource units
+    available to the bacteria are grouped by cell, from unit_starts[cell] to unit_starts[cell + 1], each with its
+    kind and its number of units, and are found only by the bacteria whose order is strictly within their range.
+    Taking a unit also takes one of its twin group, if any, namely the other position of the same resource agent.
+    """
+    free = np.empty(9, dtype=np.int64)
+    for i in range(len(families)):
+        cell_id = (xs[i] - x0) * table_height + (ys[i] - y0)
+        start, end = offsets[cell_id], offsets[cell_id + 1]
+        family, order = families[i], orders[i]
+        substrates, precursors, scfas = substrate_masks[family], precursor_masks[family], scfa_masks[family]
+        n_substrates = _units_near(table, start, end, xmin, ymin, width, height, unit_starts, unit_kinds,
+                                   unit_counts, unit_ranges, order, substrates)
+        n_precursors = _units_near(table, start, end, xmin, ymin, width, height, unit_starts, unit_kinds,
+                                   unit_counts, unit_ranges, order, precursors)
+        n_scfas = _units_near(table, start, end, xmin, ymin, width, height, unit_starts, unit_kinds,
+                              unit_counts, unit_ranges, order, scfas)
+        n_resources = n_substrates + n_precursors + n_scfas
+        level = energies[i]
+
+        n_free = 0
+        if movers[family] and level > 0 and n_resources == 0:
+            for r in range(start, end):
+                x, y = table[r, 0] - xmin, table[r, 1] - ymin
+                if 0 <= x < width and 0 <= y < height and counts[x * height + y] == 0:
+                    free[n_free] = x * height + y
+                    n_free += 1
+
+        n_bacteria = 0
+        if releasers[family] and level >= _HIGH and n_resources == 0:
+            for r in range(start, end):
+                x, y = table[r, 0] - xmin, table[r, 1] - ymin
+                if 0 <= x < width and 0 <= y < height:
+                    j = heads[x * height + y]
+                    while j >= 0:
+                        if removed_at[j] >= order:
+                            n_bacteria += 1
+                        j = nexts[j]
+
+        if level == _MAXIMUM and n_resources > 0:
+            action = FISSION
+            fissions[i] = True
+        elif substrates != 0 and 0 < level < _MAXIMUM and n_substrates > 0:
+            action = FERMENT_SUBSTRATE
+            taken[i] = _take_unit(table, start, end, xmin, ymin, width, height, unit_starts, unit_kinds,
+                                  unit_counts, unit_ranges, unit_twins, order, substrates, n_substrates,
+                                  metabolism_draws[i])
+            flags[i] |= 1
+        elif precursors != 0 and 0 < level < _MAXIMUM and n_precursors > 0:
+            action = FERMENT_PRECURSOR
+            taken[i] = _take_unit(table, start, end, xmin, ymin, width, height, unit_starts, unit_kinds,
+                                  unit_counts, unit_ranges, unit_twins, order, precursors, n_precursors,
+                                  metabolism_draws[i])
+            flags[i] |= 2
+            fermented[i] = kind_subtypes[unit_kinds[taken[i]]]
+        elif level < _MAXIMUM and n_scfas > 0:
+            action = CONSUME
+            taken[i] = _take_unit(table, start, end, xmin, ymin, width, height, unit_starts, unit_kinds,
+                                  unit_counts, unit_ranges, unit_twins, order, scfas, n_scfas,
+                                  metabolism_draws[i])
+        elif n_free > 0:
+            action = MOVE
+            destination = free[min(int(movement_draws[i] * n_free), n_free - 1)]
+            if cells[i] >= 0:
+                counts[cells[i]] -= 1
+                if heads[cells[i]] == i:
+                    heads[cells[i]] = nexts[i]
+                else:
+                    j = heads[cells[i]]
+                    while nexts[j] != i:
+                        j = nexts[j]
+                    nexts[j] = nexts[i]
+            cells[i] = destination
+            counts[destination] += 1
+            nexts[i] = heads[destination]
+            heads[destination] = i
+            xs[i] = destination // height + xmin
+            ys[i] = destination % height + ymin
+        elif releasers[family] and level >= _HIGH and n_resources == 0 and n_bacteria >= threshold:
+            action = BACTERIOCINS
+            for r in range(start, end):
+                x, y = table[r, 0] - xmin, table[r, 1] - ymin
+                if 0 <= x < width and 0 <= y < height:
+                    j = heads[x * height + y]
+                    while j >= 0:
+                        removed_at[j] = min(removed_at[j], order)
+                        j = nexts[j]
+        else:
+            action = IDLE
+        actions[i] = action
+
+        level += deltas[action]
+        if level < 0:
+            removed_at[i] = min(removed_at[i], order)
+        energies[i] = max(0, min(_MAXIMUM, level))
+
+
+class BacteriaEngine:
+    """
+    Compiled engine of the decisions of the bacteria of the microbiota, used in place of their step methods.
+
+    At each step the state of the local bacteria, namely their family, energy level, position and flags, is gathered
+    in arrays together with the bacteria placed in every cell of the occupancy region, ghosts included, and with the
+    units of the resources the bacteria can find: the resource agents and the rows of the resource store not marked
+    for removal, and the units of the concentration fields. A single compiled pass then evaluates fission,
+    fermentation, consumption, movement, bacteriocins and idling for each bacterium in the order of the context, with
+    the same rules and the same traits of the families, and updates the arrays as the perceptions of the following
+    bacteria would change. Finally the results are written back to the agents, the moved bacteria are placed on the
+    grid and the chosen resources and the killed bacteria are marked for removal.
+
+    Unlike the agents, bacteria choose among the units of the concentration fields in proportion to their amounts
+    rather than among their subtypes, and fission finds the free neighbouring cells after all the bacteria of the step
+    have moved.
+    """
+
+    KINDS = ([(SCFA.TYPE, subtype) for subtype in SCFAType] +
+             [(Substrate.TYPE, subtype) for subtype in SubstrateType] +
+             [(Precursor.TYPE, subtype) for subtype in PrecursorType])
+    LEVELS = tuple(EnergyLevel)
+
+    def __init__(self, env):
+        """
+        :param env: The microbiota environment of the bacteria
+        """
+        self.env = env
+        self.kind_of = {key: kind for kind, key in enumerate(self.KINDS)}
+        self.kind_subtypes = np.array([int(subtype) for _, subtype in self.KINDS], dtype=np.int64)
+        # Kind of the stored resources of each type, indexed by their subtype
+        self.store_kinds = {agent_type: np.array([self.kind_of.get((agent_type, value), -1) for value in range(16)],
+                                                 dtype=np.int64)
+                            for agent_type in (SCFA.TYPE, Substrate.TYPE, Precursor.TYPE)}
+        self.families: Dict[type, int] = {}
+        self.substrate_masks, self.precursor_masks, self.scfa_masks = [], [], []
+        self.movers, self.releasers = [], []
+
+    def family(self, bacterium_class: type) -> int:
+        """
+        Returns the index of the given family of bacteria, reading its traits from the family class the first time.
+        """
+        family = self.families.get(bacterium_class)
+        if family is None:
+            family = self.families[bacterium_class] = len(self.families)
+            probe = bacterium_class.__new__(bacterium_class)
+            self.substrate_masks.append(self._mask(Substrate.TYPE, probe.fermentable_substrates()))
+            self.precursor_masks.append(self._mask(Precursor.TYPE, probe.fermentable_precursors()))
+            self.scfa_masks.append(self._mask(SCFA.TYPE, probe.consumable_scfa()))
+            self.movers.append(probe.can_move())
+            self.releasers.append(probe.can_release_bacteriocins())
+        return family
+
+    def _mask(self, agent_type: int, subtypes: List) -> int:
+        mask = 0
+        for subtype in subtypes:
+            mask |= 1 << self.kind_of[(agent_type, subtype)]
+        return mask
+
+    def step_in_order(self):
+        """
+        Performs the step of the other local agents of the environment and then the one of all the local bacteria,
+        as if all the agents stepped in the order of the context. The bacteria find each resource agent where it
+        was before its step if they come before it in that order, and where it is after its step otherwise, and
+        likewise find the bacteria marked for removal by the other agents only if they come after them.
+        """
+        env = self.env
+        resources = self._resources()
+        before = dict(zip((agent.uid for agent in resources), self._cells(resources)))
+        removals = {}
+        queue = env.context.flagged['toRemove']
+        for agent in env.context.agents():
+            if agent.TYPE == Bacterium.TYPE:
+                continue
+            flagged = len(queue)
+            agent.step()
+            # The queue of the flag only grows while the agents step, so the new entries are the last ones
+            for removed in islice(reversed(queue.values()), len(queue) - flagged):
+                if removed.TYPE == Bacterium.TYPE:
+                    removals.setdefault(removed.uid, env.context.order(agent))
+        self.step(before, removals)
+
+    def _resources(self) -> list:
+        """
+        Returns the local resource agents the bacteria can find.
+        """
+        env = self.env
+        return [agent for cls in (SCFA, Substrate, Precursor) if env.holds_as_agents(cls)
+                for agent in env.agents_of_class(cls)]
+
+    def _cells(self, agents: list) -> List[int]:
+        """
+        Returns the cell of the occupancy region of each of the given agents, or -1 if it is not placed in the region
+        or is marked for removal.
+        """
+        occupancy, get_location = self.env.occupancy, self.env.grid.get_location
+        xmin, ymin = occupancy.xmin, occupancy.ymin
+        width, height = occupancy.shape
+        cells = []
+        for agent in agents:
+            location = None if agent.toRemove else get_location(agent)
+            if location is None:
+                cells.append(-1)
+                continue
+            x, y = location.x - xmin, location.y - ymin
+            cells.append(x * height + y if 0 <= x < width and 0 <= y < height else -1)
+        return cells
+
+    def step(self, before: Dict[tuple, int] = None, removals: Dict[tuple, int] = None):
+        """
+        Performs the step of all the local bacteria of the environment.
+        :param before: The cells of the local resource agents before the other agents of the environment stepped,
+        if they did, see step_in_order
+        :param removals: The order of the agents that marked each bacterium for removal while stepping, if any
+        """
+        env = self.env
+        occupancy, table = env.occupancy, Simulation.model.ngh_finder
+        xmin, ymin = occupancy.xmin, occupancy.ymin
+        width, height = occupancy.shape
+        local = env.agents_of_type(Bacterium.TYPE)
+        if len(local) == 0:
+            return
+        ghosts = [ghost.agent for ghost in env.context._agent_manager._ghost_agents.values()]
+        bacteria = list(local) + [agent for agent in ghosts if isinstance(agent, Bacterium)]
+
+        # Positions of the bacteria and linked lists of the bacteria placed in each cell
+        n = len(bacteria)
+        xs, ys = np.empty(n, dtype=np.int64), np.empty(n, dtype=np.int64)
+        cells = np.full(n, -1, dtype=np.int64)
+        was_removed = np.empty(n, dtype=np.bool_)
+        for i, bacterium in enumerate(bacteria):
+            location = env.grid.get_location(bacterium)
+            pt = bacterium.pt if location is None else location
+            xs[i], ys[i] = pt.x, pt.y
+            if location is not None:
+                cells[i] = (pt.x - xmin) * height + pt.y - ymin
+            was_removed[i] = bacterium.toRemove
+        removed_at = np.where(was_removed, -1, _NEVER)
+        for i, bacterium in enumerate(bacteria[:len(local)]):
+            if removals and bacterium.uid in removals:
+                removed_at[i] = removals[bacterium.uid]
+        heads = np.full(width * height, -1, dtype=np.int64)
+        nexts = np.full(n, -1, dtype=np.int64)
+        for i in np.flatnonzero(cells >= 0)[::-1].tolist():
+            nexts[i] = heads[cells[i]]
+            heads[cells[i]] = i
+        counts = np.bincount(cells[cells >= 0], minlength=width * height).astype(np.int64)
+
+        # Local bacteria
+        m = len(local)
+        orders = np.array([env.context.order(bacterium) for bacterium in local], dtype=np.int64)
+        families = np.array([self.family(type(bacterium)) for bacterium in local], dtype=np.int64)
+        energies = np.array([int(bacterium.energy_level) for bacterium in local], dtype=np.int64)
+        fissions = np.array([bacterium.toFission for bacterium in local], dtype=np.bool_)
+        flags = np.array([bacterium.ferment_flags for bacterium in local], dtype=np.int64)
+        fermented = np.array([bacterium.fermentedPrecursor for bacterium in local], dtype=np.int64)
+        actions = np.empty(m, dtype=np.int64)
+        taken = np.full(m, -1, dtype=np.int64)
+
+        units = self._units(ghosts, before, xmin, ymin, width, height)
+        unit_cells, unit_starts, unit_kinds, unit_counts, unit_ranges, unit_twins = units[:6]
+        energy_deltas = Simulation.params["bacteria_energy_deltas"]
+        deltas = np.zeros(7, dtype=np.int64)
+        deltas[[FISSION, FERMENT_SUBSTRATE, FERMENT_PRECURSOR, CONSUME, MOVE, BACTERIOCINS, IDLE]] = [
+            energy_deltas["fission"], energy_deltas["ferment"], energy_deltas["ferment"], energy_deltas["consume"],
+            energy_deltas["move"], energy_deltas["bacteriocins"], energy_deltas["idle"]]
+
+        _decide(table.table, table.offsets, table.x0, table.y0, table.height, xmin, ymin, width, height,
+                xs, ys, cells, removed_at, heads, nexts, counts,
+                orders, families, energies, fissions, flags, fermented, actions, taken,
+                unit_starts, unit_kinds, unit_counts, unit_ranges, unit_twins, self.kind_subtypes,
+                np.array(self.substrate_masks, dtype=np.int64), np.array(self.precursor_masks, dtype=np.int64),
+                np.array(self.scfa_masks, dtype=np.int64), np.array(self.movers, dtype=np.bool_),
+                np.array(self.releasers, dtype=np.bool_), deltas, Simulation.params["bacteriocins_threshold"],
+                Simulation.model.draws.metabolism.random_array(m), Simulation.model.draws.movement.random_array(m))
+
+        # Results written back to the agents
+        for bacterium, level, fission, flag, precursor in zip(local, energies.tolist(), fissions.tolist(),
+                                                              flags.tolist(), fermented.tolist()):
+            bacterium.energy_level = self.LEVELS[level]
+            bacterium.toFission = fission
+            bacterium.ferment_flags = flag
+            bacterium.fermentedPrecursor = precursor
+        for i in np.flatnonzero(actions == MOVE).tolist():
+            Simulation.model.move(local[i], dpt(int(xs[i]), int(ys[i])), env.NAME)
+        for i in np.flatnonzero((removed_at < _NEVER) & ~was_removed).tolist():
+            bacteria[i].toRemove = True
+        for unit in taken[taken >= 0].tolist():
+            self._handle(unit, units, xmin, ymin, height).toRemove = True
+
+    def _units(self, ghosts: list, before: Dict[tuple, int], xmin: int, ymin: int, width: int, height: int) -> tuple:
+        """
+        Gathers the units of the resources the bacteria can find in the cells of the occupancy region, grouped by
+        cell. Each resource agent and stored resource is a unit, while each cell of a concentration field holds as
+        many units of each subtype as its concentration. With a snapshot, a local resource agent that moved is a
+        unit in both its cells, found by the bacteria before and after it in the order of the context respectively.
+        :return: The cell, kind, count, range of orders, twin, source and reference of each group of units sorted by
+        cell, the start of the groups of each cell, and the resource agents referenced by the groups
+        """
+        env = self.env
+        parts = []
+        handles = []
+        agent_classes = tuple(cls for cls in (SCFA, Substrate, Precursor) if env.holds_as_agents(cls))
+        if agent_classes:
+            agent_cells, agent_kinds, agent_ranges, agent_refs = [], [], [], []
+            resources = self._resources() + [agent for agent in ghosts if isinstance(agent, agent_classes)]
+            for agent, cell in zip(resources, self._cells(resources)):
+                previous = cell if before is None else before.get(agent.uid, cell)
+                if cell < 0 and previous < 0:
+                    continue
+                kind = self.kind_of[(agent.TYPE, getattr(agent, agent.SUBTYPE_ATTRIBUTE))]
+                if previous == cell:
+                    agent_cells.append(cell)
+                    agent_ranges.append(_ALWAYS)
+                else:
+                    order = env.context.order(agent)
+                    agent_cells += [cell, previous]
+                    agent_ranges += [(order, _ALWAYS[1]), (_ALWAYS[0], order)]
+                    agent_kinds.append(kind)
+                    agent_refs.append(len(handles))
+                agent_kinds.append(kind)
+                agent_refs.append(len(handles))
+                handles.append(agent)
+            agent_cells = np.array(agent_cells, dtype=np.int64)
+            n = len(agent_cells)
+            # The two units of a moved agent are consecutive, and the twin of each one is the other
+            twins = np.full(n, -1, dtype=np.int64)
+            refs = np.array(agent_refs, dtype=np.int64)
+            pairs = np.flatnonzero(refs[1:] == refs[:-1])
+            twins[pairs], twins[pairs + 1] = pairs + 1, pairs
+            parts.append((agent_cells, np.array(agent_kinds, dtype=np.int64), np.ones(n, dtype=np.int64),
+                          np.array(agent_ranges, dtype=np.int64).reshape(n, 2), twins,
+                          np.full(n, _AGENT, dtype=np.int64), refs))
+
+        store = env.store
+        if store is not None:
+            n = store.size
+            rows = np.flatnonzero(store.alive[:n] & store.placed[:n] & ~store.to_remove[:n])
+            kinds = np.full(len(rows), -1, dtype=np.int64)
+            for agent_type, store_kinds in self.store_kinds.items():
+                of_type = store.types[rows] == agent_type
+                kinds[of_type] = store_kinds[store.subtypes[rows][of_type].astype(np.int64)]
+            x, y = store.x[rows].astype(np.int64) - xmin, store.y[rows].astype(np.int64) - ymin
+            valid = (kinds >= 0) & (x >= 0) & (x < width) & (y >= 0) & (y < height)
+            n = np.count_nonzero(valid)
+            parts.append((x[valid] * height + y[valid], kinds[valid], np.ones(n, dtype=np.int64),
+                          np.tile(_ALWAYS, (n, 1)), np.full(n, -1, dtype=np.int64),
+                          np.full(n, _STORE, dtype=np.int64), rows[valid].astype(np.int64)))
+
+        for index, field in enumerate((env.fields or {}).values()):
+            subtypes, fx, fy = np.nonzero(field.values)
+            x, y = fx + field.xmin - xmin, fy + field.ymin - ymin
+            kinds = np.array([self.kind_of[(field.agent_class.TYPE, subtype)] for subtype in field.subtypes],
+                             dtype=np.int64)[subtypes]
+            n = len(kinds)
+            parts.append((x * height + y, kinds, field.values[subtypes, fx, fy].astype(np.int64),
+                          np.tile(_ALWAYS, (n, 1)), np.full(n, -1, dtype=np.int64),
+                          np.full(n, _FIELD + index, dtype=np.int64), subtypes.astype(np.int64)))
+
+        if not parts:
+            parts.append((*(np.zeros(0, dtype=np.int64) for _ in range(3)), np.zeros((0, 2), dtype=np.int64),
+                          *(np.zeros(0, dtype=np.int64) for _ in range(3))))
+        unit_cells, unit_kinds, unit_counts, unit_ranges, unit_twins, sources, refs = \
+            (np.concatenate(arrays) for arrays in zip(*parts))
+        # Units outside the region, namely the positions of the agents before or after leaving it, are dropped
+        keep = np.flatnonzero(unit_cells >= 0)
+        order = keep[np.argsort(unit_cells[keep], kind='stable')]
+        position = np.full(len(unit_cells), -1, dtype=np.int64)
+        position[order] = np.arange(len(order))
+        unit_twins = np.where(unit_twins >= 0, position[np.maximum(unit_twins, 0)], -1)
+        unit_starts = np.searchsorted(unit_cells[order], np.arange(width * height + 1)).astype(np.int64)
+        return (unit_cells[order], unit_starts, unit_kinds[order], unit_counts[order], unit_ranges[order],
+                unit_twins[order], sources[order], refs[order], handles)
+
+    def _handle(self, unit: int, units: tuple, xmin: int, ymin: int, height: int):
+        """
+        Returns a handle to one resource of the given group of units, whose marking for removal removes it.
+        """
+        unit_cells, _, _, _, _, _, sources, refs, handles = units
+        source, ref = int(sources[unit]), int(refs[unit])
+        if source == _AGENT:
+            return handles[ref]
+        store = self.env.store
+        if source == _STORE:
+            return store.HANDLES[int(store.types[ref])](store, ref)
+        field = list(self.env.fields.values())[source - _FIELD]
+        cell = int(unit_cells[unit])
+        x, y = cell // height + xmin, cell % height + ymin
+        fx, fy = x - field.xmin, y - field.ymin
+        return FieldUnit(field, field.subtypes[ref], dpt(x, y), (fx, fx + 1, fy, fy + 1))
@@ -0,0 +1,229 @@
+from enum import Enum
+from typing import Dict, List, Optional, Collection
+
+import numpy as np
+from repast4py.space import DiscretePoint as dpt
+
+from MAS_Microbiota import Simulation
+
+
+class FieldUnit:
+    """
+    Handle to one unit of a resource found in the neighbourhood of a point of a concentration field.
+    It exposes the attributes of the corresponding resource agent used by the bacteria, and marking it for removal
+    takes one unit of the resource from the neighbourhood.
+    """
+    __slots__ = ('field', 'subtype', 'pt', 'window')
+
+    def __init__(self, field: 'ConcentrationField', subtype: Enum, pt: dpt, window: tuple):
+        self.field = field
+        self.subtype = subtype
+        self.pt = pt
+        self.window = window
+
+    @property
+    def TYPE(self) -> int:
+        return self.field.agent_class.TYPE
+
+    @property
+    def agent_class(self) -> type:
+        return self.field.agent_class
+
+    @property
+    def context(self) -> str:
+        return self.field.context
+
+    @property
+    def toRemove(self) -> bool:
+        return False
+
+    @toRemove.setter
+    def toRemove(self, value: bool):
+        if value:
+            self.field.take(self.subtype, self.window)
+
+    @property
+    def toMove(self) -> bool:
+        return False
+
+    def __getattr__(self, name):
+        # Subtype attribute of the agent class the unit stands for, like sub_type for substrates
+        if name == self.field.subtype_attribute:
+            return self.subtype
+        raise AttributeError(name)
+
+
+class ConcentrationField:
+    """
+    Per-cell concentration of each subtype of a resource over the local part of a grid, used in place of
+    individual resource agents.
+    The concentrations are integer counts of resource units, updated with vectorized stochastic stencils over the
+    occupied cells: diffusion moves every unit to a random cell of its Moore neighbourhood, as the random walk of
+    the agents would, while decay removes every unit with a given probability. The cost of a step is therefore
+    proportional to the occupied cells instead of the number of units or the size of the grid.
+    A field with a lifetime also counts the units of each age in a layer of ages, diffused one layer at a time, so
+    that ageing removes the units placed as many steps before, like the agents reaching their maximum age, rather
+    than a random fraction of all the units.
+    A subtype is perceived in a neighbourhood if any of its units is there, and taking it removes one unit from a
+    cell of the neighbourhood, and from an age in that cell, chosen proportionally to their content.
+    """
+
+    OFFSETS = np.array([(dx, dy) for dx in (-1, 0, 1) for dy in (-1, 0, 1)])
+
+    def __init__(self, agent_class: type, subtype_class: type, subtype_attribute: str, context: str, grid,
+                 lifetime: Optional[int] = None):
+        """
+        :param lifetime: The number of steps the units last after they are placed, if they age
+        """
+        self.agent_class = agent_class
+        self.subtype_class = subtype_class
+        self.subtype_attribute = subtype_attribute
+        self.context = context
+        self.subtypes = list(subtype_class)
+        self._index = {subtype: i for i, subtype in enumerate(self.subtypes)}
+        bounds = grid.get_local_bounds()
+        self.xmin, self.ymin = bounds.xmin, bounds.ymin
+        self.width, self.height = bounds.xextent, bounds.yextent
+        self.values = np.zeros((len(self.subtypes), self.width, self.height), dtype=np.int64)
+        self.pending = np.zeros_like(self.values)  # Units added but not yet placed, as agents before their first step
+        # Units of each age, from the ones placed at the last step, whose total over the ages is values
+        self.ages = None if lifetime is None else np.zeros((lifetime,) + self.values.shape, dtype=np.int64)
+
+    def add(self, subtype: Enum, pt: dpt, amount: int = 1, placed: bool = False):
+        """
+        Adds units of resource of the given subtype at the given point, clamped to the local bounds.
+        Units not placed are only found by the neighbourhood queries after the next diffusion.
+        """
+        x = min(max(pt.x - self.xmin, 0), self.width - 1)
+        y = min(max(pt.y - self.ymin, 0), self.height - 1)
+        (self.values if placed else self.pending)[self._index[subtype], x, y] += amount
+        if placed and self.ages is not None:
+            self.ages[0, self._index[subtype], x, y] += amount
+
+    def scatter(self, subtype: Enum, amount: int):
+        """
+        Adds the given number of units of resource of the given subtype at uniformly random cells, not yet placed.
+        """
+        if amount <= 0:
+            return
+        rng = Simulation.model.draws.inputs
+        xs = rng.integers_array(0, self.width, amount)
+        ys = rng.integers_array(0, self.height, amount)
+        np.add.at(self.pending[self._index[subtype]], (xs, ys), 1)
+
+    def diffuse(self):
+        """
+        Moves every unit, including the ones not yet placed, to a uniformly random cell of the Moore neighbourhood
+        of its cell, including the cell itself, with sticky borders.
+        """
+        self.values += self.pending
+        if self.ages is not None:
+            self.ages[0] += self.pending
+        self.pending[:] = 0
+        if self.ages is None:
+            self.values = self._diffused(self.values)
+        else:
+            self.ages = self._diffused(self.ages)
+            self.values = self.ages.sum(axis=0)
+
+    def _diffused(self, counts: np.ndarray) -> np.ndarray:
+        """
+        Returns the given counts, whose last two axes are the cells, after moving every unit to a uniformly random
+        cell of the Moore neighbourhood of its cell.
+        """
+        *layers, xs, ys = np.nonzero(counts)
+        if len(xs) == 0:
+            return counts
+        moves = Simulation.model.draws.movement.multinomial_array(counts[(*layers, xs, ys)],
+                                                                   [1 / len(self.OFFSETS)] * len(self.OFFSETS))
+        result = np.zeros_like(counts)
+        for k, (dx, dy) in enumerate(self.OFFSETS):
+            np.add.at(result, (*layers, np.clip(xs + dx, 0, self.width - 1), np.clip(ys + dy, 0, self.height - 1)),
+                      moves[:, k])
+        return result
+
+    def age(self) -> Dict[Enum, int]:
+        """
+        Ages every unit of a field with a lifetime by one step, removing the units at the end of their lifetime.
+        :return: A dictionary with the number of removed units of each subtype
+        """
+        expired = self.ages[-1].copy()
+        self.ages[1:] = self.ages[:-1].copy()
+        self.ages[0] = 0
+        self.values -= expired
+        totals = expired.sum(axis=(1, 2))
+        return {subtype: int(totals[i]) for i, subtype in enumerate(self.subtypes)}
+
+    def decay(self, probability: float) -> Dict[Enum, int]:
+        """
+        Removes every unit with the given probability.
+        :param probability: The probability of removal of each unit, between 0 and 1
+        :return: A dictionary with the number of removed units of each subtype
+        """
+        probability = min(max(probability, 0.0), 1.0)
+        subtypes, xs, ys = np.nonzero(self.values)
+        removed = Simulation.model.draws.movement.binomial_array(self.values[subtypes, xs, ys], probability)
+        self.values[subtypes, xs, ys] -= removed
+        totals = np.bincount(subtypes, weights=removed, minlength=len(self.subtypes))
+        return {subtype: int(totals[i]) for i, subtype in enumerate(self.subtypes)}
+
+    def near(self, pt: dpt, subtypes: Optional[Collection] = None) -> List[FieldUnit]:
+        """
+        Returns a unit of each of the given subtypes present in the Moore neighbourhood of the given point.
+        :param pt: The center of the neighbourhood
+        :param subtypes: The wanted subtypes, or None for all of them
+        :return: A list of units, at most one for each subtype
+        """
+        x0, x1 = max(pt.x - 1 - self.xmin, 0), min(pt.x + 2 - self.xmin, self.width)
+        y0, y1 = max(pt.y - 1 - self.ymin, 0), min(pt.y + 2 - self.ymin, self.height)
+        if x0 >= x1 or y0 >= y1:
+            return []
+        window = (x0, x1, y0, y1)
+        amounts = self.values[:, x0:x1, y0:y1].sum(axis=(1, 2)).tolist()
+        return [FieldUnit(self, subtype, pt, window) for i, subtype in enumerate(self.subtypes)
+                if amounts[i] > 0 and (subtypes is None or subtype in subtypes)]
+
+    def take(self, subtype: Enum, window: tuple) -> bool:
+        """
+        Removes one unit of the given subtype from a cell of the given window, and from an age of that cell if the
+        units age, chosen proportionally to their content.
+        :return: True if a unit was removed, False if the window had none left
+        """
+        x0, x1, y0, y1 = window
+        index = self._index[subtype]
+        cells = self.values[index, x0:x1, y0:y1] if self.ages is None else self.ages[:, index, x0:x1, y0:y1]
+        cumulative = np.cumsum(cells)
+        if cumulative[-1] == 0:
+            return False
+        chosen = np.unravel_index(int(np.searchsorted(
+            cumulative, Simulation.model.draws.metabolism.integers(0, int(cumulative[-1])), side='right')), cells.shape)
+        cells[chosen] -= 1
+        if self.ages is not None:
+            self.values[index, x0 + chosen[1], y0 + chosen[2]] -= 1
+        return True
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the placed and pending units of the field, and their ages if any, for checkpointing.
+        """
+        state = {'values': self.values.copy(), 'pending': self.pending.copy()}
+        if self.ages is not None:
+            state['ages'] = self.ages.copy()
+        return state
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        """
+        Replaces the units of the field with the ones of a state returned by state.
+        """
+        self.values = state['values'].astype(np.int64)
+        self.pending = state['pending'].astype(np.int64)
+        if self.ages is not None:
+            self.ages = state['ages'].astype(np.int64)
+
+    def total(self, subtype: Enum = None) -> int:
+        """
+        Returns the total number of units of the given subtype, or of all the subtypes, in the field.
+        """
+        if subtype is None:
+            return int(self.values.sum() + self.pending.sum())
+        return int(self.values[self._index[subtype]].sum() + self.pending[self._index[subtype]].sum())
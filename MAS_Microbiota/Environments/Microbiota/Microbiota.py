@@ -1,5 +1,6 @@
 from enum import IntEnum
 
+import numpy as np
 from repast4py.space import DiscretePoint as dpt
 
 from MAS_Microbiota import Simulation, restore_agent
@@ -7,6 +8,8 @@ from MAS_Microbiota.Environments import GridAgent, GridEnvironment, ResourceAgen
 from MAS_Microbiota.Environments.Brain.Agents.Neurotransmitter import Neurotransmitter
 from MAS_Microbiota.Environments.Brain.Agents.Precursor import Precursor, PrecursorType
 from MAS_Microbiota.Environments.Microbiota.Agents import *
+from MAS_Microbiota.Environments.Microbiota.BacteriaEngine import BacteriaEngine
+from MAS_Microbiota.Environments.Microbiota.ConcentrationField import ConcentrationField
 
 
 class Microbiota(GridEnvironment):
@@ -23,6 +26,15 @@ class Microbiota(GridEnvironment):
         self.bacteria_to_add = []
         self.good_bacteria_count = 0
         self.pathogenic_bacteria_count = 0
+        self.fields = None  # Optional concentration fields of substrates and SCFAs, replacing their agents
+        if Simulation.params.get('concentration_fields', False):
+            self.fields = {
+                Substrate.TYPE: ConcentrationField(Substrate, SubstrateType, 'sub_type', self.NAME, grid,
+                                                  lifetime=Simulation.params["substrate_max_age"] + 1),
+                SCFA.TYPE: ConcentrationField(SCFA, SCFAType, 'scfa_type', self.NAME, grid)
+            }
+        # Optional compiled engine of the decisions of the bacteria, replacing their step methods
+        self.bacteria_engine = BacteriaEngine(self) if Simulation.params.get('bacteria_engine', False) else None
 
     @staticmethod
     def initial_agents():
@@ -53,24 +65,29 @@ class Microbiota(GridEnvironment):
 
     def step(self):
         removed_ids = set()
-        self.context.synchronize(restore_agent)
+        self.mark_changed()  # By the other environments and the model since the last step
+        self.synchronize(restore_agent)
         self.remove_agents(removed_ids)
         self.add_substrates()
         self.make_agents_steps()
+        self.fields_step()
         self.add_bacteria()
         resources_to_move = []
 
-        for agent in self.context.agents():
-            if isinstance(agent, ResourceAgent) and agent.toMove:
-                resources_to_move.append(agent)
-                agent.toRemove = True
+        for agent in self.context.take_flagged('toMove'):
+            resources_to_move.append(agent)
+            agent.toRemove = True
+        if self.store is not None:
+            for resource in self.store.flagged_to_move():
+                resources_to_move.append(resource)
+                resource.toRemove = True
 
         self.move_resources_to_brain(resources_to_move)
         self.remove_agents(removed_ids)
         self.apply_actions()
         self.remove_agents(removed_ids)
         self.count_bacteria()
-        self.context.synchronize(restore_agent)
+        self.synchronize(restore_agent)
         self.remove_agents(removed_ids)
 
 
@@ -79,60 +96,114 @@ class Microbiota(GridEnvironment):
             self.substrates_to_add[type] += Simulation.params["diet_substrates"]["intake"][type.name.lower()]
 
         for substrate_type in self.substrates_to_add:
-            for _ in range(self.substrates_to_add[substrate_type]):
-                pt = self.grid.get_random_local_pt(Simulation.model.rng)
-                substrate = Substrate(Simulation.model.new_id(), Simulation.model.rank, substrate_type, pt, self.NAME)
-                self.context.add(substrate)
+            if self.fields is not None:
+                self.fields[Substrate.TYPE].scatter(substrate_type, self.substrates_to_add[substrate_type])
+                self.substrates_to_add[substrate_type] = min(self.substrates_to_add[substrate_type], 0)
+                continue
+            self.spawn_many(Substrate, self.substrates_to_add[substrate_type], substrate_type, placed=False)
             self.substrates_to_add[substrate_type] = min(self.substrates_to_add[substrate_type], 0)
 
 
+    def step_agents(self):
+        if self.bacteria_engine is None:
+            super().step_agents()
+        else:
+            self.bacteria_engine.step_in_order()
+
+    def fields_step(self):
+        """
+        Updates the concentration fields, if any, in place of the steps of the substrate and SCFA agents.
+        Substrates and SCFAs diffuse as their random walk would, substrates are removed at the maximum age of their
+        agents, and the SCFAs that cross the epithelial barrier, with the same probability of their agents,
+        are absorbed in the bloodstream.
+        """
+        if self.fields is None:
+            return
+        for field in self.fields.values():
+            field.diffuse()
+        self.fields[Substrate.TYPE].age()
+        crossing = (99 - Simulation.model.epithelial_barrier_impermeability) / 100
+        Simulation.model.gutBrainInterface.absorb_scfa(self.fields[SCFA.TYPE].decay(crossing))
+
+    def add_resource(self, agent_class: type, local_id: int, subtype, pt, placed: bool = False):
+        if self.fields is not None and agent_class.TYPE in self.fields:
+            self.fields[agent_class.TYPE].add(subtype, pt, placed=placed)
+        else:
+            super().add_resource(agent_class, local_id, subtype, pt, placed)
+
+    def add_resources(self, agent_class: type, local_ids, subtypes, positions: np.ndarray, placed: bool = False):
+        if self.fields is not None and agent_class.TYPE in self.fields:
+            for subtype, (x, y) in zip(subtypes, positions.tolist()):
+                self.fields[agent_class.TYPE].add(subtype, dpt(x, y), placed=placed)
+        else:
+            super().add_resources(agent_class, local_ids, subtypes, positions, placed)
+
+    def find_resources(self, pt, wanted: dict) -> list:
+        result = super().find_resources(pt, wanted)
+        if self.fields is not None:
+            for agent_type, field in self.fields.items():
+                if agent_type in wanted:
+                    result += field.near(pt, wanted[agent_type])
+        return result
+
+    def holds_as_agents(self, agent_class: type) -> bool:
+        return (super().holds_as_agents(agent_class) and
+                (self.fields is None or agent_class.TYPE not in self.fields))
+
     def move_resources_to_brain(self, resources_to_move):
         for agent in resources_to_move:
-            if isinstance(agent, (SCFA, Precursor, Substrate)):
+            if agent.TYPE in (SCFA.TYPE, Precursor.TYPE, Substrate.TYPE):
                 Simulation.model.gutBrainInterface.transfer_to_bloodstream(agent)
-            elif isinstance(agent, Neurotransmitter):
+            elif agent.TYPE == Neurotransmitter.TYPE:
                 Simulation.model.gutBrainInterface.transfer_to_enteric_nervous_system(agent)
 
     def count_bacteria(self):
         """
         Updates the count of good and pathogenic bacteria in the microbiota environment.
         """
-        for bacterium in [b for b in self.context.agents() if isinstance(b, Bacterium)]:
-            if bacterium.causes_inflammation():
-                self.pathogenic_bacteria_count += 1
+        for bacteria in self.context.agents_by_class(Bacterium).values():
+            # All the bacteria of a family share the same inflammatory behaviour
+            if bacteria[0].causes_inflammation():
+                self.pathogenic_bacteria_count += len(bacteria)
             else:
-                self.good_bacteria_count += 1
+                self.good_bacteria_count += len(bacteria)
+
+    def pathogenic_bacteria(self) -> list:
+        """
+        Returns the pathogenic bacteria of the microbiota environment, grouped by family.
+        """
+        return [bacterium for bacteria in self.context.agents_by_class(Bacterium).values()
+                if bacteria[0].causes_inflammation() for bacterium in bacteria]
 
 
     def apply_actions(self):
-        for bacterium in [agent for agent in self.context.agents() if isinstance(agent, Bacterium)]: # For each bacterium in the context...
-            bacterium.step() # Call the step method of the bacterium.
+        if self.bacteria_engine is not None:
+            self.bacteria_engine.step()
+        for bacterium in self.agents_of_type(Bacterium.TYPE): # For each bacterium in the context...
+            if self.bacteria_engine is None:
+                bacterium.step() # Call the step method of the bacterium.
             if bacterium.toFission:
                 self._fission(bacterium)
-            for fermentable_type in bacterium.toFerment:
-                if bacterium.toFerment[fermentable_type]:
+            for fermentable_type in bacterium.FERMENTABLE:
+                if bacterium.to_ferment(fermentable_type):
                     self._ferment(bacterium, fermentable_type)
+        self.mark_changed()
 
     def agents_to_remove(self):
         return Bacterium, SCFAType, Substrate, Precursor, Neurotransmitter
 
-    def find_bact_free_nghs(self, pt: dpt) -> list[dpt]:
+    def find_bact_free_nghs(self, pt: dpt) -> np.ndarray:
         """
         Finds the position around a given point that do not have any bacterium agent.
         :param pt: The point to check
-        :return: A list of empty points
+        :return: An array with the coordinates of the empty points, one row per point
         """
-        empty_pt_list = []
         nghs_coords = Simulation.model.ngh_finder.find(pt.x, pt.y)
-        for ngh_coords in nghs_coords:
-            nghs_agents = list(self.grid.get_agents(dpt(ngh_coords[0], ngh_coords[1])))
-            if len([ag for ag in nghs_agents if isinstance(ag, Bacterium)]) == 0:
-                 empty_pt_list.append(ngh_coords)
-        return empty_pt_list
+        return self.occupancy.free((Bacterium.TYPE,), nghs_coords)
 
     def teleport_resources_step(self):
-        for agent in [ag for ag in self.context.agents() if isinstance(ag, Substrate)]:
-            pt = self.grid.get_random_local_pt(Simulation.model.rng)
+        for agent in self.agents_of_class(Substrate):
+            pt = self.grid.get_random_local_pt(Simulation.model.draws.placement)
             Simulation.model.move(agent, pt, agent.context)
 
     def _fission(self, bacterium):
@@ -146,7 +217,7 @@ class Microbiota(GridEnvironment):
         empty_ngh_pts = self.find_bact_free_nghs(bacterium.pt)
         if len(empty_ngh_pts) == 0:
             return
-        point = Simulation.model.rng.choice(empty_ngh_pts)
+        point = Simulation.model.draws.metabolism.choice(empty_ngh_pts)
         bact_class = type(bacterium)
         new_bacterium = bact_class(Simulation.model.new_id(), Simulation.model.rank, dpt(point[0], point[1]), self.NAME)
         self.context.add(new_bacterium)
@@ -154,7 +225,7 @@ class Microbiota(GridEnvironment):
 
     def _ferment(self, bacterium: Bacterium, fermentable_type: type[ResourceAgent]):
         neighbours = Simulation.model.ngh_finder.find(bacterium.pt.x, bacterium.pt.y)  # Neighbours of the bacterium...
-        point = Simulation.model.rng.choice(neighbours)
+        point = Simulation.model.draws.metabolism.choice(neighbours)
         if fermentable_type == Substrate:
             self._add_metabolite(bacterium.produced_scfa(), SCFA, dpt(point[0], point[1]))
             self._add_metabolite(bacterium.produced_precursors(), Precursor, dpt(point[0], point[1]))
@@ -166,9 +237,8 @@ class Microbiota(GridEnvironment):
     # Based on the assumption that all metabolite and neurotransmitters agents have the same constructor signature.
     def _add_metabolite(self, types: list[IntEnum], agent_class: type, point: dpt):
         if len(types) > 0:
-            type = types[0].__class__(Simulation.model.rng.choice(types))
-            agent = agent_class(Simulation.model.new_id(), Simulation.model.rank, type, point, self.NAME)
-            self.context.add(agent)
+            type = types[0].__class__(Simulation.model.draws.metabolism.choice(types))
+            self.add_resource(agent_class, Simulation.model.new_id(), type, point)
 
     def add_bacteria(self):
         for bacterium in self.bacteria_to_add:
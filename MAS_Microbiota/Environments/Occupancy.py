@@ -0,0 +1,185 @@
+from typing import Dict, Hashable, Iterable, List, Sequence, Tuple
+
+import numba
+import numpy as np
+from numba import int32, int64, boolean, types
+from repast4py.space import DiscretePoint as dpt
+
+
+# Coordinates are either new arrays of the GridNghFinder or read-only views of the GridNghTable
+_COORDS = (int64[:, ::1], types.Array(int64, 2, 'A', readonly=True))
+
+
+@numba.jit([(int32[:, :, :], int64[:], coords, int64, int64) for coords in _COORDS], nopython=True)
+def _counts(layers, indices, coords, xmin, ymin):
+    result = np.zeros(len(coords), dtype=np.int64)
+    for i in range(len(coords)):
+        x, y = coords[i, 0] - xmin, coords[i, 1] - ymin
+        if 0 <= x < layers.shape[1] and 0 <= y < layers.shape[2]:  # Cells beyond the layers hold no agents
+            for k in indices:
+                result[i] += layers[k, x, y]
+    return result
+
+
+@numba.jit([(int32[:, :, :], int64[:], coords, int64, int64, boolean) for coords in _COORDS], nopython=True)
+def _select(layers, indices, coords, xmin, ymin, occupied):
+    mask = np.zeros(len(coords), dtype=np.bool_)
+    for i in range(len(coords)):
+        x, y = coords[i, 0] - xmin, coords[i, 1] - ymin
+        total = 0
+        if 0 <= x < layers.shape[1] and 0 <= y < layers.shape[2]:  # Cells beyond the layers hold no agents
+            for k in indices:
+                total += layers[k, x, y]
+        mask[i] = (total > 0) == occupied
+    return coords[mask]
+
+
+class Occupancy:
+    """
+    Occupancy count layers of a grid.
+    For each agent type, and for each type and subtype of the agents whose class names its subtype attribute in
+    SUBTYPE_ATTRIBUTE, a layer holds the number of agents of that kind placed in every cell of the local part
+    of the grid and of a two cell border around it. The first ring of the border is the buffer where ghosts are
+    placed and where the local agents can move before the next synchronization, and the second one is where the
+    neighbourhoods of those agents can extend. Cells beyond the border, where only the neighbourhoods of agents
+    never placed on the grid, like the new bacteria of a fission, can extend, are read as empty. Layers are keyed by the TYPE of the agents, or by a (TYPE, subtype) tuple, and are stacked in a
+    single NumPy array, so that the counts of several kinds over a neighbourhood are read by a single compiled loop.
+
+    The layers are updated incrementally when agents are moved, placed or removed from the grid, so that asking
+    whether a neighbourhood holds agents of a given kind is a lookup in an array instead of an iteration over the
+    agents of each cell.
+    """
+
+    BUFFER = 2  # Width of the border around the local bounds
+
+    def __init__(self, grid):
+        bounds = grid.get_local_bounds()
+        self.xmin = bounds.xmin - self.BUFFER
+        self.ymin = bounds.ymin - self.BUFFER
+        self.shape = (bounds.xextent + 2 * self.BUFFER, bounds.yextent + 2 * self.BUFFER)
+        self.layers = np.zeros((0,) + self.shape, dtype=np.int32)
+        self._layer_of: Dict[Hashable, int] = {}
+        self._layers_of: Dict[Tuple[Hashable, ...], np.ndarray] = {}
+
+    def _layer(self, key: Hashable) -> int:
+        """
+        Returns the index of the layer of the given key, adding an empty layer for a new key.
+        """
+        index = self._layer_of.get(key)
+        if index is None:
+            index = self._layer_of[key] = len(self.layers)
+            self.layers = np.concatenate((self.layers, np.zeros((1,) + self.shape, dtype=np.int32)))
+        return index
+
+    def _indices(self, keys: Tuple[Hashable, ...]) -> np.ndarray:
+        indices = self._layers_of.get(keys)
+        if indices is None:
+            indices = self._layers_of[keys] = np.array([self._layer(key) for key in keys], dtype=np.int64)
+        return indices
+
+    @staticmethod
+    def keys(agent) -> tuple:
+        """
+        Returns the keys of the layers counting the given agent.
+        """
+        attribute = agent.SUBTYPE_ATTRIBUTE
+        if attribute is None:
+            return agent.TYPE,
+        return agent.TYPE, (agent.TYPE, getattr(agent, attribute))
+
+    def _update(self, agent, pt: dpt, delta: int):
+        x, y = pt.x - self.xmin, pt.y - self.ymin
+        if not (0 <= x < self.shape[0] and 0 <= y < self.shape[1]):
+            return
+        for key in self.keys(agent):
+            index = self._layer(key)  # Before reading the layers, which a new key replaces
+            self.layers[index, x, y] += delta
+
+    def add(self, agent, pt: dpt):
+        """
+        Counts the given agent as placed at the given point.
+        """
+        self._update(agent, pt, 1)
+
+    def remove(self, agent, pt: dpt):
+        """
+        Stops counting the given agent placed at the given point.
+        """
+        self._update(agent, pt, -1)
+
+    def _update_all(self, agents: Sequence, points: np.ndarray, delta: int):
+        groups: Dict[tuple, List[int]] = {}
+        for i, agent in enumerate(agents):
+            groups.setdefault(self.keys(agent), []).append(i)
+        for keys, rows in groups.items():
+            indices = self._indices(keys)  # Before reading the layers, which new keys replace
+            x, y = points[rows, 0] - self.xmin, points[rows, 1] - self.ymin
+            inside = (x >= 0) & (x < self.shape[0]) & (y >= 0) & (y < self.shape[1])
+            for index in indices.tolist():
+                np.add.at(self.layers[index], (x[inside], y[inside]), delta)
+
+    def add_all(self, agents: Sequence, points: np.ndarray):
+        """
+        Counts the given agents as placed at the given points, an array with the coordinates of each agent in a row.
+        """
+        self._update_all(agents, points, 1)
+
+    def remove_all(self, agents: Sequence, points: np.ndarray):
+        """
+        Stops counting the given agents placed at the given points, an array with the coordinates of each agent
+        in a row.
+        """
+        self._update_all(agents, points, -1)
+
+    def rebuild(self, grid, agents: Iterable):
+        """
+        Recomputes all the layers from the locations on the given grid of the given agents.
+        It is needed after synchronizing the grid with the other ranks, which moves agents and ghosts
+        without passing through the model.
+        """
+        self.layers[:] = 0
+        for agent in agents:
+            location = grid.get_location(agent)
+            if location is not None:
+                self._update(agent, location, 1)
+
+    def counts(self, keys: Tuple[Hashable, ...], coords: np.ndarray) -> np.ndarray:
+        """
+        Returns the number of agents of any of the given kinds in each of the given cells.
+        :param keys: A tuple of layer keys, each the TYPE of the agents or a (TYPE, subtype) tuple
+        :param coords: An array of cell coordinates, one row per cell, like the ones of the GridNghFinder
+        :return: An array with the count of each cell
+        """
+        indices = self._indices(keys)  # Before reading the layers, which new keys replace
+        return _counts(self.layers, indices, coords, self.xmin, self.ymin)
+
+    def neighbourhood_counts(self, keys: Tuple[Hashable, ...], coords: np.ndarray) -> np.ndarray:
+        """
+        Returns the number of agents of any of the given kinds in the Moore neighbourhood of each of the given cells,
+        the cell included, read for all the cells at once.
+        :param keys: A tuple of layer keys, each the TYPE of the agents or a (TYPE, subtype) tuple
+        :param coords: An array of cell coordinates, one row per cell
+        :return: An array with the count of each neighbourhood
+        """
+        indices = self._indices(keys)  # Before reading the layers, which new keys replace
+        padded = np.pad(self.layers[indices].sum(axis=0), 1)  # Cells beyond the layers hold no agents
+        x, y = coords[:, 0] - self.xmin + 1, coords[:, 1] - self.ymin + 1
+        result = np.zeros(len(coords), dtype=np.int64)
+        for dx in (-1, 0, 1):
+            for dy in (-1, 0, 1):
+                result += padded[x + dx, y + dy]
+        return result
+
+    def occupied(self, keys: Tuple[Hashable, ...], coords: np.ndarray) -> np.ndarray:
+        """
+        Returns the given cells holding at least an agent of any of the given kinds, in the given order.
+        """
+        indices = self._indices(keys)  # Before reading the layers, which new keys replace
+        return _select(self.layers, indices, coords, self.xmin, self.ymin, True)
+
+    def free(self, keys: Tuple[Hashable, ...], coords: np.ndarray) -> np.ndarray:
+        """
+        Returns the given cells without agents of any of the given kinds, in the given order.
+        """
+        indices = self._indices(keys)  # Before reading the layers, which new keys replace
+        return _select(self.layers, indices, coords, self.xmin, self.ymin, False)
@@ -0,0 +1,56 @@
+from typing import Callable, List
+
+from repast4py import space
+from repast4py.core import AgentManager
+from repast4py.space import DiscretePoint as dpt
+
+from MAS_Microbiota.Environments import AgentRecords
+
+
+class RecordGrid(space.SharedGrid):
+    """
+    Shared grid exchanging the agents of its buffers with the neighbouring ranks as binary records, see AgentRecords.
+    Instead of a pickled tuple per agent, the agents sent to a rank are packed in a batch per class, made of an array
+    of uids, a structured array of records and an array of grid locations, and the ghosts of a batch are restored
+    together by the restore function, which replaces the create_agent function of the context.
+    """
+
+    def __init__(self, name, bounds, borders, occupancy, buffer_size, comm, restore: Callable):
+        """
+        :param restore: A function restoring the agents of a batch from their uids and their records
+        """
+        super().__init__(name=name, bounds=bounds, borders=borders, occupancy=occupancy, buffer_size=buffer_size,
+                         comm=comm)
+        self.restore = restore
+
+    def _fill_send_data(self) -> List[List]:
+        send_data = [[] for _ in range(self._cart_comm.size)]
+        pt = dpt(0, 0, 0)
+        for rank, (x0, x1, y0, y1, _, _) in self._get_buffer_data():
+            agents, locations = [], []
+            for x in range(x0, x1):
+                for y in range(y0, y1):
+                    pt._reset2D(x, y)
+                    for agent in self.get_agents(pt):
+                        agents.append(agent)
+                        locations.append((x, y))
+            send_data[rank].extend(AgentRecords.pack_agents(agents, locations))
+        return send_data
+
+    def _process_recv_data(self, recv_data: List, agent_manager: AgentManager, create_agent: Callable):
+        pt = dpt(0, 0, 0)
+        for sending_rank, batches in enumerate(recv_data):
+            for uids, records, locations in batches:
+                uids = [tuple(uid) for uid in uids.tolist()]
+                # get will increment ref count if ghost exists
+                agents = [agent_manager.get_ghost(uid) for uid in uids]
+                missing = [i for i, agent in enumerate(agents) if agent is None]
+                if missing:
+                    for i, agent in zip(missing, self.restore([uids[i] for i in missing], records[missing])):
+                        agents[i] = agent
+                        agent_manager.add_ghost(sending_rank, agent)
+                for agent, (x, y) in zip(agents, locations.tolist()):
+                    self.buffered_agents.append(agent)
+                    self.add(agent)
+                    pt._reset2D(x, y)
+                    self.move(agent, pt)
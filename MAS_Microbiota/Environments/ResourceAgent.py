@@ -1,9 +1,8 @@
-from typing import Tuple
 from repast4py.space import DiscretePoint as dpt
 from MAS_Microbiota import Simulation
 from abc import abstractmethod
 
-from MAS_Microbiota.Environments import GridAgent
+from MAS_Microbiota.Environments.GridAgent import GridAgent, flag_attribute
 
 
 class ResourceAgent(GridAgent):
@@ -15,26 +14,23 @@ class ResourceAgent(GridAgent):
     Some resource agents can be removed from the environment, so they have a flag to indicate that.
     """
 
+    __slots__ = ('_toMove',)
+
+    toMove = flag_attribute('toMove')
+    RECORD_FIELDS = (('toRemove', '?', None), ('toMove', '?', None))
+
     def __init__(self, local_id: int, type: int, rank: int, pt: dpt, context: str):
         super().__init__(local_id=local_id, type=type, rank=rank, pt=pt, context=context)
         self.toRemove = False
         self.toMove = False
 
-    @abstractmethod
-    def save(self) -> Tuple:
-        pass
-
     def random_movement(self):
         """
         Moves the agent to a random neighbour cell.
         """
         if self.pt is None:
             return
-        else:
-            nghs_coords = Simulation.model.ngh_finder.find(self.pt.x, self.pt.y)
-            rand_pos = Simulation.model.rng.choice(nghs_coords)
-            chosen_dpt = dpt(rand_pos[0], rand_pos[1])
-            Simulation.model.move(self, chosen_dpt, self.context)
+        Simulation.model.envs[self.context].random_step(self)
 
     def check_if_to_move(self, permeability_check: bool = True):
         """
@@ -50,9 +46,8 @@ class ResourceAgent(GridAgent):
         """
         if self.pt is None:
             return
-        nghs_coords = Simulation.model.ngh_finder.find(self.pt.x, self.pt.y)
         if self.context in {'gut', 'microbiota'}:
-            choice = Simulation.model.rng.integers(0,
+            choice = Simulation.model.draws.movement.integers(0,
                 Simulation.params["epithelial_barrier"]["min_impermeability"] if permeability_check else 100)
             if choice > Simulation.model.epithelial_barrier_impermeability:
                 self.toMove = True
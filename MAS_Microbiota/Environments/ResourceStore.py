@@ -0,0 +1,373 @@
+from enum import Enum
+from typing import Dict, Iterator, List, Optional, Collection, Sequence
+
+import numpy as np
+from repast4py.space import DiscretePoint as dpt
+
+from MAS_Microbiota import Simulation
+from MAS_Microbiota.Environments.Microbiota.Agents.Substrate import SubstrateType, Substrate
+from MAS_Microbiota.Environments.Microbiota.Agents.SCFA import SCFAType, SCFA
+from MAS_Microbiota.Environments.Brain.Agents.Precursor import PrecursorType, Precursor
+from MAS_Microbiota.Environments.Brain.Agents.Neurotransmitter import NeurotransmitterType, Neurotransmitter
+
+
+class StoredResource:
+    """
+    Lightweight handle to a resource kept in a ResourceStore.
+    It exposes the same attributes of the corresponding resource agent that are used by the other agents and by
+    the environments, reading and writing them directly in the arrays of the store.
+    Handles are only valid until the store removes its flagged resources, so they should not be kept across steps.
+    """
+    __slots__ = ('store', 'index')
+
+    agent_class: type
+    subtype_class: type
+    TYPE: int
+
+    def __init__(self, store: 'ResourceStore', index: int):
+        self.store = store
+        self.index = index
+
+    @property
+    def uid(self):
+        return int(self.store.ids[self.index]), self.TYPE, self.store.rank
+
+    @property
+    def pt(self) -> dpt:
+        return dpt(int(self.store.x[self.index]), int(self.store.y[self.index]), 0)
+
+    @property
+    def context(self) -> str:
+        return self.store.context
+
+    @property
+    def subtype(self):
+        return self.subtype_class(int(self.store.subtypes[self.index]))
+
+    @property
+    def age(self) -> int:
+        return int(self.store.ages[self.index])
+
+    @property
+    def toRemove(self) -> bool:
+        return bool(self.store.to_remove[self.index])
+
+    @toRemove.setter
+    def toRemove(self, value: bool):
+        self.store.to_remove[self.index] = value
+
+    @property
+    def toMove(self) -> bool:
+        return bool(self.store.to_move[self.index])
+
+    @toMove.setter
+    def toMove(self, value: bool):
+        self.store.to_move[self.index] = value
+
+
+class StoredSubstrate(StoredResource):
+    __slots__ = ()
+    agent_class = Substrate
+    subtype_class = SubstrateType
+    TYPE = Substrate.TYPE
+    sub_type = StoredResource.subtype
+
+
+class StoredSCFA(StoredResource):
+    __slots__ = ()
+    agent_class = SCFA
+    subtype_class = SCFAType
+    TYPE = SCFA.TYPE
+    scfa_type = StoredResource.subtype
+    BBB_impermeability_coefficient = SCFA.BBB_impermeability_coefficient
+    neuroinflammation_coefficient = SCFA.neuroinflammation_coefficient
+
+
+class StoredPrecursor(StoredResource):
+    __slots__ = ()
+    agent_class = Precursor
+    subtype_class = PrecursorType
+    TYPE = Precursor.TYPE
+    precursor_type = StoredResource.subtype
+
+
+class StoredNeurotransmitter(StoredResource):
+    __slots__ = ()
+    agent_class = Neurotransmitter
+    subtype_class = NeurotransmitterType
+    TYPE = Neurotransmitter.TYPE
+    neurotrans_type = StoredResource.subtype
+
+
+class ResourceStore:
+    """
+    Structure-of-arrays store of the passive resource agents of an environment, namely substrates, SCFAs,
+    precursors and neurotransmitters.
+    Instead of being repast4py agents with their own step, save and synchronization, the resources are rows of
+    NumPy arrays holding their ids, types, subtypes, positions, ages and flags, and their steps are vectorized
+    over the whole store.
+
+    Neighbourhood queries are answered through an index of the resources sorted by cell, which is rebuilt after
+    the resources move. As for agents added to a context but not yet moved on its grid, resources added without
+    being placed are only found by the queries after the next step of the store.
+    Stored resources are local to the rank owning them: they are neither synchronized as ghosts nor migrate
+    to other ranks, and their random walk is bounded by the local bounds of the grid.
+    """
+
+    HANDLES = {handle.TYPE: handle for handle in (StoredSubstrate, StoredSCFA, StoredPrecursor, StoredNeurotransmitter)}
+    ARRAYS = ('ids', 'types', 'subtypes', 'x', 'y', 'ages', 'to_remove', 'to_move', 'placed', 'alive')  # One row per resource
+
+    def __init__(self, context: str, grid, rank: int, capacity: int = 1024):
+        self.context = context
+        self.rank = rank
+        bounds = grid.get_local_bounds()
+        self.xmin, self.xmax = bounds.xmin, bounds.xmin + bounds.xextent - 1
+        self.ymin, self.ymax = bounds.ymin, bounds.ymin + bounds.yextent - 1
+        self.size = 0
+        self.ids = np.zeros(capacity, dtype=np.int64)
+        self.types = np.zeros(capacity, dtype=np.int16)
+        self.subtypes = np.zeros(capacity, dtype=np.int16)
+        self.x = np.zeros(capacity, dtype=np.int32)
+        self.y = np.zeros(capacity, dtype=np.int32)
+        self.ages = np.zeros(capacity, dtype=np.int32)
+        self.to_remove = np.zeros(capacity, dtype=bool)
+        self.to_move = np.zeros(capacity, dtype=bool)
+        self.placed = np.zeros(capacity, dtype=bool)
+        self.alive = np.zeros(capacity, dtype=bool)
+        self._order = np.zeros(0, dtype=np.int64)
+        self._cell_starts = np.zeros((self.xmax - self.xmin + 1) * (self.ymax - self.ymin + 1) + 1, dtype=np.int64)
+        self._index_dirty = False
+
+    @classmethod
+    def stores(cls, agent_class: type) -> bool:
+        """
+        Returns True if the agents of the given class are kept in resource stores.
+        """
+        return getattr(agent_class, 'TYPE', None) in cls.HANDLES
+
+    def holds(self, agent) -> bool:
+        """
+        Returns True if the given agent is a handle to a resource of this store.
+        """
+        return isinstance(agent, StoredResource) and agent.store is self
+
+    def add(self, local_id: int, agent_type: int, subtype, pt: dpt, placed: bool = False):
+        """
+        Adds a resource to the store.
+        :param local_id: The local id of the resource
+        :param agent_type: The type of the resource, as the TYPE of its agent class
+        :param subtype: The subtype of the resource, like the SubstrateType of a substrate
+        :param pt: The position of the resource
+        :param placed: Whether the resource is immediately visible to the neighbourhood queries
+        """
+        if self.size == len(self.ids):
+            self._grow()
+        i = self.size
+        self.ids[i] = local_id
+        self.types[i] = agent_type
+        self.subtypes[i] = subtype.value if isinstance(subtype, Enum) else subtype
+        self.x[i] = min(max(pt.x, self.xmin), self.xmax)
+        self.y[i] = min(max(pt.y, self.ymin), self.ymax)
+        self.ages[i] = 0
+        self.to_remove[i] = False
+        self.to_move[i] = False
+        self.placed[i] = placed
+        self.alive[i] = True
+        self.size += 1
+        if placed:
+            self._index_dirty = True
+
+    def add_many(self, local_ids: Sequence[int], agent_type: int, subtypes: Sequence, points: np.ndarray,
+                 placed: bool = False):
+        """
+        Adds resources of the same type to the store at once, as add does for each of them.
+        :param local_ids: The local id of each resource
+        :param agent_type: The type of the resources, as the TYPE of their agent class
+        :param subtypes: The subtype of each resource
+        :param points: The position of each resource, one row per resource
+        :param placed: Whether the resources are immediately visible to the neighbourhood queries
+        """
+        count = len(local_ids)
+        while self.size + count > len(self.ids):
+            self._grow()
+        rows = slice(self.size, self.size + count)
+        self.ids[rows] = local_ids
+        self.types[rows] = agent_type
+        self.subtypes[rows] = [subtype.value if isinstance(subtype, Enum) else subtype for subtype in subtypes]
+        self.x[rows] = np.clip(points[:, 0], self.xmin, self.xmax)
+        self.y[rows] = np.clip(points[:, 1], self.ymin, self.ymax)
+        self.ages[rows] = 0
+        self.to_remove[rows] = False
+        self.to_move[rows] = False
+        self.placed[rows] = placed
+        self.alive[rows] = True
+        self.size += count
+        if placed and count > 0:
+            self._index_dirty = True
+
+    def remove(self, index: int):
+        """
+        Removes the resource at the given index. The row is only released when the flagged resources are removed,
+        so that the indices of the other handles stay valid until then.
+        """
+        self.alive[index] = False
+
+    def remove_flagged(self, removable_classes: Collection[type]):
+        """
+        Releases the removed resources and the ones marked for removal whose class is among the given ones,
+        compacting the arrays of the store.
+        :param removable_classes: The classes of the agents that are removed when marked for removal
+        """
+        n = self.size
+        removable = [cls.TYPE for cls in removable_classes if self.stores(cls)]
+        keep = self.alive[:n] & ~(self.to_remove[:n] & np.isin(self.types[:n], removable))
+        if keep.all():
+            return
+        kept = np.flatnonzero(keep)
+        for array in self._arrays():
+            array[:len(kept)] = array[kept]
+        self.alive[len(kept):n] = False
+        self.size = len(kept)
+        self._index_dirty = True
+
+    def step(self):
+        """
+        Performs the step of every resource of the store: a random walk to a neighbouring cell, followed by the
+        ageing and the removal or movement checks of each type of resource.
+        """
+        n = self.size
+        if n == 0:
+            return
+        rng = Simulation.model.draws.movement
+        x, y, types = self.x[:n], self.y[:n], self.types[:n]
+        np.clip(x + rng.integers_array(-1, 2, n), self.xmin, self.xmax, out=x)
+        np.clip(y + rng.integers_array(-1, 2, n), self.ymin, self.ymax, out=y)
+        self.placed[:n] = True
+        self._index_dirty = True
+
+        to_remove, to_move, ages = self.to_remove[:n], self.to_move[:n], self.ages[:n]
+
+        substrates = types == Substrate.TYPE
+        ages[substrates] += 1
+        to_remove |= substrates & (ages > Simulation.params["substrate_max_age"])
+
+        if self.context in {'gut', 'microbiota'}:
+            crossing = (types == SCFA.TYPE) | (types == Precursor.TYPE)
+            choices = rng.integers_array(0, 100, n)
+            to_move |= crossing & (choices > Simulation.model.epithelial_barrier_impermeability)
+
+        neurotrans = types == Neurotransmitter.TYPE
+        ages[neurotrans] += 1
+        max_age = Simulation.params["neurotrans_max_age"]
+        to_remove |= neurotrans & (ages > max_age)
+        if self.context == 'microbiota':
+            reuptake = rng.integers_array(0, 100, n) < Simulation.params["neurotrans_reuptake_percentage"]
+            to_move |= neurotrans & (ages == max_age) & reuptake
+
+    def near(self, pt: dpt, wanted: Dict[int, Optional[Collection]]) -> List[StoredResource]:
+        """
+        Returns the resources in the Moore neighbourhood of the given point, including the point itself, which are
+        not marked for removal and are of one of the wanted types and subtypes.
+        :param pt: The center of the neighbourhood
+        :param wanted: A dictionary from the wanted resource types to the collection of their wanted subtypes,
+        or to None if any subtype is wanted
+        :return: A list of handles to the found resources
+        """
+        self._build_index()
+        x0, x1 = max(pt.x - 1, self.xmin), min(pt.x + 1, self.xmax)
+        y0, y1 = max(pt.y - 1, self.ymin), min(pt.y + 1, self.ymax)
+        if x0 > x1 or y0 > y1:
+            return []
+        height = self.ymax - self.ymin + 1
+        result = []
+        for x in range(x0, x1 + 1):
+            row = (x - self.xmin) * height - self.ymin
+            for i in self._order[self._cell_starts[row + y0]:self._cell_starts[row + y1 + 1]].tolist():
+                if not self.alive[i] or self.to_remove[i]:
+                    continue
+                agent_type = int(self.types[i])
+                if agent_type in wanted:
+                    subtypes = wanted[agent_type]
+                    if subtypes is None or int(self.subtypes[i]) in subtypes:
+                        result.append(self.HANDLES[agent_type](self, i))
+        return result
+
+    def flagged_to_move(self) -> List[StoredResource]:
+        """
+        Returns the resources marked for the movement to another environment.
+        """
+        n = self.size
+        return [self.HANDLES[int(self.types[i])](self, i)
+                for i in np.flatnonzero(self.to_move[:n] & self.alive[:n]).tolist()]
+
+    def count(self, agent_type: int, subtype=None, include_removed: bool = True) -> int:
+        """
+        Counts the resources of the given type, and optionally of the given subtype, in the store.
+        :param agent_type: The type of the resources to count
+        :param subtype: The subtype of the resources to count, or None to count all the subtypes
+        :param include_removed: Whether to count the resources marked for removal
+        :return: The number of resources
+        """
+        n = self.size
+        mask = self.alive[:n] & (self.types[:n] == agent_type)
+        if subtype is not None:
+            mask &= self.subtypes[:n] == (subtype.value if isinstance(subtype, Enum) else subtype)
+        if not include_removed:
+            mask &= ~self.to_remove[:n]
+        return int(np.count_nonzero(mask))
+
+    def handles(self) -> Iterator[StoredResource]:
+        """
+        Iterates over handles to all the resources of the store.
+        """
+        for i in np.flatnonzero(self.alive[:self.size]).tolist():
+            yield self.HANDLES[int(self.types[i])](self, i)
+
+    def __len__(self):
+        return int(np.count_nonzero(self.alive[:self.size]))
+
+    def state(self) -> Dict[str, np.ndarray]:
+        """
+        Returns the rows of the store in use, by the name of their array, for checkpointing.
+        """
+        return {name: getattr(self, name)[:self.size].copy() for name in self.ARRAYS}
+
+    def load_state(self, state: Dict[str, np.ndarray]):
+        """
+        Replaces the resources of the store with the ones of a state returned by state.
+        """
+        self.size = len(state['ids'])
+        for name in self.ARRAYS:
+            array = np.zeros(max(self.size, len(getattr(self, name))), dtype=getattr(self, name).dtype)
+            array[:self.size] = state[name]
+            setattr(self, name, array)
+        self._index_dirty = True
+
+    def _arrays(self) -> List[np.ndarray]:
+        return [self.ids, self.types, self.subtypes, self.x, self.y, self.ages,
+                self.to_remove, self.to_move, self.placed, self.alive]
+
+    def _grow(self):
+        """
+        Doubles the capacity of the arrays of the store.
+        """
+        for name in self.ARRAYS:
+            array = getattr(self, name)
+            grown = np.zeros(2 * len(array), dtype=array.dtype)
+            grown[:len(array)] = array
+            setattr(self, name, grown)
+
+    def _build_index(self):
+        """
+        Rebuilds the index of the placed resources sorted by cell, if they changed since the last build.
+        """
+        if not self._index_dirty:
+            return
+        n = self.size
+        height = self.ymax - self.ymin + 1
+        placed = np.flatnonzero(self.placed[:n] & self.alive[:n])
+        cells = (self.x[placed] - self.xmin).astype(np.int64) * height + (self.y[placed] - self.ymin)
+        order = np.argsort(cells, kind='stable')
+        self._order = placed[order]
+        self._cell_starts = np.searchsorted(cells[order], np.arange(len(self._cell_starts)))
+        self._index_dirty = False
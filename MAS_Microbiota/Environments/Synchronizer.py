@@ -0,0 +1,79 @@
+import numpy as np
+from mpi4py import MPI
+from repast4py.space import DiscretePoint as dpt
+
+from MAS_Microbiota.Environments.Occupancy import Occupancy
+
+
+class Synchronizer:
+    """
+    Tracks whether the part of a grid shared with the other ranks changed since the last synchronization of its
+    context, so that synchronizations with nothing to exchange are skipped.
+
+    The shared part is made of the border cells of the local bounds that the neighbouring ranks copy as ghosts in
+    their buffers, and of the cells outside the local bounds, which agents reach when they move to another rank.
+    The environment reports the points where agents are moved, placed or removed, and marks when agents may have
+    changed state, like after their steps, which only matters if some agent is placed on the border.
+    As synchronizing is a collective operation, the ranks agree on whether any of them is dirty before exchanging.
+    With a single rank there are neither ghosts nor agents moving to other ranks, and nothing is ever exchanged.
+    """
+
+    def __init__(self, grid, occupancy: Occupancy, comm: MPI.Intracomm):
+        self.comm = comm
+        self.occupancy = occupancy
+        self.active = comm.Get_size() > 1
+        self.dirty = self.active
+        # Shared cells in the coordinates of the occupancy layers, whose outer rings lie outside the local bounds
+        self.shared = np.ones(occupancy.shape, dtype=bool)
+        self.shared[Occupancy.BUFFER:-Occupancy.BUFFER, Occupancy.BUFFER:-Occupancy.BUFFER] = False
+        if self.active:
+            for _, (x0, x1, y0, y1, _, _) in grid._get_buffer_data():
+                self.shared[x0 - occupancy.xmin:x1 - occupancy.xmin, y0 - occupancy.ymin:y1 - occupancy.ymin] = True
+        border = self.shared.copy()
+        border[:Occupancy.BUFFER, :] = border[-Occupancy.BUFFER:, :] = False
+        border[:, :Occupancy.BUFFER] = border[:, -Occupancy.BUFFER:] = False
+        self.border = np.nonzero(border)
+
+    def touch(self, pt: dpt):
+        """
+        Reports that an agent was moved from, moved to, placed at or removed from the given point.
+        """
+        if self.dirty or not self.active:
+            return
+        x, y = pt.x - self.occupancy.xmin, pt.y - self.occupancy.ymin
+        if not (0 <= x < self.shared.shape[0] and 0 <= y < self.shared.shape[1]) or self.shared[x, y]:
+            self.dirty = True
+
+    def touch_all(self, points: np.ndarray):
+        """
+        Reports that agents were moved from, moved to, placed at or removed from the given points, an array with the
+        coordinates of a point in each row.
+        """
+        if self.dirty or not self.active or len(points) == 0:
+            return
+        x, y = points[:, 0] - self.occupancy.xmin, points[:, 1] - self.occupancy.ymin
+        inside = (x >= 0) & (x < self.shared.shape[0]) & (y >= 0) & (y < self.shared.shape[1])
+        self.dirty = bool(not inside.all() or self.shared[x, y].any())
+
+    def changed(self):
+        """
+        Reports that the agents may have changed state, which needs updating their ghosts if any is on the border.
+        """
+        if self.dirty or not self.active:
+            return
+        self.dirty = bool(self.occupancy.layers[:, self.border[0], self.border[1]].any())
+
+    def needed(self) -> bool:
+        """
+        Returns True if the context has to be synchronized, that is if any rank is dirty.
+        It must be called by all the ranks, like the synchronization itself.
+        """
+        if not self.active:
+            return False
+        return self.comm.allreduce(self.dirty, op=MPI.LOR)
+
+    def synchronized(self):
+        """
+        Reports that the context has just been synchronized.
+        """
+        self.dirty = False
@@ -0,0 +1,109 @@
+import os
+import queue
+import shlex
+import struct
+import subprocess
+import threading
+import zlib
+from typing import Optional, Tuple
+
+import numpy as np
+import pygame
+
+
+class FrameCapture:
+    """
+    Capture of the frames of the GUI, for movies of runs with or without a display.
+
+    Each frame is drawn on the off-screen surface of its own GUI, scaled to the resolution of the capture, and handed
+    as raw RGB bytes to a background thread, which writes it as a PNG file of the frame directory or pipes it to the
+    standard input of an encoder command, like ffmpeg. The compression and the encoding of the frames, which release
+    the GIL, overlap with the next ticks of the simulation, which only waits for the thread when too many frames are
+    pending.
+    """
+
+    def __init__(self, gui, directory: str, size: Tuple[int, int], encoder: str = '', pending: int = 16,
+                 rank: Optional[int] = None):
+        """
+        :param gui: The off-screen GUI drawing the captured frames
+        :param directory: The directory of the PNG files of the frames, unused with an encoder
+        :param size: The width and height in pixels of the captured frames
+        :param encoder: The command reading the frames as raw RGB from its standard input, in which {width},
+            {height} and {rank} are replaced, or an empty string to write PNG files
+        :param pending: The number of frames waiting for the thread before the capture of a frame waits for it
+        :param rank: The rank of the process, which writes its frames in its own subdirectory, or None with one rank
+        """
+        self.gui = gui
+        self.size = tuple(size)
+        self.directory = directory if rank is None else os.path.join(directory, f'rank_{rank}')
+        self.encoder = None
+        if encoder:
+            command = encoder.format(width=self.size[0], height=self.size[1], rank=rank or 0)
+            self.encoder = subprocess.Popen(shlex.split(command), stdin=subprocess.PIPE)
+        else:
+            os.makedirs(self.directory, exist_ok=True)
+        self.frames = queue.Queue(maxsize=max(pending, 1))
+        self.error = None
+        self.writer = threading.Thread(target=self._write_frames, name='FrameCapture', daemon=True)
+        self.writer.start()
+
+    def capture(self, tick: int):
+        """
+        Draws and captures the frame of the current state of the simulation.
+        :param tick: The tick of the frame, naming its PNG file
+        """
+        if self.error is not None:
+            raise RuntimeError("The writer of the captured frames failed") from self.error
+        self.gui.update()
+        surface = self.gui.screen
+        if surface.get_size() != self.size:
+            surface = pygame.transform.smoothscale(surface, self.size)
+        self.frames.put((tick, pygame.image.tobytes(surface, 'RGB')))
+
+    def close(self):
+        """
+        Waits for all the pending frames to be written and closes the encoder, if any.
+        """
+        self.frames.put(None)
+        self.writer.join()
+        if self.encoder is not None:
+            self.encoder.stdin.close()
+            self.encoder.wait()
+
+    def _write_frames(self):
+        """
+        Writes the queued frames until the end of the capture, in the background thread.
+        """
+        while (frame := self.frames.get()) is not None:
+            if self.error is not None:
+                continue  # Keep emptying the queue, so that the simulation never waits for a failed writer
+            tick, pixels = frame
+            try:
+                if self.encoder is not None:
+                    self.encoder.stdin.write(pixels)
+                else:
+                    self.write_png(os.path.join(self.directory, f'tick_{tick:08d}.png'), pixels, self.size)
+            except Exception as error:
+                self.error = error
+
+    @staticmethod
+    def write_png(path: str, pixels: bytes, size: Tuple[int, int]):
+        """
+        Writes raw RGB pixels, row by row, as a PNG file without filters. The pixels are compressed with zlib,
+        which releases the GIL, unlike pygame.image.save.
+        :param path: The path of the PNG file
+        :param pixels: The RGB bytes of the pixels
+        :param size: The width and height of the image
+        """
+        width, height = size
+        rows = np.zeros((height, 3 * width + 1), dtype=np.uint8)  # Each row starts with its filter type, none
+        rows[:, 1:] = np.frombuffer(pixels, dtype=np.uint8).reshape(height, 3 * width)
+
+        def chunk(tag: bytes, data: bytes) -> bytes:
+            return struct.pack('>I', len(data)) + tag + data + struct.pack('>I', zlib.crc32(tag + data))
+
+        with open(path, 'wb') as f:
+            f.write(b'\x89PNG\r\n\x1a\n')
+            f.write(chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)))
+            f.write(chunk(b'IDAT', zlib.compress(rows.tobytes(), 6)))
+            f.write(chunk(b'IEND', b''))
@@ -1,5 +1,7 @@
+import threading
 from typing import Any
 
+import numpy as np
 import pygame
 
 from .Environments.Brain.Brain import Brain
@@ -11,21 +13,34 @@ from MAS_Microbiota.Environments.Brain.Agents import *
 from MAS_Microbiota.Environments.Gut.Agents import *
 
 class GUI:
-    def __init__(self, width, height, envs):
+    def __init__(self, width, height, envs, offscreen=False):
+        """
+        :param width: The width in pixels of the screen
+        :param height: The height in pixels of the screen
+        :param envs: The environments of the model, by name
+        :param offscreen: Whether the screen is a surface drawn without any window, to capture its frames, rather than
+            a window opened once started and drawn by the main thread
+        """
         self.background_color = (202, 187, 185)
         self.border_color = (255, 255, 255)
         self.width = width
         self.height = height
         self.envs = envs
-        self.screen = pygame.display.set_mode((self.width, self.height))
+        self.offscreen = offscreen
+        # The window is opened once started, in the main thread, which handles its events
+        self.screen = pygame.Surface((self.width, self.height), depth=32) if offscreen else None
         self.font = pygame.font.Font(None, 36)
         self.running = True
         self.gut_context = envs[Gut.NAME].context
         self.brain_context = envs[Brain.NAME].context
         self.microbiota_context = envs[Microbiota.NAME].context
         self.grid_width, self.grid_height = Simulation.params['world.width'], Simulation.params['world.height']
-        self.paused = False
-        self.button_rects = []
+        self.resumed = threading.Event()  # Cleared while the simulation is paused
+        self.resumed.set()
+        self.quit_requested = False
+        self.frame_rate = Simulation.params.get('gui.frame_rate', 30)
+        self.snapshot = None  # Circles of the agents at the last tick, until drawn by the main thread
+        self.button_rects = self._button_rects()
         self.params = Simulation.params
 
         self.legend = [
@@ -87,41 +102,91 @@ class GUI:
             elif label == 'Sugar': self.color_dict['Substrate'][SubstrateType.SUGAR] = color
             else: self.color_dict[label] = color
 
+        # Agents are drawn as circles of the same pixels, stamped on the pixels of the screen at once
+        self.radius = 5
+        self.stamp = self._circle_stamp(self.radius)
+        self.legend_colors = [color for color, _ in self.legend]
+        self.legend_index = {color: i for i, (color, _) in enumerate(self.legend)}
+        self.styles = {}  # Style of the agents of each class in each environment, see _style
 
-    # Function to update the interface
-    def pygame_update(self):
-        for event in pygame.event.get():
-            if event.type == pygame.QUIT:
-                # If the 'X' button is clicked, stop the simulation
-                print("Ending the simulation.")
-                Simulation.model.at_end()
-                Simulation.model.comm.Abort()
 
-            elif event.type == pygame.MOUSEBUTTONDOWN:
-                self.handle_button_click(event.pos)
+    @property
+    def paused(self):
+        return not self.resumed.is_set()
+
+    # Function to open the window of the interface, in the main thread
+    def start(self):
+        self.screen = pygame.display.set_mode((self.width, self.height))
+        pygame.display.set_caption("Gut-Brain Axis Model")
+        self.snapshot = self.take_snapshot()
 
-        while self.paused:
+    # Function to update the interface after each tick
+    def pygame_update(self):
+        """
+        Hands the circles of the agents to the main thread, if it drew the previous ones, so that the ticks never
+        wait for the frames, and blocks without using the CPU while the simulation is paused.
+        """
+        self.resumed.wait()
+        if self.quit_requested:
+            # If the 'X' button is clicked, stop the simulation
+            Simulation.model.abort()
+        if self.snapshot is None:
+            self.snapshot = self.take_snapshot()
+
+    # Function to draw the last snapshot and handle the events of the window, in the main thread
+    def run(self, simulation: threading.Thread):
+        """
+        Draws the snapshots of the simulation as they come, at most at the frame rate, and handles the events of the
+        window even while the simulation is paused or busy with a tick, until the thread of the simulation ends.
+        SDL only supports the window and its events in the main thread, so the simulation runs in its own thread.
+        Only this thread writes None in the snapshot, and only the simulation writes a new one in its place.
+        :param simulation: The thread running the schedule of the simulation
+        """
+        clock = pygame.time.Clock()
+        while simulation.is_alive():
             for event in pygame.event.get():
                 if event.type == pygame.QUIT:
-                    # If the 'X' button is clicked, stop the simulation
-                    print("Ending the simulation.")
-                    Simulation.model.at_end()
-                    Simulation.model.comm.Abort()
+                    # If the 'X' button is clicked, stop the simulation at the end of its tick
+                    self.request_quit()
 
                 elif event.type == pygame.MOUSEBUTTONDOWN:
                     self.handle_button_click(event.pos)
 
-        # Updates the Pygame GUI based on the current state of the Repast simulation
-        self.update()
-        pygame.display.flip()
+            snapshot = self.snapshot
+            if snapshot is not None:
+                self.draw(*snapshot)
+                pygame.display.flip()
+                self.snapshot = None
+            clock.tick(self.frame_rate)
+
+    # Function to stop the simulation at the end of its tick, even if paused
+    def request_quit(self):
+        self.quit_requested = True
+        self.resumed.set()
 
-    # Function to update the screen after each tick
+    # Function to update the screen with the current state of the simulation
     def update(self):
+        self.draw(*self.take_snapshot())
+
+    # Function to take the centers and legend indices of the circles of all the agents, in the order they are drawn
+    def take_snapshot(self):
         # Update contexts
         self.gut_context = self.envs[Gut.NAME].context
         self.brain_context = self.envs[Brain.NAME].context
         self.microbiota_context = self.envs[Microbiota.NAME].context
 
+        # Define areas, and take the agents of the contexts first and then the stored resources
+        microbiota_area = (50, 50, self.width // 3 - 47, self.height - 300)
+        gut_area = (self.width // 3 + 3, 50, self.width // 3 - 3, self.height - 300)
+        brain_area = (2 * self.width // 3 + 3, 50, self.width // 3 - 50, self.height - 300)
+        areas = ((self.envs[Microbiota.NAME], microbiota_area), (self.envs[Gut.NAME], gut_area),
+                 (self.envs[Brain.NAME], brain_area))
+        circles = [self._agent_circles(env.context.agents(), area) for env, area in areas]
+        circles += [self._store_circles(env.store, area) for env, area in areas if env.store is not None]
+        return tuple(np.concatenate(column) for column in zip(*circles))
+
+    # Function to draw the screen from a snapshot
+    def draw(self, xs, ys, codes):
         # Fill background and draw border rectangle
         self.screen.fill(self.background_color)
         inner_rect = (50, 50, self.width - 100, self.height - 300)
@@ -140,55 +205,117 @@ class GUI:
         pygame.draw.line(self.screen, (0, 0, 0),
                          (2 * self.width // 3, inner_rect[1]),
                          (2 * self.width // 3, inner_rect[1] + inner_rect[3]), 4)
-        # Draw buttons and legend
+        # Draw buttons, legend and agents
         self.draw_buttons()
         self.draw_legend()
-
-        # Define areas and draw agents
-        microbiota_area = (50, 50, self.width // 3 - 47, self.height - 300)
-        gut_area = (self.width // 3 + 3, 50, self.width // 3 - 3, self.height - 300)
-        brain_area = (2 * self.width // 3 + 3, 50, self.width // 3 - 50, self.height - 300)
-        self._draw_context_agents(self.microbiota_context, microbiota_area)
-        self._draw_context_agents(self.gut_context, gut_area)
-        self._draw_context_agents(self.brain_context, brain_area)
+        self.draw_agents(xs, ys, codes)
 
     def _draw_centered_text(self, text, x_center, y):
         rendered_text = self.font.render(text, True, (0, 0, 0))
         text_x_position = x_center - rendered_text.get_width() // 2
         self.screen.blit(rendered_text, (text_x_position, y))
 
-    def _draw_context_agents(self, context, area):
-        self.draw_agents(context.agents(), area)
-
-    # Function to draw agents on the screen
-    def draw_agents(self, agents, area):
-        radius = 5
-        
+    # Function to draw agents on the screen, given the pixel centers and the legend indices of their circles
+    def draw_agents(self, xs, ys, codes):
+        """
+        Draws the circles of the agents in the given order, each over the previous ones, as pygame.draw.circle would
+        one at a time. Every pixel takes the color of the last circle covering it, found in a single pass over the
+        pixels of the circles within their bounding box, and the colors are written in the pixels of the screen
+        at once.
+        """
+        if len(xs) == 0:
+            return
+        x0, y0 = int(xs.min()) - self.radius, int(ys.min()) - self.radius
+        width, height = int(xs.max()) + self.radius + 1 - x0, int(ys.max()) + self.radius + 1 - y0
+        # Agents of the same grid cell share the center of their circles, so only the last one of each center is seen
+        last = np.full(width * height, -1, dtype=np.int64)
+        np.maximum.at(last, (ys - y0) * width + (xs - x0), np.arange(len(xs)))
+        centers = np.flatnonzero(last >= 0)
+        owner = np.full(width * height, -1, dtype=np.int64)
+        circle_pixels = (centers[:, None] + (self.stamp[:, 1] * width + self.stamp[:, 0])[None, :]).ravel()
+        np.maximum.at(owner, circle_pixels, np.repeat(last[centers], len(self.stamp)))
+        owner = owner.reshape(height, width)
+
+        # The rows of the screen, as the pixel arrays of pygame are indexed by column first
+        pixels = pygame.surfarray.pixels2d(self.screen).T
+        colors = np.array([self.screen.map_rgb(color) for color in self.legend_colors], dtype=pixels.dtype)[codes]
+        np.copyto(pixels[y0:y0 + height, x0:x0 + width], colors[owner], where=owner >= 0)
+        del pixels  # Unlocks the screen
+
+    # Function to get the pixel centers and the legend indices of the displayed agents of an environment
+    def _agent_circles(self, agents, area):
+        xs, ys, codes = [], [], []
+        styles = self.styles
         for agent in agents:
-            if ((isinstance(agent, Bacterium) and Simulation.params['agents_display'][agent.context]["Bacterium"]) or
-                (not isinstance(agent, Bacterium) and Simulation.params['agents_display'][agent.context][agent.__class__.__name__])):
-                x_center = area[0] + (agent.pt.x / self.grid_width) * area[2]
-                y_center = area[1] + (agent.pt.y / self.grid_height) * area[3]
-
-                # Adjust x and y to keep the entire circle within the area
-                x = max(area[0] + radius, min(x_center, area[0] + area[2] - radius))
-                y = max(area[1] + radius, min(y_center, area[1] + area[3] - radius))
-
-                color = self.get_agent_color(agent)
-                pygame.draw.circle(self.screen, color, (int(x), int(y)), radius)
-
-    # Function to get the color of an agent based on its type and state
-    def get_agent_color(self, agent):
-        class_name = agent.__class__.__name__
-        if isinstance(self.color_dict[class_name], dict):
-            if isinstance(agent, Neurotransmitter):
-                return self.color_dict[class_name][agent.neurotrans_type]
-            elif isinstance(agent, Substrate):
-                return self.color_dict[class_name][agent.sub_type]
+            key = (type(agent), agent.context)
+            style = styles[key] if key in styles else self._style(*key)
+            if style is None:
+                continue
+            pt = agent.pt
+            xs.append(pt.x)
+            ys.append(pt.y)
+            codes.append(style if isinstance(style, int) else style[1][getattr(agent, style[0])])
+        return self._centers(np.array(xs, dtype=np.float64), np.array(ys, dtype=np.float64), area) + \
+            (np.array(codes, dtype=np.int64),)
+
+    # Function to get the pixel centers and the legend indices of the displayed resources of a store
+    def _store_circles(self, store, area):
+        rows = np.flatnonzero(store.alive[:store.size])
+        types, subtypes = store.types[rows], store.subtypes[rows]
+        codes = np.full(len(rows), -1, dtype=np.int64)
+        for agent_type in np.unique(types).tolist():
+            style = self._style(store.HANDLES[agent_type].agent_class, store.context)
+            if style is None:
+                continue
+            if isinstance(style, int):
+                codes[types == agent_type] = style
             else:
-                return self.color_dict[class_name][agent.state]
+                for subtype, code in style[1].items():
+                    codes[(types == agent_type) & (subtypes == subtype.value)] = code
+        shown = codes >= 0
+        return self._centers(store.x[rows][shown].astype(np.float64), store.y[rows][shown].astype(np.float64),
+                             area) + (codes[shown],)
+
+    # Function to get the pixel centers of the circles of agents at the given grid coordinates in an area
+    def _centers(self, xs, ys, area):
+        x_centers = area[0] + (xs / self.grid_width) * area[2]
+        y_centers = area[1] + (ys / self.grid_height) * area[3]
+        # Adjust x and y to keep the entire circle within the area
+        x = np.maximum(area[0] + self.radius, np.minimum(x_centers, area[0] + area[2] - self.radius))
+        y = np.maximum(area[1] + self.radius, np.minimum(y_centers, area[1] + area[3] - self.radius))
+        return x.astype(np.int64), y.astype(np.int64)
+
+    # Function to get how the agents of a class are drawn in an environment
+    def _style(self, agent_class, context):
+        """
+        Returns None if the agents of the given class are not displayed in the given environment, the legend index
+        of their color if it does not depend on their state, or else a tuple with the name of their attribute
+        selecting the color and a dictionary from its values to the legend indices.
+        """
+        class_name = agent_class.__name__
+        display = Simulation.params['agents_display'][context]
+        if not display["Bacterium" if issubclass(agent_class, Bacterium) else class_name]:
+            style = None
+        elif isinstance(self.color_dict[class_name], dict):
+            if class_name == 'Neurotransmitter':
+                attribute = 'neurotrans_type'
+            elif class_name == 'Substrate':
+                attribute = 'sub_type'
+            else:
+                attribute = 'state'
+            style = (attribute, {value: self.legend_index[color]
+                                 for value, color in self.color_dict[class_name].items()})
         else:
-            return self.color_dict[class_name]
+            style = self.legend_index[self.color_dict[class_name]]
+        self.styles[(agent_class, context)] = style
+        return style
+
+    # Function to get the offsets from the center of the pixels of a circle drawn by pygame
+    @staticmethod
+    def _circle_stamp(radius):
+        surface = pygame.Surface((2 * radius + 1, 2 * radius + 1))
+        pygame.draw.circle(surface, (255, 255, 255), (radius, radius), radius)
+        return np.argwhere(pygame.surfarray.array3d(surface)[:, :, 0] > 0) - radius
 
     # Function to draw the legend on the screen
     def draw_legend(self):
@@ -238,9 +365,8 @@ class GUI:
                 self.screen.blit(legend_text_surface, (text_x, text_y))
                 item += 1
 
-    # Function to draw the play and stop buttons on the screen
-    def draw_buttons(self):
-        button_font = pygame.font.Font(None, 30)
+    # Function to compute the rectangles of the play and stop buttons, once
+    def _button_rects(self):
         buttons = ["Play", "Stop"]
         button_width = 120
         button_height = 40
@@ -249,17 +375,23 @@ class GUI:
         total_width = (button_width * len(buttons)) + (button_spacing * (len(buttons) - 1))
         start_x = (self.width - total_width) // 4 * 3
 
+        button_rects = []
         for i, button_text in enumerate(buttons):
             button_x = start_x + i * (button_width + button_spacing)
             button_rect = pygame.Rect(button_x, self.height - 150, button_width, button_height)
+            button_rects.append((button_rect, button_text))
+        return button_rects
+
+    # Function to draw the play and stop buttons on the screen
+    def draw_buttons(self):
+        button_font = pygame.font.Font(None, 30)
+        for button_rect, button_text in self.button_rects:
             pygame.draw.rect(self.screen, (137, 106, 103), button_rect)
             button_surface = button_font.render(button_text, True, (0, 0, 0))
             # Center the text on the button
             button_text_rect = button_surface.get_rect(center=button_rect.center)
             self.screen.blit(button_surface, button_text_rect.topleft)
 
-            self.button_rects.append((button_rect, button_text))
-
     # Function to handle mouse clicks on the buttons
     def handle_button_click(self, mouse_pos):
         for button_rect, button_text in self.button_rects:
@@ -269,6 +401,6 @@ class GUI:
     # Function to handle button clicks
     def on_button_click(self, button_text):
         if button_text == "Play":
-            self.paused = False
+            self.resumed.set()
         elif button_text == "Stop":
-            self.paused = True
\ No newline at end of file
+            self.resumed.clear()
\ No newline at end of file
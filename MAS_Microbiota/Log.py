@@ -1,4 +1,6 @@
 from dataclasses import dataclass
+from typing import Optional
+
 from .Utils import Simulation
 from MAS_Microbiota.Environments.Gut.Agents import *
 from MAS_Microbiota.Environments.Brain.Agents import *
@@ -45,125 +47,82 @@ class Log:
     norepinephrine: int = 0
 
 
+    # Names of the counts kept by the population counters of the model, as agents come, go and change state
+    AGENT_COUNTS = ('aep_active', 'aep_hyperactive', 'alpha_protein_gut', 'tau_protein_gut', 'alpha_cleaved_gut',
+                    'tau_cleaved_gut', 'alpha_oligomer_gut', 'tau_oligomer_gut', 'microbiota_good_bacteria_class',
+                    'microbiota_pathogenic_bacteria_class', 'SCFA', 'precursor', 'resting_microglia',
+                    'active_microglia', 'healthy_neuron', 'damaged_neuron', 'cleaved_alpha_syn_brain',
+                    'alpha_syn_oligomer_brain', 'cleaved_tau_brain', 'tau_oligomer_brain', 'dopamine', 'serotonin',
+                    'norepinephrine')
+
+    @staticmethod
+    def count_name(agent, env_name: str) -> Optional[str]:
+        """
+        Returns the name of the count an agent held by the given environment contributes to, if any.
+        It is used by the population counters whenever an agent is added, removed or changes state.
+        :param agent: The agent to classify
+        :param env_name: The name of the environment holding the agent
+        :return: The name of a field of the log, or None if the agent is not counted
+        """
+        if isinstance(agent, Oligomer):
+            if env_name == 'brain':
+                return 'alpha_syn_oligomer_brain' if agent.name == ProteinName.ALPHA_SYN else 'tau_oligomer_brain'
+            return ('alpha' if agent.name == ProteinName.ALPHA_SYN else 'tau') + '_oligomer_' + env_name
+        elif isinstance(agent, CleavedProtein):
+            if env_name == 'brain':
+                return 'cleaved_alpha_syn_brain' if agent.name == ProteinName.ALPHA_SYN else 'cleaved_tau_brain'
+            return ('alpha' if agent.name == ProteinName.ALPHA_SYN else 'tau') + '_cleaved_' + env_name
+        elif isinstance(agent, Neuron):
+            if agent.state == NeuronState.HEALTHY:
+                return 'healthy_neuron'
+            elif agent.state == NeuronState.DAMAGED:
+                return 'damaged_neuron'
+        elif isinstance(agent, Microglia):
+            return 'active_microglia' if agent.state == MicrogliaState.ACTIVE else 'resting_microglia'
+        elif type(agent) == Protein:
+            return ('alpha' if agent.name == ProteinName.ALPHA_SYN else 'tau') + '_protein_' + env_name
+        elif type(agent) == AEP:
+            return 'aep_active' if agent.state == AEPState.ACTIVE else 'aep_hyperactive'
+        elif isinstance(agent, Neurotransmitter):
+            return agent.neurotrans_type.name.lower()
+        elif isinstance(agent, Bacterium):
+            if agent.causes_inflammation():
+                return 'microbiota_pathogenic_bacteria_class'
+            return 'microbiota_good_bacteria_class'
+        elif isinstance(agent, SCFA):
+            return None if agent.toRemove else 'SCFA'
+        elif isinstance(agent, Precursor):
+            return None if agent.toRemove else 'precursor'
+        return None
+
     # Function to log the counts of the agents
     def log_counts(self):
         tick = Simulation.model.runner.schedule.tick
+        counters = Simulation.model.counters
 
-        counts = {
-            "aep_active": 0,
-            "aep_hyperactive": 0,
-            "alpha_protein_gut": 0,
-            "tau_protein_gut": 0,
-            "alpha_cleaved_gut": 0,
-            "tau_cleaved_gut": 0,
-            "alpha_oligomer_gut": 0,
-            "tau_oligomer_gut": 0,
-            "microglia_resting": 0,
-            "microglia_active": 0,
-            "neuron_healthy": 0,
-            "neuron_damaged": 0,
-            "alpha_cleaved_brain": 0,
-            "tau_cleaved_brain": 0,
-            "alpha_oligomer_brain": 0,
-            "tau_oligomer_brain": 0, 
-            # new lines
-            "SCFA": 0,
-            "precursor": 0,
-            "neurotransmitter": 0,
-            "bacteria_good": 0,
-            "bacteria_pathogenic": 0,
-            "dopamine": 0,
-            "serotonin": 0,
-            "norepinephrine": 0
-        }
+        for name in self.AGENT_COUNTS:
+            setattr(self, name, counters[name])
 
+        # Resources that are not agents are counted by their own containers
         for env_name in Simulation.model.envs:
-            context = Simulation.model.envs[env_name].context
-            for agent in context.agents():
-                if isinstance(agent, Oligomer):
-                    if agent.name == ProteinName.ALPHA_SYN:
-                        counts["alpha_oligomer_"+env_name] += 1
-                    else:
-                        counts["tau_oligomer_"+env_name] += 1
-                elif isinstance(agent, CleavedProtein):
-                    if agent.name == ProteinName.ALPHA_SYN:
-                        counts["alpha_cleaved_"+env_name] += 1
-                    else:
-                        counts["tau_cleaved_"+env_name] += 1
-                elif isinstance(agent, Neuron):
-                    if agent.state == NeuronState.HEALTHY:
-                        counts["neuron_healthy"] += 1
-                    elif agent.state == NeuronState.DAMAGED:
-                        counts["neuron_damaged"] += 1
-                elif isinstance(agent, Microglia):
-                    if agent.state == MicrogliaState.ACTIVE:
-                        counts["microglia_active"] += 1
-                    else:
-                        counts["microglia_resting"] += 1
-                elif (type(agent) == Protein):
-                    if (agent.name == ProteinName.ALPHA_SYN):
-                        counts["alpha_protein_"+env_name] += 1
-                    else:
-                        counts["tau_protein_"+env_name] += 1
-                elif (type(agent) == AEP):
-                    if (agent.state == AEPState.ACTIVE):
-                        counts["aep_active"] += 1
-                    else:
-                        counts["aep_hyperactive"] += 1
-                elif isinstance(agent, Neurotransmitter): ### new lines
-                    if (agent.neurotrans_type == NeurotransmitterType.DOPAMINE):
-                        counts["dopamine"] += 1
-                    elif (agent.neurotrans_type == NeurotransmitterType.SEROTONIN):
-                        counts["serotonin"] += 1
-                    else:
-                        counts["norepinephrine"] += 1
-                elif isinstance(agent, Bacterium):
-                    if agent.causes_inflammation():
-                        counts["bacteria_pathogenic"] += 1
-                    else:
-                        counts["bacteria_good"] += 1
-                elif isinstance(agent, SCFA):
-                    if not agent.toRemove:
-                        counts["SCFA"] += 1
-                elif isinstance(agent, Precursor):
-                    if not agent.toRemove:
-                        counts["precursor"] += 1
+            store = Simulation.model.envs[env_name].store
+            if store is not None:
+                if counters.counts('SCFA'):
+                    self.SCFA += store.count(SCFA.TYPE, include_removed=False)
+                if counters.counts('precursor'):
+                    self.precursor += store.count(Precursor.TYPE, include_removed=False)
+                for neurotrans_type in NeurotransmitterType:
+                    name = neurotrans_type.name.lower()
+                    if counters.counts(name):
+                        setattr(self, name, getattr(self, name) + store.count(Neurotransmitter.TYPE, neurotrans_type))
+
+        fields = Simulation.model.envs['microbiota'].fields
+        if fields is not None and counters.counts('SCFA'):
+            self.SCFA += fields[SCFA.TYPE].total()
 
-        # brain
-        self.healthy_neuron = counts["neuron_healthy"]
-        self.damaged_neuron = counts["neuron_damaged"]
         self.dead_neuron = Simulation.model.dead_neuron
         self.cytokine_pro_inflammatory = Simulation.model.pro_cytokine
         self.cytokine_non_inflammatory = Simulation.model.anti_cytokine
-        self.cleaved_alpha_syn_brain = counts["alpha_cleaved_brain"]
-        self.cleaved_tau_brain = counts["tau_cleaved_brain"]
-        self.alpha_syn_oligomer_brain = counts["alpha_oligomer_brain"]
-        self.tau_oligomer_brain = counts["tau_oligomer_brain"]
-        self.resting_microglia = counts["microglia_resting"]
-        self.active_microglia = counts["microglia_active"]
-        self.serotonin = counts["serotonin"]
-        self.dopamine = counts["dopamine"]
-        self.norepinephrine = counts["norepinephrine"]
-
-        # gut
-        self.aep_active = counts["aep_active"]
-        self.aep_hyperactive = counts["aep_hyperactive"]
-        self.alpha_protein_gut = counts["alpha_protein_gut"]
-        self.tau_protein_gut = counts["tau_protein_gut"]
-        self.alpha_cleaved_gut = counts["alpha_cleaved_gut"]
-        self.tau_cleaved_gut = counts["tau_cleaved_gut"]
-        self.alpha_oligomer_gut = counts["alpha_oligomer_gut"]
-        self.tau_oligomer_gut = counts["tau_oligomer_gut"]
-        self.microbiota_good_bacteria_class = Simulation.model.microbiota_good_bacteria_count
-        self.microbiota_pathogenic_bacteria_class = Simulation.model.microbiota_pathogenic_bacteria_count
-        self.microbiota_good_bacteria_class = counts["bacteria_good"]
-        self.microbiota_pathogenic_bacteria_class = counts["bacteria_pathogenic"]
-        self.SCFA = counts["SCFA"]
-        self.precursor = counts["precursor"]
-
-        
         self.barrier_impermeability = Simulation.model.epithelial_barrier_impermeability
 
-    
-
-        Simulation.model.data_set.log(tick)
\ No newline at end of file
+        Simulation.model.data_set.log(tick)
@@ -1,32 +1,41 @@
+import dataclasses
+import os
+import threading
 from typing import List
 
 import numpy as np
-import pygame
 from mpi4py import MPI
-from repast4py import context as ctx
 from repast4py import space, schedule, logging, random
 from repast4py.space import DiscretePoint as dpt
 
-from MAS_Microbiota.GUI import GUI
 from MAS_Microbiota.Utils import *
 from MAS_Microbiota.Environments.Gut.Gut import Gut
 from MAS_Microbiota.Environments.Brain.Brain import Brain
 from MAS_Microbiota.Environments.Microbiota.Microbiota import Microbiota
 from MAS_Microbiota.Environments.GutBrainInterface import GutBrainInterface
+from MAS_Microbiota.Environments.ResourceStore import ResourceStore
+from MAS_Microbiota.Environments.EnvironmentContext import EnvironmentContext
+from MAS_Microbiota.Environments.RecordGrid import RecordGrid
 from MAS_Microbiota.Environments.Microbiota.Agents import *
 from MAS_Microbiota.Environments.Gut.Agents import *
 from MAS_Microbiota.Environments.Brain.Agents import *
-from MAS_Microbiota.AgentRestorer import restore_agent
+from MAS_Microbiota.AgentRestorer import restore_agent, restore_agents
 from MAS_Microbiota.Log import Log
+from MAS_Microbiota.Checkpoint import Checkpoint
 
 
 class Model():
 
     # Initialize the model
     def __init__(self, comm: MPI.Intracomm):
+        Simulation.set_model(self)  # Agents and environments created while initializing can access the model
         self.comm = comm
         self.rank = comm.Get_rank() #Process rank id ranging from 0 to world_size-1
         self.world_size = self.comm.Get_size()  # Number of processes participating in the simulation when using the MPI
+        self.headless = Simulation.params.get('headless', False)  # Whether the simulation runs without the pygame GUI
+        # Checkpoint the simulation resumes from, if restarted, and the tick it was written at
+        self.restart = Checkpoint.find(Simulation.params['restart']) if Simulation.params.get('restart') else None
+        self.start_tick = self.restart.tick if self.restart is not None else 0
 
         self.init_environments(comm)
         self.init_gui()
@@ -40,12 +49,15 @@ class Model():
 
         # Initialize the agents
         self.added_agents_id = 0
-        self.distribute_all_agents(Gut.initial_agents(), Gut.NAME)
-        self.distribute_all_agents(Brain.initial_agents(), Brain.NAME)
-        self.distribute_all_agents(Microbiota.initial_agents(), Microbiota.NAME)
+        if self.restart is not None:
+            self.restart.restore(self)
+        else:
+            self.distribute_all_agents(Gut.initial_agents(), Gut.NAME)
+            self.distribute_all_agents(Brain.initial_agents(), Brain.NAME)
+            self.distribute_all_agents(Microbiota.initial_agents(), Microbiota.NAME)
 
         # Synchronize the contexts
-        for _, env in self.envs.items(): env.context.synchronize(restore_agent)
+        for _, env in self.envs.items(): env.synchronize(restore_agent)
 
     def init_environments(self, comm: MPI.Intracomm):
         """
@@ -55,16 +67,32 @@ class Model():
         # Initialization of environment dictionary
         self.envs = dict()
 
+        # Population counters read by the log, kept up to date by the contexts of the environments
+        self.counters = Counters(Log.count_name, Simulation.params.get('log_counts'))
+
+        # Free lists recycling the short-lived agents removed from the environments
+        self.pools = AgentPools((Substrate, Neurotransmitter, SCFA, Cytokine)
+                                if Simulation.params.get('agent_pools', True) else ())
+
+        # Agents restored from the other ranks, evicted when they are no longer ghosts
+        self.ghost_cache = GhostCache(Simulation.params.get('ghost_cache_size', 100000))
+
         # Create box grid for the environments
         box = space.BoundingBox(0, Simulation.params['world.width'] - 1, 0, Simulation.params['world.height'] - 1, 0, 0)
 
         # Create shared contexts and grid for the environments
         for Env in [Microbiota, Gut, Brain]:
-            context = ctx.SharedContext(comm)
+            context = EnvironmentContext(comm, Env.NAME, self.counters)
             grid = self.init_grid(Env.NAME+'_grid', box, context)
             self.envs[Env.NAME] = Env(context, grid)
-
-        self.ngh_finder = GridNghFinder(0, 0, box.xextent, box.yextent)
+            if Simulation.params.get('resource_store', False):
+                self.envs[Env.NAME].store = ResourceStore(Env.NAME, grid, self.rank)
+
+        # The grids share the same partition, so one table covers the local cells and the buffer of every grid
+        bounds = self.envs[Microbiota.NAME].grid.get_local_bounds()
+        region = (max(bounds.xmin - 1, 0), max(bounds.ymin - 1, 0),
+                  min(bounds.xmin + bounds.xextent, box.xextent), min(bounds.ymin + bounds.yextent, box.yextent))
+        self.ngh_finder = GridNghTable(0, 0, box.xextent, box.yextent, region)
         self.gutBrainInterface = GutBrainInterface(self.envs)
 
 
@@ -76,19 +104,42 @@ class Model():
         :param context: The context to which the grid belongs
         :return: The initialized grid
         """
-        grid = space.SharedGrid(name=name, bounds=box, borders=space.BorderType.Sticky,
-                                occupancy=space.OccupancyType.Multiple, buffer_size=1, comm=self.comm)
+        grid = RecordGrid(name=name, bounds=box, borders=space.BorderType.Sticky,
+                          occupancy=space.OccupancyType.Multiple, buffer_size=1, comm=self.comm,
+                          restore=restore_agents)
         context.add_projection(grid)
         return grid
 
     def init_gui(self):
         """
-        Initializes the pygame GUI and its objects for the model.
+        Initializes the pygame GUI and its objects for the model, and the capture of its frames if enabled.
+        The window of the GUI is drawn by the main thread while the simulation runs in its own thread, and the captured
+        frames are drawn off-screen by another GUI, through the dummy video driver of SDL in headless mode. In headless
+        mode the screen is left to None, and without a capture neither pygame nor the GUI module are imported.
         """
+        self.screen = None
+        self.capture = None
+        if self.headless and Simulation.params.get('capture.interval', 0) <= 0:
+            return
+
+        if self.headless:
+            os.environ.setdefault('SDL_VIDEODRIVER', 'dummy')
+        import pygame
+        from MAS_Microbiota.GUI import GUI
+
         pygame.init()
-        self.screen = GUI(width=1600, height=800, envs=self.envs)
-        pygame.display.set_caption("Gut-Brain Axis Model")
-        self.screen.update()
+        if not self.headless:
+            self.screen = GUI(width=1600, height=800, envs=self.envs)
+            self.screen.start()
+        if Simulation.params.get('capture.interval', 0) > 0:
+            from MAS_Microbiota.FrameCapture import FrameCapture
+            self.capture = FrameCapture(GUI(width=1600, height=800, envs=self.envs, offscreen=True),
+                                        Simulation.params.get('capture.dir', 'output/frames'),
+                                        (Simulation.params.get('capture.width', 1600),
+                                         Simulation.params.get('capture.height', 800)),
+                                        Simulation.params.get('capture.encoder', ''),
+                                        Simulation.params.get('capture.pending', 16),
+                                        self.rank if self.world_size > 1 else None)
 
 
     def init_schedule(self, comm: MPI.Intracomm):
@@ -97,31 +148,136 @@ class Model():
         The schedule represents the order in which the model's events are executed in each tick of the simulation.
         """
         self.runner = schedule.init_schedule_runner(comm)
-        self.runner.schedule_repeating_event(1, 1, self.envs[Microbiota.NAME].step)
-        self.runner.schedule_repeating_event(1, 1, self.update_microbiota_params)
-        self.runner.schedule_repeating_event(1, 1, self.envs[Gut.NAME].step)
-        self.runner.schedule_repeating_event(1, 2, self.envs[Gut.NAME].microbiota_dysbiosis_step)
-        self.runner.schedule_repeating_event(1, 6, self.teleport_resources_step)
-        self.runner.schedule_repeating_event(1, 1, self.envs[Brain.NAME].step, priority_type=0)
-        self.runner.schedule_repeating_event(1, 1, self.screen.pygame_update, priority_type=1)
-        self.runner.schedule_repeating_event(1, 1, self.counts.log_counts, priority_type=1) #TODO: temporaneo
+        self.runner.schedule_repeating_event(self.resume_tick(1, 1), 1, self.envs[Microbiota.NAME].step)
+        self.runner.schedule_repeating_event(self.resume_tick(1, 1), 1, self.update_microbiota_params)
+        self.runner.schedule_repeating_event(self.resume_tick(1, 1), 1, self.envs[Gut.NAME].step)
+        self.runner.schedule_repeating_event(self.resume_tick(1, 2), 2, self.envs[Gut.NAME].microbiota_dysbiosis_step)
+        self.runner.schedule_repeating_event(self.resume_tick(1, 6), 6, self.teleport_resources_step)
+        self.runner.schedule_repeating_event(self.resume_tick(1, 1), 1, self.envs[Brain.NAME].step, priority_type=0)
+        if self.screen is not None:
+            self.runner.schedule_repeating_event(self.resume_tick(1, 1), 1, self.screen.pygame_update, priority_type=1)
+        if self.capture is not None:
+            interval = Simulation.params['capture.interval']
+            self.runner.schedule_repeating_event(self.resume_tick(interval, interval), interval, self.capture_frame,
+                                                 priority_type=1)
+        self.runner.schedule_repeating_event(self.resume_tick(1, 1), 1, self.counts.log_counts, priority_type=1) #TODO: temporaneo
+        self.runner.schedule_repeating_event(self.resume_tick(1, 1), 1, self.pools.release, priority_type=1)
+        interval = Simulation.params.get('checkpoint.interval', 0)
+        if interval > 0:
+            # Last of the tick, so that checkpoints neither change the order of the other events nor miss their effects
+            self.runner.schedule_repeating_event(self.resume_tick(interval, interval), interval, self.write_checkpoint,
+                                                 priority_type=1)
         self.runner.schedule_stop(Simulation.params['stop.at'])
         self.runner.schedule_end_event(self.at_end)
 
+    def resume_tick(self, at: float, interval: float) -> float:
+        """
+        Returns the first tick, after the tick the simulation starts from, of an event repeating at the given
+        interval from the given tick. It is the given tick unless the simulation is restarted from a checkpoint.
+        """
+        if at > self.start_tick:
+            return at
+        return at + interval * ((self.start_tick - at) // interval + 1)
+
+    def write_checkpoint(self):
+        """
+        Writes a checkpoint of the simulation at the current tick, from which it can be restarted.
+        """
+        Checkpoint.write(self, Simulation.params.get('checkpoint.dir', 'output/checkpoints'),
+                         Simulation.params.get('checkpoint.keep', 2))
+
+    def capture_frame(self):
+        """
+        Captures the frame of the GUI at the current tick.
+        """
+        self.capture.capture(int(self.runner.schedule.tick))
+
+    def pause_at(self, tick: float):
+        """
+        Stops the simulation at the end of the given tick, after all its events. Unlike the stop of the schedule, the
+        pause does not take part in the random order of the events of the tick, so a simulation started again after
+        it has the same results as a simulation never paused.
+        """
+        self.runner.schedule_event(tick, self.runner.stop, priority_type=1)
+
+    def branch(self, params: dict):
+        """
+        Prepares the simulation, paused at the end of a burn-in, to continue with the given parameters as a branch
+        sharing the burn-in with other branches, like a scenario of a warm-started sweep. The scenario agents are
+        added or removed to match the counts of the new parameters, and the new log file starts with the rows logged
+        during the burn-in. The simulation continues when started again.
+        :param params: The parameters of the branch, whose stop.at is after the current tick and not after the
+        stop.at of the current parameters
+        """
+        with open(self.data_set.fpath) as f:
+            rows = f.readlines()[1:]
+        if params['stop.at'] != Simulation.params['stop.at']:
+            self.runner.schedule_stop(params['stop.at'])
+        Simulation.params = params
+        self.init_gut_brain_interface_thresholds()
+        self.update_scenario_agents()
+
+        self.data_set = self.create_data_set(self.data_set._data_loggers)
+        if self.rank == 0:
+            with open(self.data_set.fpath, 'a') as f:
+                f.writelines(rows)
+        self.runner.go = True
+
+    # Function to add or remove the external input and treatment agents to match the counts of the parameters
+    def update_scenario_agents(self):
+        microbiota = self.envs[Microbiota.NAME]
+        current = {}
+        for agent in microbiota.agents_of_class(ExternalInput) + microbiota.agents_of_class(Treatment):
+            state = agent.input_type if isinstance(agent, ExternalInput) else agent.treatment_type
+            current.setdefault((type(agent), state), []).append(agent)
+        wanted = {(agent_class, state): self.calculate_partitioned_count(Simulation.params[key])
+                  for key, agent_class, state in Microbiota.initial_agents() if agent_class in (ExternalInput, Treatment)}
+
+        for (agent_class, state), count in wanted.items():
+            missing = count - len(current.get((agent_class, state), []))
+            if missing > 0:
+                self.create_agents(agent_class, missing, state, Microbiota.NAME)
+        for kind, agents in current.items():
+            for agent in agents[wanted.get(kind, 0):]:
+                microbiota.remove(agent)
+
     def init_rng(self):
         """
         Initializes the random number generators for the model.
+        The generator of repast4py, seeded alike on all the ranks, is left to the schedule, which shuffles the events
+        of each tick with it, and all the draws of the model are made from the generators of the rank in draws.
         """
-        random.seed = Simulation.params['seed']
+        random.init(Simulation.params['seed'])
         self.rng: np.random.Generator = random.default_rng
+        self.draws = RandomService(Simulation.params['seed'], self.rank,
+                                   Simulation.params.get('random_block_size', 4096))
 
     def init_log(self):
         """
         Initializes the log for the model.
         """
         self.counts = Log()
-        loggers = logging.create_loggers(self.counts, op=MPI.SUM, rank=self.rank)
-        self.data_set = logging.ReducingDataSet(loggers, self.comm, Simulation.params['log_file'], buffer_size=1)
+        names = Simulation.params.get('log_counts')
+        if names is not None:
+            unknown = set(names) - {field.name for field in dataclasses.fields(Log)}
+            if unknown:
+                raise ValueError(f"Unknown log counts: {', '.join(sorted(unknown))}")
+            names = {name: None for name in names}
+        loggers = logging.create_loggers(self.counts, op=MPI.SUM, rank=self.rank, names=names)
+        # A restarted simulation logs again the rows of the checkpointed run in its new log file
+        rows = self.restart.log_rows() if self.restart is not None and self.rank == 0 else []
+        self.data_set = self.create_data_set(loggers)
+        if rows:
+            with open(self.data_set.fpath, 'a') as f:
+                f.writelines(rows)
+
+    def create_data_set(self, loggers: List[logging.ReducingDataLogger]):
+        """
+        Creates the data set where the logged counts of each tick are collected.
+        :param loggers: The loggers of the counts
+        :return: A data set writing the counts reduced over all ranks to the log file
+        """
+        return logging.ReducingDataSet(loggers, self.comm, Simulation.params['log_file'], buffer_size=1)
 
     def update_microbiota_params(self):
         """
@@ -133,6 +289,9 @@ class Model():
     def init_gut_brain_interface_params(self):
         self.epithelial_barrier_impermeability = \
             Simulation.params["epithelial_barrier"]["initial_impermeability"]
+        self.init_gut_brain_interface_thresholds()
+
+    def init_gut_brain_interface_thresholds(self):
         self.epithelial_barrier_permeability_threshold_start = \
             Simulation.params["epithelial_barrier"]["permeability_threshold_start"]
         self.epithelial_barrier_permeability_threshold_stop = \
@@ -160,16 +319,7 @@ class Model():
 
     # Function to create agents in the different ranks based on the total count
     def create_agents(self, agent_class, pp_count, state, env_name):
-        for j in range(pp_count):
-            pt = self.envs[env_name].grid.get_random_local_pt(self.rng)
-            if agent_class in [Neuron, Microglia, CleavedProtein, Oligomer, Protein, SCFA, Substrate, ExternalInput, Treatment]:
-                agent = agent_class(self.added_agents_id + j, self.rank, state, pt, env_name)
-            else:
-                # For agents without special state
-                agent = agent_class(self.added_agents_id + j, self.rank, pt, env_name)
-            self.envs[env_name].context.add(agent)
-            self.move(agent, pt, agent.context)
-        self.added_agents_id += pp_count
+        self.envs[env_name].spawn_many(agent_class, pp_count, state)
 
     # Function to get the total count of agents to create in that rank
     def calculate_partitioned_count(self, total_count):
@@ -181,16 +331,7 @@ class Model():
 
     # Function to remove an agent from the context and the grid
     def remove_agent(self, agent):
-        self.envs[agent.context].context.remove(agent)
-
-
-    # Function to add a cleaved protein agent to the gut context
-    def gut_add_cleaved_protein(self, cleaved_protein_name):
-        self.added_agents_id += 1
-        pt = self.envs[Gut.NAME].grid.get_random_local_pt(self.rng)
-        cleaved_protein = CleavedProtein(self.added_agents_id, self.rank, cleaved_protein_name, pt, 'gut')
-        self.envs[Gut.NAME].context.add(cleaved_protein)
-        self.move(cleaved_protein, cleaved_protein.pt, 'gut')
+        self.envs[agent.context].remove(agent)
 
 
     # Function to move the cleaved protein agents
@@ -200,24 +341,20 @@ class Model():
 
     def teleport_cleaved_protein_step(self):
         for env_name in [Gut.NAME, Brain.NAME]:
-            for agent in Simulation.model.envs[env_name].context.agents():
-                if type(agent) == CleavedProtein and not agent.alreadyAggregate:
-                    pt = Simulation.model.envs[env_name].grid.get_random_local_pt(Simulation.model.rng)
+            for agent in Simulation.model.envs[env_name].agents_of_class(CleavedProtein):
+                if not agent.alreadyAggregate:
+                    pt = Simulation.model.envs[env_name].grid.get_random_local_pt(Simulation.model.draws.placement)
                     Simulation.model.move(agent, pt, agent.context)
 
 
     # Function to add an oligomer protein agent to the brain or gut context
     def add_oligomer_protein(self, oligomer_name, env_name):
-        self.added_agents_id += 1
-        pt = self.envs[env_name].grid.get_random_local_pt(self.rng)
-        oligomer_protein = Oligomer(self.added_agents_id, self.rank, oligomer_name, pt, env_name)
-        self.envs[env_name].context.add(oligomer_protein)
-        self.move(oligomer_protein, oligomer_protein.pt, env_name)
+        self.envs[env_name].spawn_many(Oligomer, 1, oligomer_name)
 
 
     # Function to move an agent to a new location
     def move(self, agent, pt: dpt, env_name):
-        self.envs[env_name].grid.move(agent, pt)
+        self.envs[env_name].move(agent, pt)
         agent.pt = pt
 
     def new_id(self):
@@ -228,18 +365,78 @@ class Model():
         self.added_agents_id += 1
         return self.added_agents_id
 
-    # Function to close the data set and quit Pygame
+    def new_ids(self, count: int) -> range:
+        """
+        Generates a block of new unique ids for agents, the same ids of as many calls of new_id.
+        :param count: The number of ids
+        :return: The range of the new ids
+        """
+        ids = range(self.added_agents_id + 1, self.added_agents_id + count + 1)
+        self.added_agents_id += count
+        return ids
+
+    # Function to close the data set and write the pending frames
     def at_end(self):
         self.data_set.close()
-        pygame.quit()
+        if self.capture is not None:
+            self.capture.close()
+
+    def abort(self):
+        """
+        Stops the simulation before its scheduled end, closing the data set and terminating all the MPI processes.
+        """
+        print("Ending the simulation.")
+        self.at_end()
+        self.comm.Abort()
 
     # Function to start the simulation
     def start(self):
-        self.runner.execute()
+        try:
+            if self.screen is None:
+                self.runner.execute()
+            else:
+                self.execute_with_gui()
+        except KeyboardInterrupt:
+            self.abort()
+        if self.screen is not None or self.capture is not None:
+            import pygame
+            pygame.quit()
+
+    def execute_with_gui(self):
+        """
+        Runs the schedule in its own thread while the main thread draws the window of the GUI and handles its events,
+        the only thread SDL supports them in. An interrupt stops the simulation at the end of its tick, like the
+        closing of the window. The thread of the simulation makes all the MPI calls, one at a time.
+        """
+        if MPI.Query_thread() < MPI.THREAD_SERIALIZED:
+            raise RuntimeError("The GUI needs MPI_THREAD_SERIALIZED, as the simulation runs in its own thread")
+        errors = []
+
+        def execute():
+            try:
+                self.runner.execute()
+            except BaseException as error:
+                errors.append(error)
+
+        simulation = threading.Thread(target=execute, name='Simulation')
+        simulation.start()
+        while simulation.is_alive():
+            try:
+                self.screen.run(simulation)
+            except KeyboardInterrupt:
+                self.screen.request_quit()
+        if errors:
+            raise errors[0]
 
     # Static function to run the simulation
     @staticmethod
-    def run():
-        model = Model(MPI.COMM_WORLD)
+    def run(comm: MPI.Intracomm = MPI.COMM_WORLD):
+        """
+        Creates a model over the given communicator, registers it as the global model and runs it to the end.
+        :param comm: MPI communicator of the processes running the simulation
+        :return: The model after the end of the simulation
+        """
+        model = Model(comm)
         Simulation.set_model(model)
         model.start()
+        return model
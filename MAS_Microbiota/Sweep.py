@@ -0,0 +1,195 @@
+import argparse
+import copy
+import csv
+import itertools
+import multiprocessing
+import os
+from typing import Dict, List, Tuple
+
+import yaml
+from mpi4py import MPI
+from repast4py import parameters
+
+from MAS_Microbiota.Utils import Simulation
+
+
+class Sweep:
+    """
+    Runs many variants of a base parameter file in a pool of worker processes and collects the
+    log of every run in a single table.
+
+    The design of the sweep is a dictionary that can contain:
+    - 'factorial': a dictionary mapping parameter names to lists of values, every combination of which is run.
+    - 'variants': a list of dictionaries of parameter overrides, each of which is run as is.
+    When both are given, every variant is combined with every combination of the factorial design.
+    Parameter names can be dotted paths to nested parameters, like 'diet_substrates.intake.sugar'.
+    - 'burn_in': a tick up to which the base parameters are run once, after which every run continues from a forked
+      copy of the burnt-in model with its own parameters, instead of starting from the first tick.
+
+    Every worker process runs several variants one after the other, so that the imported modules and the
+    compiled numba code are reused across runs instead of being loaded again for each variant.
+    """
+
+    def __init__(self, base_params: Dict, design: Dict, output_dir: str = 'output/sweep', processes: int = None):
+        self.base_params = base_params
+        self.design = design
+        self.output_dir = output_dir
+        self.processes = processes or os.cpu_count()
+
+    @staticmethod
+    def load_from_args():
+        """
+        Creates a sweep from the command line arguments, namely the base parameters file, the sweep design file
+        and the optional output directory and number of worker processes.
+        :return: The sweep
+        """
+        parser = argparse.ArgumentParser()
+        parser.add_argument("parameters_file", help="base parameters file (yaml format)")
+        parser.add_argument("design_file", help="sweep design file (yaml format)")
+        parser.add_argument("--output", default='output/sweep', help="directory for the logs and the result table")
+        parser.add_argument("--processes", type=int, default=None,
+                            help="number of worker processes, defaults to the number of cores")
+        args = parser.parse_args()
+        base_params = parameters.init_params(args.parameters_file, '')
+        with open(args.design_file) as f_in:
+            design = yaml.load(f_in, Loader=yaml.SafeLoader)
+        return Sweep(base_params, design, args.output, args.processes)
+
+    def variants(self) -> List[Dict]:
+        """
+        Expands the design of the sweep into the list of parameter overrides of each run.
+        :return: A list with a dictionary of overrides for each run
+        """
+        factorial = self.design.get('factorial') or {}
+        names = list(factorial)
+        combinations = [dict(zip(names, values)) for values in itertools.product(*factorial.values())]
+        variants = self.design.get('variants') or [{}]
+        return [{**variant, **combination} for variant in variants for combination in combinations]
+
+    def run(self) -> str:
+        """
+        Runs every variant of the sweep and writes the result table, with one row per run and tick.
+        :return: The path of the result table
+        """
+        variants = self.variants()
+        tasks = [(index, self._variant_params(index, overrides)) for index, overrides in enumerate(variants)]
+        log_files = {}
+        os.makedirs(self.output_dir, exist_ok=True)
+
+        if self.design.get('burn_in'):
+            self._burn_in(tasks)
+            # Every run gets a new worker forked from this process, sharing the burnt-in model until it changes it
+            context = multiprocessing.get_context('fork')
+            pool = context.Pool(processes=min(self.processes, len(tasks)), maxtasksperchild=1)
+            run = _branch_variant
+        else:
+            context = multiprocessing.get_context('spawn')
+            pool = context.Pool(processes=min(self.processes, len(tasks)), initializer=_init_worker)
+            run = _run_variant
+        with pool:
+            for completed, (index, log_file) in enumerate(pool.imap_unordered(run, tasks), start=1):
+                log_files[index] = log_file
+                print(f"Sweep run {index} completed ({completed}/{len(tasks)}): {log_file}")
+
+        return self._write_results(variants, log_files)
+
+    def _variant_params(self, index: int, overrides: Dict) -> Dict:
+        """
+        Builds the full parameters of a run from the base parameters and the overrides of its variant.
+        Each run logs to its own file in the output directory, captures its frames, if any, in its own subdirectory,
+        and always runs headless.
+        """
+        params = copy.deepcopy(self.base_params)
+        for key, value in overrides.items():
+            Simulation.set_param(params, key, value)
+        params['log_file'] = os.path.join(self.output_dir, f'run_{index}.csv')
+        params['capture.dir'] = os.path.join(self.output_dir, f'frames_{index}')
+        params['headless'] = True
+        return params
+
+    def _burn_in(self, tasks: List[Tuple[int, Dict]]):
+        """
+        Runs the base parameters up to the burn-in tick in this process, keeping the model for the runs to fork from.
+        Only the parameters read after the burn-in, like the factors of the treatments and external inputs, the diet
+        and the counts of their agents, change the runs, while the ones used at initialization, like the seed and the
+        size of the world, keep their base values.
+        The model is paused rather than stopped, and scheduled to stop at the latest tick of the runs, so that a run
+        without overrides has the same results as a run from the first tick. Its frames are not captured, as the
+        writer thread of the capture would not survive the forks of the runs.
+        """
+        global _burnt_in
+        burn_in = self.design['burn_in']
+        for index, params in tasks:
+            if params['stop.at'] <= burn_in:
+                raise ValueError(f"Sweep run {index} stops at tick {params['stop.at']}, not after the burn-in")
+
+        from MAS_Microbiota.Model import Model
+        params = copy.deepcopy(self.base_params)
+        params['stop.at'] = max(run_params['stop.at'] for _, run_params in tasks)
+        params['log_file'] = os.path.join(self.output_dir, 'burn_in.csv')
+        params['capture.interval'] = 0
+        params['headless'] = True
+        Simulation.params = params
+        _burnt_in = Model(MPI.COMM_SELF)
+        _burnt_in.pause_at(burn_in)
+        _burnt_in.start()
+        print(f"Sweep burn-in completed at tick {burn_in}: {_burnt_in.data_set.fpath}")
+
+    def _write_results(self, variants: List[Dict], log_files: Dict[int, str]) -> str:
+        """
+        Merges the logs of all the runs in a single table indexed by run and tick, which also reports
+        the value of every varied parameter in each run.
+        """
+        varied = list(dict.fromkeys(key for variant in variants for key in variant))
+        results_path = os.path.join(self.output_dir, 'results.csv')
+        header = None
+        with open(results_path, 'w', newline='') as f_out:
+            writer = csv.writer(f_out)
+            for index in sorted(log_files):
+                with open(log_files[index], newline='') as f_in:
+                    reader = csv.reader(f_in)
+                    columns = next(reader)
+                    if header is None:
+                        header = ['run'] + varied + columns
+                        writer.writerow(header)
+                    values = [variants[index].get(key) for key in varied]
+                    for row in reader:
+                        writer.writerow([index] + values + row)
+        return results_path
+
+
+# Model run up to the burn-in of a warm-started sweep, inherited by the forked workers
+_burnt_in = None
+
+
+def _init_worker():
+    """
+    Imports the model in a worker process once, so that the following runs do not pay for it again.
+    """
+    import MAS_Microbiota.Model  # noqa: F401
+
+
+def _run_variant(task: Tuple[int, Dict]) -> Tuple[int, str]:
+    """
+    Runs a single variant of the sweep in the current worker process.
+    :param task: The index of the variant and its full parameters
+    :return: The index of the variant and the path of its log file
+    """
+    from MAS_Microbiota.Model import Model
+
+    index, params = task
+    Simulation.params = params
+    model = Model.run(MPI.COMM_SELF)
+    return index, str(model.data_set.fpath)
+
+
+def _branch_variant(task: Tuple[int, Dict]) -> Tuple[int, str]:
+    """
+    Continues the burnt-in model with the parameters of a single variant, in a worker process forked for it.
+    :param task: The index of the variant and its full parameters
+    :return: The index of the variant and the path of its log file
+    """
+    index, params = task
+    _burnt_in.branch(params)
+    _burnt_in.start()
+    return index, str(_burnt_in.data_set.fpath)
@@ -0,0 +1,67 @@
+from typing import Dict, Iterable, List
+
+from repast4py.core import Agent
+
+
+class AgentPools:
+    """
+    Free lists of retired agents of short-lived classes, like substrates and neurotransmitters, which are recycled
+    by initializing them again with the state and the uid of a new agent instead of allocating new objects.
+
+    Agents retired during a tick, as they are removed from the simulation, only become available when the pools are
+    released at the end of the tick, as the steps of the environments may still hold references to them.
+    For each pool, the number of allocated and reused agents and the highest number of agents waiting to be reused,
+    its high-water mark, are kept for reporting.
+    """
+
+    def __init__(self, classes: Iterable[type]):
+        """
+        :param classes: The agent classes to pool, each with its own free list
+        """
+        self.free: Dict[type, List[Agent]] = {cls: [] for cls in classes}
+        self.retired: Dict[type, List[Agent]] = {cls: [] for cls in self.free}
+        self.allocated: Dict[type, int] = {cls: 0 for cls in self.free}
+        self.reused: Dict[type, int] = {cls: 0 for cls in self.free}
+        self.high_water: Dict[type, int] = {cls: 0 for cls in self.free}
+
+    def create(self, cls: type, *args) -> Agent:
+        """
+        Returns a new agent of the given class, initialized with the given arguments of its constructor, reusing
+        a retired agent if the pool of the class has one.
+        """
+        free = self.free.get(cls)
+        if not free:
+            if free is not None:
+                self.allocated[cls] += 1
+            return cls(*args)
+        agent = free.pop()
+        agent.__init__(*args)
+        self.reused[cls] += 1
+        return agent
+
+    def retire(self, agent: Agent):
+        """
+        Gives back to its pool an agent removed from the simulation, which must not be referenced anymore after the
+        end of the tick. Agents of classes without a pool are left to the garbage collector.
+        """
+        retired = self.retired.get(type(agent))
+        if retired is not None:
+            retired.append(agent)
+
+    def release(self):
+        """
+        Makes the agents retired during the tick available for reuse.
+        """
+        for cls, retired in self.retired.items():
+            free = self.free[cls]
+            free.extend(retired)
+            retired.clear()
+            self.high_water[cls] = max(self.high_water[cls], len(free))
+
+    def report(self) -> Dict[str, Dict[str, int]]:
+        """
+        Returns, for the name of each pooled class, the number of allocated and reused agents and the high-water
+        mark of its pool.
+        """
+        return {cls.__name__: {'allocated': self.allocated[cls], 'reused': self.reused[cls],
+                               'high_water': self.high_water[cls]} for cls in self.free}
@@ -0,0 +1,99 @@
+from collections import defaultdict
+from operator import attrgetter
+from typing import Callable, Dict, Iterable, Optional
+
+from repast4py.core import Agent
+
+from .Simulation import Simulation
+
+
+class Counters:
+    """
+    Population counters of the model, kept up to date as agents are added to and removed from the contexts of the
+    environments, move to other ranks or change the attributes they are classified by, so that reading a count
+    does not need to walk the agents.
+
+    Each agent is counted under at most one name, given by a classification function of the agent and of the name
+    of the environment holding it, and remembers in its counted_as attribute the environment and the name it is
+    counted under. Only the enabled names are counted, so that the unused ones cost nothing.
+    """
+
+    def __init__(self, classify: Callable[[Agent, str], Optional[str]], enabled: Optional[Iterable[str]] = None):
+        """
+        :param classify: A function returning the name an agent is counted under in the given environment, or None
+        :param enabled: The names to count, or None to count all of them
+        """
+        self.classify = classify
+        self.enabled = None if enabled is None else set(enabled)
+        self.values: Dict[str, int] = defaultdict(int)
+
+    def _name(self, agent: Agent, env_name: str) -> Optional[str]:
+        name = self.classify(agent, env_name)
+        if self.enabled is not None and name not in self.enabled:
+            return None
+        return name
+
+    def add(self, agent: Agent, env_name: str):
+        """
+        Counts the given agent as held by the given environment.
+        An agent already counted in another environment, like one being transferred to the brain, is counted out
+        of it first.
+        """
+        if getattr(agent, 'counted_as', None) is not None:
+            self.remove(agent, agent.counted_as[0])
+        name = self._name(agent, env_name)
+        agent.counted_as = (env_name, name)
+        if name is not None:
+            self.values[name] += 1
+
+    def remove(self, agent: Agent, env_name: str):
+        """
+        Stops counting the given agent, if it is counted as held by the given environment.
+        """
+        counted_as = getattr(agent, 'counted_as', None)
+        if counted_as is None or counted_as[0] != env_name:
+            return
+        if counted_as[1] is not None:
+            self.values[counted_as[1]] -= 1
+        agent.counted_as = None
+
+    def update(self, agent: Agent):
+        """
+        Counts the given agent again after a change of the attributes it is classified by.
+        Agents not counted, like the ones still being created or the ghosts, are ignored.
+        """
+        counted_as = getattr(agent, 'counted_as', None)
+        if counted_as is None:
+            return
+        name = self._name(agent, counted_as[0])
+        if name != counted_as[1]:
+            if counted_as[1] is not None:
+                self.values[counted_as[1]] -= 1
+            if name is not None:
+                self.values[name] += 1
+            agent.counted_as = (counted_as[0], name)
+
+    def counts(self, name: str) -> bool:
+        """
+        Returns True if the given name is counted.
+        """
+        return self.enabled is None or name in self.enabled
+
+    def __getitem__(self, name: str) -> int:
+        return self.values.get(name, 0)
+
+
+def counted_attribute(name: str) -> property:
+    """
+    Returns a property for an attribute of an agent class that the agents are classified by in the population
+    counters, which updates the counters whenever the attribute is set. The value is kept in the attribute with
+    the same name prefixed by an underscore.
+    """
+    private_name = '_' + name
+
+    def set_value(agent, value):
+        setattr(agent, private_name, value)
+        Simulation.model.counters.update(agent)
+
+    return property(attrgetter(private_name), set_value)
+
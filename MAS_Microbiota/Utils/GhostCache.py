@@ -0,0 +1,61 @@
+from collections import OrderedDict
+from typing import Container, Dict, Hashable, Optional
+
+from repast4py.core import Agent
+
+
+class GhostCache:
+    """
+    Agents restored from the records of other ranks, kept by uid so that an agent seen again in a later
+    synchronization, like a ghost that stays in the buffer of a grid, is restored into the same object.
+
+    After each synchronization the agents that are no longer ghosts in any environment are evicted, as their owners
+    may have removed them, and the least recently restored agents are evicted beyond the capacity of the cache.
+    The number of hits, misses and evictions are kept for sizing the cache.
+    """
+
+    def __init__(self, capacity: int):
+        """
+        :param capacity: The highest number of agents kept in the cache
+        """
+        self.capacity = capacity
+        self.agents: Dict[Hashable, Agent] = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def get(self, uid: Hashable) -> Optional[Agent]:
+        """
+        Returns the agent with the given uid, or None if it is not in the cache.
+        """
+        agent = self.agents.get(uid)
+        if agent is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+            self.agents.move_to_end(uid)
+        return agent
+
+    def put(self, uid: Hashable, agent: Agent):
+        """
+        Adds the given agent to the cache, evicting the least recently restored agent if the cache is full.
+        """
+        self.agents[uid] = agent
+        if len(self.agents) > self.capacity:
+            self.agents.popitem(last=False)
+            self.evictions += 1
+
+    def retain(self, uids: Container[Hashable]):
+        """
+        Evicts the agents whose uid is not among the given ones, like the uids of the current ghosts.
+        """
+        evicted = [uid for uid in self.agents if uid not in uids]
+        for uid in evicted:
+            del self.agents[uid]
+        self.evictions += len(evicted)
+
+    def report(self) -> Dict[str, int]:
+        """
+        Returns the number of hits, misses and evictions and the number of agents in the cache.
+        """
+        return {'hits': self.hits, 'misses': self.misses, 'evictions': self.evictions, 'size': len(self.agents)}
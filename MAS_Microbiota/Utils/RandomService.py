@@ -0,0 +1,138 @@
+import zlib
+from typing import List, Sequence, Tuple
+
+import numpy as np
+
+
+class RandomStream:
+    """
+    Stream of random numbers for a single purpose, drawn from its own generator in blocks.
+    Every draw takes the next number of the current block, which is a Python list, and a new block is
+    generated only when the current one is exhausted. This avoids the overhead of a NumPy call for every
+    single random number needed by the agents.
+    """
+
+    def __init__(self, rng: np.random.Generator, block_size: int):
+        self._rng = rng
+        self._block_size = block_size
+        self._floats: List[float] = []
+        self._next_float = 0
+        self._ints: List[int] = []
+        self._next_int = 0
+
+    def get_state(self) -> Tuple[dict, np.ndarray, np.ndarray]:
+        """
+        Returns the state of the generator of the stream and the numbers of the current blocks not drawn yet.
+        """
+        return (self._rng.bit_generator.state, np.array(self._floats[self._next_float:], dtype=np.float64),
+                np.array(self._ints[self._next_int:], dtype=np.uint64))
+
+    def set_state(self, rng_state: dict, floats: np.ndarray, ints: np.ndarray):
+        """
+        Restores a state returned by get_state, so that the stream continues with the same draws.
+        """
+        self._rng.bit_generator.state = rng_state
+        self._floats, self._next_float = floats.tolist(), 0
+        self._ints, self._next_int = ints.tolist(), 0
+
+    def random(self) -> float:
+        """
+        Returns a uniform float in [0, 1).
+        """
+        if self._next_float == len(self._floats):
+            self._floats = self._rng.random(self._block_size).tolist()
+            self._next_float = 0
+        value = self._floats[self._next_float]
+        self._next_float += 1
+        return value
+
+    def _bits(self) -> int:
+        """
+        Returns a uniform 32-bit unsigned integer.
+        """
+        if self._next_int == len(self._ints):
+            self._ints = self._rng.integers(0, 1 << 32, self._block_size, dtype=np.uint64).tolist()
+            self._next_int = 0
+        value = self._ints[self._next_int]
+        self._next_int += 1
+        return value
+
+    def integers(self, low: int, high: int) -> int:
+        """
+        Returns a uniform integer in [low, high).
+        """
+        return low + self._bits() % (high - low)
+
+    def random_array(self, size: int) -> np.ndarray:
+        """
+        Returns an array of uniform floats in [0, 1), drawn at once from the generator of the stream.
+        """
+        return self._rng.random(size)
+
+    def integers_array(self, low: int, high: int, size: int) -> np.ndarray:
+        """
+        Returns an array of uniform integers in [low, high), drawn at once from the generator of the stream.
+        """
+        return self._rng.integers(low, high, size)
+
+    def binomial_array(self, n: np.ndarray, p: float) -> np.ndarray:
+        """
+        Returns an array of binomial draws with the given numbers of trials, drawn at once from the generator of the stream.
+        """
+        return self._rng.binomial(n, p)
+
+    def multinomial_array(self, n: np.ndarray, pvals: Sequence[float]) -> np.ndarray:
+        """
+        Returns an array with a multinomial draw for each of the given numbers of trials, drawn at once from the
+        generator of the stream.
+        """
+        return self._rng.multinomial(n, pvals)
+
+    def uniform(self, low: float, high: float) -> float:
+        """
+        Returns a uniform float in [low, high).
+        """
+        return low + (high - low) * self.random()
+
+    def choice(self, seq: Sequence):
+        """
+        Returns a uniformly chosen element of a non-empty sequence.
+        """
+        return seq[self._bits() % len(seq)]
+
+    def sample(self, seq: Sequence, k: int) -> list:
+        """
+        Returns k distinct elements of the sequence, chosen uniformly without replacement.
+        """
+        pool = list(seq)
+        for i in range(k):
+            j = i + self._bits() % (len(pool) - i)
+            pool[i], pool[j] = pool[j], pool[i]
+        return pool[:k]
+
+
+class RandomService:
+    """
+    Random number service of the model, handing out a separate stream of pre-drawn random numbers for each
+    purpose. The generator of each stream is seeded with the simulation seed, the rank and the name of the
+    purpose, so that the draws are reproducible and do not depend on the order in which the streams are used.
+
+    Accessible streams:
+    - movement: random walks and placement of agents on free neighbouring cells
+    - metabolism: fermentation, consumption and fission of bacteria
+    - inflammation: inflammation and state changes of the gut and brain agents
+    - inputs: external inputs, treatments and spawning of new agents
+
+    The service also owns the NumPy generator of the random points of the grids, placement, passed to their
+    get_random_local_pt. Like the streams, it is local to the rank, so that the ranks never draw a different
+    number of times from the generator of repast4py, which orders the events of each tick of the schedule in the
+    same way on all the ranks.
+    """
+
+    PURPOSES = ('movement', 'metabolism', 'inflammation', 'inputs')
+
+    def __init__(self, seed: int, rank: int = 0, block_size: int = 4096):
+        for purpose in self.PURPOSES:
+            rng = np.random.default_rng([seed, rank, zlib.crc32(purpose.encode())])
+            setattr(self, purpose, RandomStream(rng, block_size))
+        self.placement = np.random.default_rng([seed, rank, zlib.crc32(b'placement')])
@@ -16,9 +16,42 @@ class Simulation:
     @classmethod
     def load_from_args(cls):
         parser = parameters.create_args_parser()
+        parser.add_argument("--headless", action="store_true",
+                            help="run the simulation without the pygame GUI, overriding the parameters file")
+        parser.add_argument("--restart", metavar="CHECKPOINT",
+                            help="resume the simulation from a checkpoint directory, or from the latest checkpoint "
+                                 "in a directory of checkpoints, with the parameters of the checkpointed run")
         args = parser.parse_args()
-        cls.params = parameters.init_params(args.parameters_file, args.parameters)
+        if args.restart:
+            from MAS_Microbiota.Checkpoint import Checkpoint
+            cls.params = Checkpoint.find(args.restart).params(args.parameters)
+            cls.params['restart'] = args.restart
+        else:
+            cls.params = parameters.init_params(args.parameters_file, args.parameters)
+        if args.headless:
+            cls.params['headless'] = True
 
     @classmethod
     def set_model(cls, model):
-        cls.model = model
\ No newline at end of file
+        cls.model = model
+
+    @staticmethod
+    def set_param(params: dict, key: str, value):
+        """
+        Sets a parameter in the given dictionary of parameters. The key can be a top-level parameter name,
+        including the ones containing dots like 'world.width', or a dotted path to a nested parameter,
+        like 'diet_substrates.intake.sugar'.
+        :param params: The dictionary of parameters to update
+        :param key: The name or dotted path of the parameter
+        :param value: The new value of the parameter
+        """
+        if key in params or '.' not in key:
+            params[key] = value
+            return
+        parts = key.split('.')
+        for i in range(1, len(parts)):
+            prefix = '.'.join(parts[:i])
+            if isinstance(params.get(prefix), dict):
+                Simulation.set_param(params[prefix], '.'.join(parts[i:]), value)
+                return
+        raise KeyError(f"Unknown parameter: {key}")
\ No newline at end of file
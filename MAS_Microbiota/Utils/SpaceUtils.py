@@ -39,4 +39,56 @@ class GridNghFinder:
         xs = xs[yd]
         ys = ys[yd]
 
-        return np.stack((xs, ys, np.zeros(len(ys), dtype=np.int32)), axis=-1)
\ No newline at end of file
+        return np.stack((xs, ys, np.zeros(len(ys), dtype=np.int32)), axis=-1)
+
+class GridNghTable:
+    """
+    Table of the Moore neighbourhoods of the cells of a region of a grid, built once with the same semantics of the
+    GridNghFinder, so that finding the neighbours of a cell is a slice of a precomputed array instead of a call to
+    the compiled finder allocating new arrays.
+
+    The neighbours of all the cells are stored in a single read-only array of (x, y, 0) rows, in the order of the
+    GridNghFinder, and the neighbours of the cell with id c are the rows from offsets[c] to offsets[c + 1], where
+    the id of the cell (x, y) is (x - x0) * height + (y - y0). Both arrays can be passed to numba kernels, which
+    can compute the cell ids themselves.
+    Cells outside the region of the table fall back to the GridNghFinder.
+    """
+
+    MO = np.array([-1, 0, 1, -1, 0, 1, -1, 0, 1], dtype=np.int64)
+    NO = np.array([1, 1, 1, 0, 0, 0, -1, -1, -1], dtype=np.int64)
+
+    def __init__(self, xmin, ymin, xmax, ymax, region=None):
+        """
+        :param xmin, ymin, xmax, ymax: The inclusive bounds of the neighbours, as for the GridNghFinder
+        :param region: The inclusive bounds (x0, y0, x1, y1) of the cells of the table, by default the whole grid
+        """
+        self.finder = GridNghFinder(xmin, ymin, xmax, ymax)
+        self.x0, self.y0, self.x1, self.y1 = region if region is not None else (xmin, ymin, xmax, ymax)
+        self.height = self.y1 - self.y0 + 1
+
+        xs, ys = np.meshgrid(np.arange(self.x0, self.x1 + 1), np.arange(self.y0, self.y1 + 1), indexing='ij')
+        ngh_xs = xs.reshape(-1, 1) + self.MO
+        ngh_ys = ys.reshape(-1, 1) + self.NO
+        valid = (ngh_xs >= xmin) & (ngh_xs <= xmax) & (ngh_ys >= ymin) & (ngh_ys <= ymax)
+        self.offsets = np.concatenate(([0], np.cumsum(valid.sum(axis=1)))).astype(np.int64)
+        self.table = np.stack((ngh_xs[valid], ngh_ys[valid], np.zeros(valid.sum(), dtype=np.int64)), axis=-1)
+        self.table.flags.writeable = False
+        self.offsets.flags.writeable = False
+        self._offsets = self.offsets.tolist()  # Python integers are faster to slice with
+
+    def cell(self, x, y) -> int:
+        """
+        Returns the id of the given cell in the table, or -1 if it is outside the region of the table.
+        """
+        if self.x0 <= x <= self.x1 and self.y0 <= y <= self.y1:
+            return (x - self.x0) * self.height + (y - self.y0)
+        return -1
+
+    def find(self, x, y) -> np.ndarray:
+        """
+        Returns the coordinates of the neighbours of the given cell, including itself, as a read-only view.
+        """
+        if self.x0 <= x <= self.x1 and self.y0 <= y <= self.y1:
+            cell = (x - self.x0) * self.height + (y - self.y0)
+            return self.table[self._offsets[cell]:self._offsets[cell + 1]]
+        return self.finder.find(x, y)
@@ -1,2 +1,6 @@
 from .Simulation import Simulation
-from .SpaceUtils import GridNghFinder, is_equal
\ No newline at end of file
+from .SpaceUtils import GridNghFinder, GridNghTable, is_equal
+from .RandomService import RandomService, RandomStream
+from .Counters import Counters, counted_attribute
+from .AgentPools import AgentPools
+from .GhostCache import GhostCache
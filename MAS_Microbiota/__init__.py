@@ -1,5 +1,4 @@
 from MAS_Microbiota.Utils import *
 from .AgentRestorer import restore_agent
 from .Model import Model
-from .Log import Log
-from .GUI import GUI
\ No newline at end of file
+from .Log import Log
\ No newline at end of file
@@ -1,5 +1,9 @@
 from MAS_Microbiota import Simulation, Model
+from MAS_Microbiota.Ensemble import Ensemble
 
 if __name__ == "__main__":
     Simulation.load_from_args()
-    Model.run()
\ No newline at end of file
+    if Simulation.params.get('ensemble.replicates', 1) > 1:
+        Ensemble.run()
+    else:
+        Model.run()
@@ -0,0 +1,4 @@
+from MAS_Microbiota.Sweep import Sweep
+
+if __name__ == "__main__":
+    Sweep.load_from_args().run()
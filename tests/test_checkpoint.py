@@ -0,0 +1,35 @@
+import json
+import os
+import subprocess
+import sys
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+MODES = {
+    'default': {},
+    'engines': {'resource_store': True, 'bacteria_engine': True, 'batched_walks': True, 'neuron_engine': True},
+    'fields': {'concentration_fields': True},
+}
+
+
+def run_main(params: dict, *args: str):
+    """
+    Runs the simulation headless in its own process, from the root of the repository.
+    """
+    subprocess.run([sys.executable, 'main.py', 'setup.yaml', json.dumps(params), '--headless', *args],
+                   cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+
+
+@pytest.mark.parametrize('mode', MODES)
+def test_restart_matches_uninterrupted_run(tmp_path, mode):
+    checkpoints = tmp_path / 'checkpoints'
+    uninterrupted = tmp_path / 'uninterrupted.csv'
+    restarted = tmp_path / 'restarted.csv'
+    run_main({'stop.at': 20, 'log_file': str(uninterrupted), 'checkpoint.interval': 10,
+              'checkpoint.dir': str(checkpoints), **MODES[mode]})
+
+    run_main({'log_file': str(restarted)}, '--restart', str(checkpoints / 'tick_00000010'))
+
+    assert restarted.read_text() == uninterrupted.read_text()
@@ -0,0 +1,22 @@
+import numpy as np
+
+from MAS_Microbiota.Ensemble import RunningStatistics
+
+
+def test_running_statistics_match_numpy():
+    values = np.random.default_rng(0).integers(0, 1000, size=(7, 30, 4)).astype(np.float64)
+    statistics = RunningStatistics()
+    for array in values:
+        statistics.add(array)
+
+    assert statistics.n == len(values)
+    np.testing.assert_allclose(statistics.mean, np.mean(values, axis=0))
+    np.testing.assert_allclose(statistics.variance(), np.var(values, axis=0, ddof=1))
+
+
+def test_running_statistics_of_a_single_array():
+    statistics = RunningStatistics()
+    statistics.add(np.array([[1, 2], [3, 4]]))
+
+    np.testing.assert_array_equal(statistics.mean, [[1, 2], [3, 4]])
+    np.testing.assert_array_equal(statistics.variance(), np.zeros((2, 2)))
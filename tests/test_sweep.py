@@ -0,0 +1,25 @@
+import os
+import subprocess
+import sys
+
+import yaml
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_sweep(design: dict, output_dir):
+    """
+    Runs a sweep of the default parameters in its own process, from the root of the repository.
+    """
+    design_file = output_dir.parent / f'{output_dir.name}.yaml'
+    design_file.write_text(yaml.safe_dump(design))
+    subprocess.run([sys.executable, 'sweep.py', 'setup.yaml', str(design_file), '--output', str(output_dir),
+                    '--processes', '1'], cwd=ROOT, check=True, stdout=subprocess.DEVNULL)
+
+
+def test_burnt_in_run_matches_cold_run(tmp_path):
+    variants = [{'stop.at': 10}]
+    run_sweep({'variants': variants}, tmp_path / 'cold')
+    run_sweep({'variants': variants, 'burn_in': 5}, tmp_path / 'burnt_in')
+
+    assert (tmp_path / 'burnt_in' / 'run_0.csv').read_text() == (tmp_path / 'cold' / 'run_0.csv').read_text()